@@ -3,19 +3,16 @@
 # Copyright 2019 Jian Wu
 # License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
 
-import warnings
 import torch as th
 import torch.nn as nn
 import torch.nn.functional as tf
 
-from torch.nn.utils.rnn import pad_sequence
-
 import aps.asr.beam_search.att as att_api
 import aps.asr.beam_search.xfmr as xfmr_api
 
 from typing import Optional, Dict, Tuple, List
 from aps.asr.base.decoder import PyTorchRNNDecoder
-from aps.asr.base.encoder import encoder_instance
+from aps.asr.base.encoder import encoder_instance, batch_encode
 from aps.asr.xfmr.encoder import TransformerEncoder
 from aps.asr.xfmr.decoder import TorchTransformerDecoder
 from aps.asr.xfmr.impl import TransformerEncoderLayers
@@ -67,27 +64,12 @@ class EncDecASRBase(nn.Module):
         """
         Prepare data for batch decoding
         """
-        # raw wave
-        if len(batch) == 1:
-            warnings.warn("Got one utterance, use beam_search (...) instead")
-        # NOTE: If we do zero padding on the input features/signals and form them as a batch,
-        #       the output may slightly differ with the non-padding version. Thus we use for loop here
-        outs = []
-        for inp in batch:
-            if self.asr_transform:
-                inp, _ = self.asr_transform(inp[None, ...], None)
-            else:
-                inp = inp[None, ...]
-            # N x Ti x D
-            enc_out, _ = self.encoder(inp, None)
-            outs.append(enc_out[0])
-
-        lens = [out.shape[0] for out in outs]
-        # T x N x D
-        enc_out = pad_sequence(outs, batch_first=False)
-        enc_len = th.tensor(lens, device=enc_out.device)
+        # N x T x D
+        enc_out, enc_len = batch_encode(self.encoder,
+                                        batch,
+                                        asr_transform=self.asr_transform)
         # enc_out: N x T x D or T x N x D
-        return enc_out.transpose(0, 1) if batch_first else enc_out, enc_len
+        return enc_out if batch_first else enc_out.transpose(0, 1), enc_len
 
     def _decoding_prep(self,
                        x: th.Tensor,
@@ -3,10 +3,12 @@
 # Copyright 2019 Jian Wu
 # License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
 
+import warnings
 import torch as th
 import torch.nn as nn
 import torch.nn.functional as tf
 
+from torch.nn.utils.rnn import pad_sequence
 from typing import Optional, Tuple, Union, List, Dict
 
 from aps.asr.base.layer import VariantRNN, FSMN, Conv1d, Conv2d, PyTorchRNN
@@ -18,6 +20,53 @@ BaseEncoder = Register("base_encoder")
 EncRetType = Tuple[th.Tensor, Optional[th.Tensor]]
 
 
+def zero_padding_frames(inp: th.Tensor,
+                        inp_len: Optional[th.Tensor]) -> th.Tensor:
+    """
+    Zero the padding frames of the batch
+    Args:
+        inp (Tensor): N x T x F
+        inp_len (Tensor or None): N
+    """
+    if inp_len is None:
+        return inp
+    # N x T
+    mask = th.arange(inp.shape[1], device=inp.device) >= inp_len[:, None]
+    return inp.masked_fill(mask[..., None], 0)
+
+
+def batch_encode(encoder: nn.Module,
+                 batch: List[th.Tensor],
+                 asr_transform: Optional[nn.Module] = None) -> EncRetType:
+    """
+    Pad the utterances and go through feature extractor & encoder in one pass
+    (used for batch decoding)
+    Args:
+        encoder (Module): encoder network
+        batch (list[Tensor]): raw waveform (S or C x S) or feature (Ti x F)
+        asr_transform (Module or None): feature extractor
+    Return:
+        enc_out (Tensor): N x T x D
+        enc_len (Tensor): N
+    """
+    if len(batch) == 1:
+        warnings.warn("Got one utterance, use beam_search (...) instead")
+    raw = asr_transform and asr_transform.spectra_index != -1
+    # make time axis first
+    inps = [inp.transpose(0, -1) if raw else inp for inp in batch]
+    inp_len = th.tensor([inp.shape[0] for inp in inps],
+                        device=batch[0].device)
+    # N x S x (C) or N x Ti x F
+    inp_pad = pad_sequence(inps, batch_first=True)
+    if raw:
+        inp_pad = inp_pad.transpose(1, -1)
+    # the padding frames are excluded by the cmvn and encoders using the lengths
+    if asr_transform:
+        inp_pad, inp_len = asr_transform(inp_pad, inp_len)
+    # N x T x D
+    return encoder(inp_pad, inp_len)
+
+
 def encoder_instance(enc_type: str, inp_features: int, out_features: int,
                      enc_kwargs: Dict) -> nn.Module:
     """
@@ -353,6 +402,8 @@ class Conv1dEncoder(EncoderBase):
             out_len (Tensor or None)
         """
         for enc_layer in self.enc_layers:
+            # zero the padding frames, same as the zero padding of conv1d
+            inp = zero_padding_frames(inp, inp_len)
             inp = enc_layer(inp)
             if inp_len is not None:
                 inp_len = enc_layer.compute_outp_dim(inp_len)
@@ -475,6 +526,8 @@ class FSMNEncoder(EncoderBase):
         """
         memory = None
         for fsmn in self.enc_layers:
+            # zero the padding frames, same as the zero padding of ctx_conv
+            inp = zero_padding_frames(inp, inp_len)
             if self.residual:
                 inp, memory = fsmn(inp, memory=memory)
             else:
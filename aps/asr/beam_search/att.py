@@ -10,7 +10,7 @@ import torch.nn as nn
 import torch.nn.functional as tf
 
 from typing import Optional, List, Dict
-from aps.asr.beam_search.utils import BeamSearchParam, BeamTracker, BatchBeamTracker
+from aps.asr.beam_search.utils import BeamSearchParam, BeamTracker, VectorizedBeamTracker
 from aps.asr.beam_search.lm import lm_score_impl, adjust_hidden, LmType
 from aps.utils import get_logger
 
@@ -155,7 +155,11 @@ def beam_search(decoder: nn.Module,
         am_prob = tf.log_softmax(dec_out / temperature, dim=-1)
         if lm and beam_param.lm_weight > 0:
             # beam x V
-            lm_prob, lm_state = lm_score_impl(lm, point, pre_tok, lm_state)
+            lm_prob, lm_state = lm_score_impl(lm,
+                                              point,
+                                              pre_tok,
+                                              lm_state,
+                                              am_prob=am_prob)
         else:
             lm_prob = 0
         # one beam search step
@@ -232,7 +236,7 @@ def beam_search_batch(decoder: nn.Module,
                                  cov_penalty=cov_penalty,
                                  cov_threshold=cov_threshold,
                                  eos_threshold=eos_threshold)
-    beam_tracker = BatchBeamTracker(N, beam_param)
+    beam_tracker = VectorizedBeamTracker(N, beam_param)
 
     # clear states
     att_net.clear()
@@ -257,7 +261,11 @@ def beam_search_batch(decoder: nn.Module,
 
         if lm and beam_param.lm_weight > 0:
             # beam x V
-            lm_prob, lm_state = lm_score_impl(lm, point, pre_tok, lm_state)
+            lm_prob, lm_state = lm_score_impl(lm,
+                                              point,
+                                              pre_tok,
+                                              lm_state,
+                                              am_prob=am_prob)
         else:
             lm_prob = 0
 
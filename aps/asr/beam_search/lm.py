@@ -7,42 +7,48 @@ import torch as th
 import torch.nn as nn
 import torch.nn.functional as tf
 
-from typing import Union, Tuple
+from typing import Union, Tuple, List, Optional
 from aps.asr.lm.ngram import NgramLM
 
-HiddenType = Union[th.Tensor, Tuple[th.Tensor, th.Tensor]]
+HiddenType = Union[th.Tensor, Tuple[th.Tensor, th.Tensor],
+                   List[Tuple[th.Tensor, th.Tensor]]]
 LmType = Union[nn.Module, NgramLM]
 
 
 def adjust_hidden(back_point: th.Tensor, state: HiddenType) -> HiddenType:
     """
-    Adjust RNN hidden states
+    Adjust RNN hidden states (or per-layer key & value cache of the transformer)
     Args:
         back_point (Tensor): N
-        state (None or Tensor, [Tensor, Tensor])
+        state (None or Tensor, [Tensor, Tensor] or list of them)
     Return:
-        state (None or Tensor, [Tensor, Tensor])
+        state (None or Tensor, [Tensor, Tensor] or list of them)
     """
     if state is not None:
-        if isinstance(state, tuple):
-            # shape: num_layers * num_directions, batch, hidden_size
-            h, c = state
-            state = (h[:, back_point], c[:, back_point])
+        if isinstance(state, list):
+            state = [adjust_hidden(back_point, s) for s in state]
+        elif isinstance(state, tuple):
+            # (h, c): num_layers * num_directions, batch, hidden_size
+            state = tuple(adjust_hidden(back_point, s) for s in state)
         else:
             state = state[:, back_point]
     return state
 
 
-def ngram_score(lm: NgramLM, back_point: th.Tensor, prev_token: th.Tensor,
-                state):
+def ngram_score(lm: NgramLM,
+                back_point: th.Tensor,
+                prev_token: th.Tensor,
+                state,
+                am_prob: Optional[th.Tensor] = None):
     """
     Get ngram LM score
     Args:
         back_point (Tensor): N
-        state (list[list(State)]): ngram LM states
+        state (list(State)): ngram LM states
+        am_prob (Tensor): N x V, used for top-k pruning of the ngram LM
     Return:
         score (Tensor): beam x V
-        state (list[list(State)]): new LM state
+        state (list(State)): new LM state
     """
     if state is None:
         prev_state = None
@@ -50,7 +56,7 @@ def ngram_score(lm: NgramLM, back_point: th.Tensor, prev_token: th.Tensor,
         # adjust states
         ptr = back_point.tolist()
         prev_state = [state[p] for p in ptr]
-    return lm(prev_token, prev_state)
+    return lm(prev_token, prev_state, am_prob=am_prob)
 
 
 def rnnlm_score(rnnlm: nn.Module, back_point: th.Tensor, prev_token: th.Tensor,
@@ -75,14 +81,17 @@ def rnnlm_score(rnnlm: nn.Module, back_point: th.Tensor, prev_token: th.Tensor,
     return (score, state)
 
 
-def lm_score_impl(lm: LmType, back_point: th.Tensor, prev_token: th.Tensor,
-                  state):
+def lm_score_impl(lm: LmType,
+                  back_point: th.Tensor,
+                  prev_token: th.Tensor,
+                  state,
+                  am_prob: Optional[th.Tensor] = None):
     """
     Get ngram/rnnlm score (wraps {rnnlm|ngram}_score functions)
     """
     if isinstance(lm, nn.Module):
         return rnnlm_score(lm, back_point, prev_token, state)
     elif isinstance(lm, NgramLM):
-        return ngram_score(lm, back_point, prev_token, state)
+        return ngram_score(lm, back_point, prev_token, state, am_prob=am_prob)
     else:
         raise TypeError(f"Unsupported LM type: {type(lm)}")
@@ -10,7 +10,15 @@ import torch.nn as nn
 import torch.nn.functional as tf
 
 from queue import PriorityQueue
-from typing import Union, List, Dict, Optional
+from typing import Union, List, Dict, Optional, Iterable, Iterator
+from aps.asr.beam_search.lm import adjust_hidden
+from aps.const import NEG_INF
+
+# decoding options of the attention based AM, ignored by beam_search_batch
+unused_decoding_opts = [
+    "max_len", "min_len", "max_len_ratio", "min_len_ratio", "temperature",
+    "len_penalty", "cov_penalty", "eos_threshold", "cov_threshold"
+]
 
 
 class Node(object):
@@ -51,39 +59,57 @@ def _prep_nbest(container: Union[List, PriorityQueue],
     return nbest_hypos[:nbest]
 
 
-def greedy_search(decoder: nn.Module,
-                  enc_out: th.Tensor,
-                  blank: int = 0) -> List[Dict]:
+def greedy_search_stream(decoder: nn.Module,
+                         enc_chunks: Iterable[th.Tensor],
+                         blank: int = 0) -> Iterator[Dict]:
     """
-    Greedy search algorithm for RNN-T
+    Incremental greedy search algorithm for RNN-T, which yields the partial
+    hypothesis after each chunk of the encoder output
     Args:
-        enc_out: N x Ti x D
+        enc_chunks: iterable of the encoder output chunks, N x Tc x D
     """
     if blank < 0:
         raise RuntimeError(f"Invalid blank ID: {blank:d}")
-    N, T, _ = enc_out.shape
-    if N != 1:
-        raise RuntimeError(
-            f"Got batch size {N:d}, now only support one utterance")
     if not hasattr(decoder, "step"):
         raise RuntimeError("Function step should defined in decoder network")
     if not hasattr(decoder, "pred"):
         raise RuntimeError("Function pred should defined in decoder network")
 
-    blk = th.tensor([[blank]], dtype=th.int64, device=enc_out.device)
-    dec_out, hidden = decoder.step(blk)
+    dec_out, hidden = None, None
     score = 0
     trans = []
-    for t in range(T):
-        # 1 x V
-        prob = tf.log_softmax(decoder.pred(enc_out[:, t], dec_out)[0], dim=-1)
-        best_prob, best_pred = th.max(prob, dim=-1)
-        score += best_prob.item()
-        # not blank
-        if best_pred.item() != blank:
-            dec_out, hidden = decoder.step(best_pred[None, ...], hidden=hidden)
-            trans += [best_pred.item()]
-    return [{"score": score, "trans": [blank] + trans + [blank]}]
+    for enc_out in enc_chunks:
+        N, T, _ = enc_out.shape
+        if N != 1:
+            raise RuntimeError(
+                f"Got batch size {N:d}, now only support one utterance")
+        if dec_out is None:
+            blk = th.tensor([[blank]], dtype=th.int64, device=enc_out.device)
+            dec_out, hidden = decoder.step(blk)
+        for t in range(T):
+            # 1 x V
+            prob = tf.log_softmax(decoder.pred(enc_out[:, t], dec_out)[0],
+                                  dim=-1)
+            best_prob, best_pred = th.max(prob, dim=-1)
+            score += best_prob.item()
+            # not blank
+            if best_pred.item() != blank:
+                dec_out, hidden = decoder.step(best_pred[None, ...],
+                                               hidden=hidden)
+                trans += [best_pred.item()]
+        yield {"score": score, "trans": [blank] + trans + [blank]}
+
+
+def greedy_search(decoder: nn.Module,
+                  enc_out: th.Tensor,
+                  blank: int = 0) -> List[Dict]:
+    """
+    Greedy search algorithm for RNN-T
+    Args:
+        enc_out: N x Ti x D
+    """
+    hypos = list(greedy_search_stream(decoder, [enc_out], blank=blank))
+    return hypos[-1:]
 
 
 def beam_search(decoder: nn.Module,
@@ -196,3 +222,133 @@ def beam_search(decoder: nn.Module,
             list_b = [n for n in list_b if n.score > best_score]
 
     return _prep_nbest(list_b, nbest, len_norm=len_norm, blank=blank)
+
+
+def _merge_hypos(score: th.Tensor, seq: th.Tensor,
+                 num_tok: th.Tensor) -> th.Tensor:
+    """
+    Merge the hypotheses with same token sequences (different alignments)
+    Args:
+        score (Tensor): N x beam
+        seq (Tensor): N x beam x U, token sequences (zero padded)
+        num_tok (Tensor): N x beam, length of the token sequences
+    Return:
+        score (Tensor): N x beam, NEG_INF for the merged ones
+    """
+    beam = score.shape[-1]
+    # N x beam x beam
+    same = num_tok[..., None] == num_tok[:, None]
+    if seq.shape[-1]:
+        same &= (seq[:, :, None] == seq[:, None]).all(-1)
+    # log-sum of the scores in the same group
+    merged = th.logsumexp(score[:, None].masked_fill(~same, NEG_INF), -1)
+    # keep the first one (with the highest score) of each group
+    lower = th.ones(beam, beam, dtype=th.bool, device=score.device).tril(-1)
+    duplicate = (same & lower).any(-1)
+    return merged.masked_fill(duplicate, NEG_INF)
+
+
+def beam_search_batch(decoder: nn.Module,
+                      enc_out: th.Tensor,
+                      enc_len: Optional[th.Tensor] = None,
+                      beam: int = 16,
+                      blank: int = 0,
+                      nbest: int = 8,
+                      len_norm: bool = True,
+                      **kwargs) -> List[List[Dict]]:
+    """
+    Batch version of the (modified) beam search algorithm for RNN-T. At most
+    one non-blank token is emitted per frame, thus all the hypotheses of all
+    the utterances are stepped through the decoder network together (one call
+    of decoder.batch_step and decoder.pred per frame). Hypotheses with the
+    same token sequence are merged.
+    Args:
+        enc_out: N x Ti x D
+        enc_len: N or None
+        blank: #vocab_size - 1
+        kwargs: the decoding options of the attention based AM (see
+                cmd/decode_batch.py), which are not used here
+    """
+    unknown = [k for k in kwargs if k not in unused_decoding_opts]
+    if unknown:
+        raise TypeError(f"Got unexpected decoding options: {unknown}")
+    if blank < 0:
+        raise RuntimeError(f"Invalid blank ID: {blank:d}")
+    if not hasattr(decoder, "batch_step"):
+        raise RuntimeError(
+            "Function batch_step should defined in decoder network")
+    if not hasattr(decoder, "pred"):
+        raise RuntimeError("Function pred should defined in decoder network")
+    if beam > decoder.vocab_size:
+        raise RuntimeError(f"Beam size({beam}) > vocabulary size")
+
+    nbest = min(beam, nbest)
+
+    N, T, _ = enc_out.shape
+    device = enc_out.device
+    if enc_len is None:
+        enc_len = th.full((N,), T, dtype=th.int64, device=device)
+    # N x beam, only one valid hypothesis at the beginning
+    score = th.full((N, beam), NEG_INF, device=device)
+    score[:, 0] = 0
+    # N*beam
+    offset = th.arange(N, device=device).repeat_interleave(beam) * beam
+    # N*beam x U, emitted tokens of each hypothesis (zero padded)
+    seq = th.zeros(N * beam, 0, dtype=th.int64, device=device)
+    num_tok = th.zeros(N * beam, dtype=th.int64, device=device)
+    blk = th.full((N * beam,), blank, dtype=th.int64, device=device)
+    # N*beam x D
+    dec_out, hidden = decoder.batch_step(blk)
+    for t in range(T):
+        # N*beam x V
+        prob = tf.log_softmax(decoder.pred(
+            enc_out[:, t].repeat_interleave(beam, 0), dec_out)[:, 0],
+                              dim=-1)
+        # for finished utterances, keep the hypotheses unchanged
+        done = (t >= enc_len).repeat_interleave(beam)
+        if done.any():
+            prob[done] = NEG_INF
+            prob[done, blank] = 0
+        V = prob.shape[-1]
+        # N x beam*V
+        acc_score = (score.view(-1, 1) + prob).view(N, -1)
+        score, index = th.topk(acc_score, beam, dim=-1)
+        score = th.clamp_min(score, NEG_INF)
+        # N*beam
+        point = (index // V).view(-1) + offset
+        token = (index % V).view(-1)
+        emit = token != blank
+        dec_out = dec_out[point]
+        hidden = adjust_hidden(point, hidden)
+        seq, num_tok = seq[point], num_tok[point]
+        if emit.any():
+            dec_out, hidden = decoder.batch_step(token,
+                                                 emit=emit,
+                                                 dec_prev=dec_out,
+                                                 hidden=hidden)
+            # at most one token per frame, so one more column is enough
+            seq = tf.pad(seq, (0, 1))
+            seq[emit, num_tok[emit]] = token[emit]
+            num_tok = num_tok + emit
+        score = _merge_hypos(score, seq.view(N, beam, -1),
+                             num_tok.view(N, beam))
+
+    # see _prep_nbest
+    norm = (num_tok + 1).view(N, beam) if len_norm else 1
+    order = th.argsort(score / norm, dim=-1, descending=True).tolist()
+    score = score.tolist()
+    seq = seq.tolist()
+    num_tok = num_tok.tolist()
+    nbest_hypos = []
+    for n in range(N):
+        hypos = []
+        for b in order[n]:
+            if len(hypos) == nbest or score[n][b] <= NEG_INF:
+                break
+            idx = n * beam + b
+            hypos.append({
+                "score": score[n][b],
+                "trans": [blank] + seq[idx][:num_tok[idx]] + [blank]
+            })
+        nbest_hypos.append(hypos)
+    return nbest_hypos
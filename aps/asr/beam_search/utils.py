@@ -46,7 +46,6 @@ class BaseBeamTracker(object):
         self.param = param
         self.align = None  # B x T x U
         self.trans = None  # B x U
-        self.none_eos_idx = None
         self.step_num = 0
 
     def end_detect(self,
@@ -125,17 +124,12 @@ class BaseBeamTracker(object):
         fusion_prob = am_prob + self.param.lm_weight * lm_prob
         # process eos
         if self.param.eos_threshold > 0:
-            if self.none_eos_idx is None:
-                none_eos_idx = [
-                    i for i in range(fusion_prob.shape[-1])
-                    if i != self.param.eos
-                ]
-                self.none_eos_idx = th.tensor(none_eos_idx,
-                                              device=am_prob.device)
             # current eos score
             eos_prob = fusion_prob[:, self.param.eos]
-            # none_eos best score
-            none_eos_best, _ = th.max(fusion_prob[:, self.none_eos_idx], dim=-1)
+            # none_eos best score (the second one if eos is the best)
+            top2_score, top2_token = th.topk(fusion_prob, 2, dim=-1)
+            none_eos_best = th.where(top2_token[:, 0] == self.param.eos,
+                                     top2_score[:, 1], top2_score[:, 0])
             # set inf to disable the eos
             disable_eos = eos_prob < none_eos_best * self.param.eos_threshold
             fusion_prob[disable_eos, self.param.eos] = NEG_INF
@@ -621,3 +615,322 @@ class BatchBeamTracker(BaseBeamTracker):
                                 reverse=True)
             nbest_batch.append(sort_hypos[:nbest])
         return nbest_batch
+
+
+class VectorizedBeamTracker(BaseBeamTracker):
+    """
+    Fully tensorized version of the BatchBeamTracker. The eos processing, end
+    detection and length/coverage penalties are done on the flat (batch x beam)
+    tensors and the ended hypothesis are kept in the preallocated buffers, so
+    there is no per-utterance loop during the search. The hypothesis are
+    traced back and converted to python objects only once (in nbest_hypos)
+    """
+
+    def __init__(self, batch_size: int, param: BeamSearchParam) -> None:
+        super(VectorizedBeamTracker, self).__init__(param)
+        N, beam = batch_size, param.beam_size
+        min_len = param.min_len if isinstance(param.min_len,
+                                              list) else [param.min_len] * N
+        max_len = param.max_len if isinstance(param.max_len,
+                                              list) else [param.max_len] * N
+        # maximum number of the search steps
+        self.max_steps = max(max_len)
+        if self.max_steps <= 0:
+            raise RuntimeError(f"Invalid max_len: {max_len}")
+        self.batch_size = batch_size
+        self.min_len = th.tensor(min_len, device=param.device)
+        self.max_len = th.tensor(max_len, device=param.device)
+        # (U + 1) x N*beam, decoded token & traceback point at each step
+        self.token = th.full((self.max_steps + 1, N * beam),
+                             param.eos,
+                             dtype=th.int64,
+                             device=param.device)
+        self.token[0] = param.sos
+        self.point = th.arange(N * beam, device=param.device).repeat(
+            self.max_steps + 1, 1)
+        # N x 1, offset of each utterance in the flat index
+        self.step_point = th.arange(0, N * beam, beam,
+                                    device=param.device)[:, None]
+        # N x beam
+        self.score = th.zeros(N, beam, device=param.device)
+        self.acmu_score = th.zeros_like(self.score)
+        # ended hypothesis: score, step, flat index and length of each one
+        # (the last one is a placeholder used for the unended beams)
+        self.max_hypos = beam * (self.max_steps + 1)
+        self.hypo_score = th.zeros(N, self.max_hypos + 1, device=param.device)
+        self.hypo_step = th.zeros(N,
+                                  self.max_hypos + 1,
+                                  dtype=th.int64,
+                                  device=param.device)
+        self.hypo_point = th.zeros_like(self.hypo_step)
+        self.hypo_len = th.zeros_like(self.hypo_step)
+        self.num_hypos = th.zeros(N, dtype=th.int64, device=param.device)
+        # N x U + 1, best score of the hypothesis ended at each step
+        self.ended_best = th.full((N, self.max_steps + 1),
+                                  NEG_INF,
+                                  device=param.device)
+        self.ended_mask = th.zeros(N,
+                                   self.max_steps + 1,
+                                   dtype=th.bool,
+                                   device=param.device)
+        # N, auto stop flags
+        self.auto_stop = th.zeros(N, dtype=th.bool, device=param.device)
+        # N*beam x T, accumulated alignment weight
+        self.align_sum = None
+
+    def __getitem__(self, t: int) -> Tuple[th.Tensor, th.Tensor]:
+        """
+        Return the token and backward point
+        """
+        t = self.step_num + 1 + t if t < 0 else t
+        return (self.token[t], self.point[t])
+
+    def coverage(self, att_ali: Optional[th.Tensor]) -> Union[th.Tensor, float]:
+        """
+        Compute coverage score (using the accumulated alignment weight)
+        Args:
+            att_ali (Tensor): N x T, alignment score (weight)
+        Return
+            cov_score: coverage score
+        """
+        if att_ali is None or self.param.cov_penalty <= 0:
+            return 0
+        if self.param.cov_method == "v2":
+            cov = th.clamp_max(self.align_sum, self.param.cov_threshold).log()
+        else:
+            cov = (self.align_sum > self.param.cov_threshold).float()
+        return th.sum(cov, -1, keepdim=True) * self.param.cov_penalty
+
+    def _append_align(self, att_ali: Optional[th.Tensor]) -> NoReturn:
+        """
+        Append alignment weight of current step
+        Args:
+            att_ali (Tensor): N x T, alignment score (weight)
+        """
+        if att_ali is None:
+            return
+        if self.align is None:
+            self.align = att_ali.new_zeros(att_ali.shape + (self.max_steps,))
+            self.align_sum = th.zeros_like(att_ali)
+        self.align[..., self.step_num] = att_ali
+        self.align_sum += att_ali
+
+    def _init_search(self,
+                     am_prob: th.Tensor,
+                     lm_prob: Union[th.Tensor, float],
+                     att_ali: Optional[th.Tensor] = None) -> NoReturn:
+        """
+        Kick off the beam search (to be used at the first step)
+        Args:
+            am_prob (Tensor): N x V, acoustic prob
+            lm_prob (Tensor): N x V, language prob
+            att_ali (Tensor): N x T, alignment score (weight)
+        """
+        assert self.step_num == 0
+        # local pruning: N*beam x V => N*beam x beam
+        topk_score, topk_token = self.beam_select(am_prob, lm_prob)
+        # N x beam
+        self.score += topk_score[::self.param.beam_size]
+        self.acmu_score += topk_score[::self.param.beam_size]
+        self.token[1] = topk_token[::self.param.beam_size].reshape(-1)
+        self._append_align(att_ali)
+
+    def _step_search(self,
+                     am_prob: th.Tensor,
+                     lm_prob: Union[th.Tensor, float],
+                     att_ali: Optional[th.Tensor] = None) -> NoReturn:
+        """
+        Prune and update score & token & backward point
+        Args:
+            am_prob (Tensor): N x V, acoustic prob
+            lm_prob (Tensor): N x V, language prob
+            att_ali (Tensor): N x T, alignment score (weight)
+        """
+        # local pruning: N*beam x V => N*beam x beam
+        topk_score, topk_token = self.beam_select(am_prob, lm_prob)
+        # N*beam x beam = N*beam x 1 + N*beam x beam
+        acmu_score = self.acmu_score.view(-1, 1) + topk_score
+        score = acmu_score + self.coverage(att_ali)
+        # N x beam*beam => N x beam
+        self.score, topk_index = th.topk(score.view(self.batch_size, -1),
+                                         self.param.beam_size,
+                                         dim=-1)
+        # update accmulated score (AM + LM)
+        self.acmu_score = th.gather(acmu_score.view(self.batch_size, -1), -1,
+                                    topk_index)
+        # N x beam, point to father's node (flat index)
+        point = topk_index // self.param.beam_size + self.step_point
+        # N x beam*beam => N x beam
+        token = th.gather(topk_token.view(self.batch_size, -1), -1, topk_index)
+        self.token[self.step_num + 1] = token.view(-1)
+        self.point[self.step_num + 1] = point.view(-1)
+        self._append_align(None if att_ali is None else att_ali[point.view(-1)])
+
+    def _collect_hypos(self,
+                       ended: th.Tensor,
+                       final: bool = False) -> th.Tensor:
+        """
+        Put the ended hypothesis of current step to the buffers
+        Args:
+            ended (Tensor): N x beam, ended flags
+            final (bool): is final step or not
+        Return:
+            score (Tensor): N x beam, final score of the hypothesis
+        """
+        seq_len = self.step_num + 1 if final else self.step_num
+        score = self.score + seq_len * self.param.len_penalty
+        if self.param.len_norm:
+            score = score / seq_len
+        # N x beam, position in the buffers (use placeholder if not ended)
+        index = self.num_hypos[:, None] + th.cumsum(ended.long(), -1) - 1
+        index = th.where(ended, index, th.full_like(index, self.max_hypos))
+        self.hypo_score.scatter_(-1, index, score)
+        self.hypo_step.scatter_(-1, index, th.full_like(index, self.step_num))
+        self.hypo_point.scatter_(
+            -1, index,
+            th.arange(self.param.beam_size, device=index.device) +
+            self.step_point)
+        self.hypo_len.scatter_(-1, index, th.full_like(index, seq_len + 1))
+        self.num_hypos += th.sum(ended, -1)
+        return score
+
+    def _end_detect(self,
+                    ended: th.Tensor,
+                    score: th.Tensor,
+                    look_back: int = 3,
+                    end_threshold: float = 10) -> th.Tensor:
+        """
+        Vectorized version of the end_detect()
+        Args:
+            ended (Tensor): N x beam, ended flags of current step
+            score (Tensor): N x beam, final score of the hypothesis
+        Return:
+            detected (Tensor): N, detected flags
+        """
+        score = th.where(ended, score, th.full_like(score, NEG_INF))
+        self.ended_best[:, self.step_num] = th.max(score, -1)[0]
+        self.ended_mask[:, self.step_num] = th.any(ended, -1)
+        # N x 1
+        global_best = th.max(self.ended_best, -1, keepdim=True)[0]
+        beg = max(self.step_num - look_back, 0)
+        end = self.step_num
+        count = self.ended_mask[:, beg:end] & (
+            global_best - self.ended_best[:, beg:end] >= end_threshold)
+        return th.sum(count, -1) == look_back
+
+    def step(self,
+             am_prob: th.Tensor,
+             lm_prob: Union[th.Tensor, float],
+             att_ali: Optional[th.Tensor] = None) -> bool:
+        """
+        Run one beam search step
+        Args:
+            am_prob (Tensor): N x V, acoustic prob
+            lm_prob (Tensor): N x V, language prob
+            att_ali (Tensor): N x T, alignment score (weight)
+        Return:
+            stop (bool): stop beam search or not
+        """
+        # local pruning
+        if self.step_num == 0:
+            self._init_search(am_prob, lm_prob, att_ali=att_ali)
+        else:
+            self._step_search(am_prob, lm_prob, att_ali=att_ali)
+        self.step_num += 1
+        # N x beam, process eos nodes (skip the utterances that reach the
+        # max_len, the auto-stopped ones are still collected as the
+        # BatchBeamTracker does)
+        end_eos = self.token[self.step_num].view(self.batch_size, -1)
+        active = self.step_num < self.max_len
+        end_eos = th.logical_and(end_eos == self.param.eos, active[:, None])
+        self.acmu_score.masked_fill_(end_eos, NEG_INF)
+        # filter short utterances
+        ended = th.logical_and(end_eos, (self.step_num > self.min_len)[:, None])
+        score = self._collect_hypos(ended, final=False)
+        # all eos, stop beam search
+        stop = th.all(ended, -1)
+        # auto detected
+        if self.param.end_detect:
+            detected = self._end_detect(ended, score)
+            stop = stop | (detected & th.any(ended, -1))
+        self.auto_stop |= stop
+        # all True, stop search
+        stop = th.all(self.auto_stop).item()
+        if stop:
+            logger.info(
+                f"--- beam search (all batches) ends at step {self.step_num}")
+        # if reach max(max_len), also return true to stop batch beam search
+        return stop or self.step_num == self.max_steps
+
+    def _trace_back_hypos(self) -> List[List[Dict]]:
+        """
+        Trace back all the hypothesis in the buffers
+        """
+        N = self.batch_size
+        # N x K
+        valid = th.arange(self.max_hypos + 1,
+                          device=self.num_hypos.device) < self.num_hypos[:,
+                                                                         None]
+        # H, flatten hypothesis
+        hypo_step = self.hypo_step[valid]
+        hypo_point = self.hypo_point[valid]
+        point = hypo_point
+        # H x U + 2, padded with eos (for the unended hypothesis)
+        trans = th.full((hypo_step.shape[0], self.step_num + 2),
+                        self.param.eos,
+                        dtype=th.int64,
+                        device=hypo_step.device)
+        for t in range(self.step_num, -1, -1):
+            traced = hypo_step >= t
+            trans[:, t] = th.where(traced, self.token[t][point], trans[:, t])
+            point = th.where(traced, self.point[t][point], point)
+        align = None if self.align is None else self.align[hypo_point].cpu()
+        hypo_step = hypo_step.tolist()
+        hypo_len = self.hypo_len[valid].tolist()
+        hypo_score = self.hypo_score[valid].tolist()
+        trans = trans.tolist()
+        hypos = [[] for _ in range(N)]
+        hypo_index = 0
+        for u, num_hypos in enumerate(self.num_hypos.tolist()):
+            for _ in range(num_hypos):
+                i = hypo_index
+                hypos[u].append({
+                    "score":
+                        hypo_score[i],
+                    "trans":
+                        trans[i][:hypo_len[i]],
+                    "align":
+                        None if align is None else align[i, :, :hypo_step[i]]
+                })
+                hypo_index += 1
+        return hypos
+
+    def nbest_hypos(self,
+                    nbest: int,
+                    auto_stop: bool = True) -> List[List[Dict]]:
+        """
+        Return nbest sequence
+        Args:
+            nbest (int): nbest size
+            auto_stop: beam search is auto-stopped or not
+        """
+        # not auto stop, add unfinished hypos
+        if not auto_stop:
+            logger.info("--- beam search reaches the final step ...")
+            not_end = self.token[self.step_num].view(self.batch_size, -1)
+            not_end = th.logical_and(not_end != self.param.eos,
+                                     ~self.auto_stop[:, None])
+            # filter short utterances
+            not_end = th.logical_and(not_end,
+                                     (self.step_num >= self.min_len)[:, None])
+            self._collect_hypos(not_end, final=True)
+        # sort and get nbest
+        nbest_batch = []
+        for u, utt_bypos in enumerate(self._trace_back_hypos()):
+            logger.info(f"--- beam search gets top-{nbest} list (batch[{u}]) " +
+                        f"from {len(utt_bypos)} hypos ...")
+            sort_hypos = sorted(utt_bypos,
+                                key=lambda n: n["score"],
+                                reverse=True)
+            nbest_batch.append(sort_hypos[:nbest])
+        return nbest_batch
@@ -9,8 +9,8 @@ import torch as th
 import torch.nn as nn
 import torch.nn.functional as tf
 
-from aps.asr.beam_search.utils import BeamSearchParam, BeamTracker, BatchBeamTracker
-from aps.asr.beam_search.lm import lm_score_impl, LmType
+from aps.asr.beam_search.utils import BeamSearchParam, BeamTracker, VectorizedBeamTracker
+from aps.asr.beam_search.lm import lm_score_impl, adjust_hidden, LmType
 from aps.utils import get_logger
 from typing import List, Dict, Optional
 
@@ -32,19 +32,20 @@ def greedy_search(decoder: nn.Module,
     if N != 1:
         raise RuntimeError(
             f"Got batch size {N:d}, now only support one utterance")
-    if not hasattr(decoder, "step"):
-        raise RuntimeError("Function step should defined in decoder network")
+    if not hasattr(decoder, "cached_step"):
+        raise RuntimeError(
+            "Function cached_step should defined in decoder network")
     device = enc_out.device
     dec_tok = [sos]
-    pre_emb = None
+    memory_kv = decoder.memory_cache(enc_out)
+    self_kv = None
     score = 0
     while True:
         pre_tok = th.tensor([dec_tok[-1]], device=device)
         # make one step
-        dec_out, pre_emb = decoder.step(enc_out,
-                                        pre_tok[:, None],
-                                        out_idx=-1,
-                                        pre_emb=pre_emb)
+        dec_out, self_kv = decoder.cached_step(memory_kv,
+                                               pre_tok[:, None],
+                                               self_kv=self_kv)
         prob = tf.log_softmax(dec_out, dim=-1)
         pred_score, pred_token = th.topk(prob, 1, dim=-1)
         dec_tok.append(pred_token.item())
@@ -86,8 +87,9 @@ def beam_search(decoder: nn.Module,
     if N != 1:
         raise RuntimeError(
             f"Got batch size {N:d}, now only support one utterance")
-    if not hasattr(decoder, "step"):
-        raise RuntimeError("Function step should defined in decoder network")
+    if not hasattr(decoder, "cached_step"):
+        raise RuntimeError(
+            "Function cached_step should defined in decoder network")
     if beam_size > decoder.vocab_size:
         raise RuntimeError(f"Beam size({beam_size}) > vocabulary size")
 
@@ -111,27 +113,32 @@ def beam_search(decoder: nn.Module,
                                  len_penalty=len_penalty,
                                  eos_threshold=eos_threshold)
     beam_tracker = BeamTracker(beam_param)
-    pre_emb = None
+    self_kv = None
     lm_state = None
     # T x 1 x D => T x beam x D
     enc_out = th.repeat_interleave(enc_out, beam_size, 1)
+    # key & value of the encoder output are shared among the steps
+    memory_kv = decoder.memory_cache(enc_out)
     # step by step
     stop = False
     while not stop:
         # beam
         pre_tok, point = beam_tracker[-1]
         # beam x V
-        dec_out, pre_emb = decoder.step(
-            enc_out,
-            pre_tok[:, None],
-            out_idx=-1,
-            pre_emb=None if pre_emb is None else pre_emb[:, point])
+        dec_out, self_kv = decoder.cached_step(memory_kv,
+                                               pre_tok[:, None],
+                                               self_kv=adjust_hidden(
+                                                   point, self_kv))
 
         # compute prob: beam x V, nagetive
         am_prob = tf.log_softmax(dec_out / temperature, dim=-1)
         if lm and beam_param.lm_weight > 0:
             # beam x V
-            lm_prob, lm_state = lm_score_impl(lm, point, pre_tok, lm_state)
+            lm_prob, lm_state = lm_score_impl(lm,
+                                              point,
+                                              pre_tok,
+                                              lm_state,
+                                              am_prob=am_prob)
         else:
             lm_prob = 0
         # one beam search step
@@ -167,8 +174,9 @@ def beam_search_batch(decoder: nn.Module,
     """
     if sos < 0 or eos < 0:
         raise RuntimeError(f"Invalid SOS/EOS ID: {sos:d}/{eos:d}")
-    if not hasattr(decoder, "step"):
-        raise RuntimeError("Function step should defined in decoder network")
+    if not hasattr(decoder, "cached_step"):
+        raise RuntimeError(
+            "Function cached_step should defined in decoder network")
     if beam_size > decoder.vocab_size:
         raise RuntimeError(f"Beam size({beam_size}) > vocabulary size")
 
@@ -188,7 +196,9 @@ def beam_search_batch(decoder: nn.Module,
     # T x N x D => T x N*beam x D
     enc_out = th.repeat_interleave(enc_out, beam_size, 1)
 
-    pre_emb = None
+    # key & value of the encoder output are shared among the steps
+    memory_kv = decoder.memory_cache(enc_out)
+    self_kv = None
     lm_state = None
     # cov_* are diabled
     beam_param = BeamSearchParam(beam_size=beam_size,
@@ -201,24 +211,28 @@ def beam_search_batch(decoder: nn.Module,
                                  lm_weight=lm_weight,
                                  len_penalty=len_penalty,
                                  eos_threshold=eos_threshold)
-    beam_tracker = BatchBeamTracker(N, beam_param)
+    beam_tracker = VectorizedBeamTracker(N, beam_param)
     # step by step
     stop = False
     while not stop:
         # N*beam
         pre_tok, point = beam_tracker[-1]
-        # beam x V
-        dec_out, pre_emb = decoder.step(
-            enc_out,
-            pre_tok[:, None],
-            out_idx=-1,
-            pre_emb=None if pre_emb is None else pre_emb[:, point])
+        # N*beam x V
+        dec_out, self_kv = decoder.cached_step(memory_kv,
+                                               pre_tok[:, None],
+                                               enc_len=enc_len,
+                                               self_kv=adjust_hidden(
+                                                   point, self_kv))
         # compute prob: N*beam x V, nagetive
         am_prob = tf.log_softmax(dec_out / temperature, dim=-1)
 
         if lm and beam_param.lm_weight > 0:
             # beam x V
-            lm_prob, lm_state = lm_score_impl(lm, point, pre_tok, lm_state)
+            lm_prob, lm_state = lm_score_impl(lm,
+                                              point,
+                                              pre_tok,
+                                              lm_state,
+                                              am_prob=am_prob)
         else:
             lm_prob = 0
 
@@ -1,6 +1,7 @@
 # Copyright 2019 Jian Wu
 # License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
 
+import numpy as np
 import torch as th
 
 try:
@@ -9,19 +10,31 @@ try:
 except ImportError:
     kenlm_available = False
 
+from collections import OrderedDict
+from typing import Optional, List, Tuple, Union
+from aps.const import NEG_INF
 from aps.conf import load_dict
 
 
 class NgramLM(object):
     """
-    Wrapper for ngram LM, used for beam search
+    Wrapper for ngram LM, used for beam search. The LM scores are memoized
+    with the LM context state as the key (LRU cache), in top-k mode, only the
+    scores of the candidates are computed and kept
 
     Args:
         lm: checkpoint of the ngram LM
         vocab_dict: path of the ASR dictionary
+        cache_size: maximum number of the context states cached
+        topk: if > 0, only score the top-k acoustic candidates and set
+              the others to NEG_INF (need am_prob in __call__)
     """
 
-    def __init__(self, lm: str, vocab_dict: str) -> None:
+    def __init__(self,
+                 lm: str,
+                 vocab_dict: str,
+                 cache_size: int = 4096,
+                 topk: int = 0) -> None:
         if not kenlm_available:
             raise RuntimeError("import kenlm error, please install kenlm first")
         self.ngram_lm = kenlm.LanguageModel(lm)
@@ -34,30 +47,95 @@ class NgramLM(object):
             if tok == "<sos>":
                 tok = "<s>"
             self.token[i] = tok
+        self.topk = topk
+        self.vocab = np.arange(len(self.token))
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.hits = 0
+        self.miss = 0
+        # used as output state of BaseScore when we don't need it
+        self.scratch = kenlm.State()
 
-    def _step(self, prev_state):
+    @property
+    def hit_rate(self) -> float:
         """
+        Return hit rate of the score cache
+        """
+        total = self.hits + self.miss
+        return self.hits / total if total else 0
+
+    def _advance(self, prev_state, token: int):
+        """
+        Return the context state after consuming the token
+        """
+        next_state = kenlm.State()
+        self.ngram_lm.BaseScore(prev_state, self.token[token], next_state)
+        return next_state
+
+    def _cached_score(self, prev_state,
+                      candidate: Union[List[int], np.ndarray]) -> np.ndarray:
+        """
+        Return the cached LM scores of the context state (the ones not scored
+        yet are NaN), the candidate tokens are scored on miss
         Args:
             prev_state (State): previous state
+            candidate (list[int] or ndarray): tokens to be scored
         Return:
-            score (Tensor): V, LM scores
-            state (list[State]), new states
+            score (ndarray): V, LM scores
         """
-        next_state = [kenlm.State() for _ in range(len(self.token))]
-        score = th.tensor([
-            self.ngram_lm.BaseScore(prev_state, pred, next_state[i])
-            for i, pred in enumerate(self.token)
-        ])
-        return score, next_state
+        if prev_state in self.cache:
+            self.cache.move_to_end(prev_state)
+            score = self.cache[prev_state]
+        else:
+            score = np.full(len(self.token), np.nan, dtype=np.float32)
+            self.cache[prev_state] = score
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        candidate = np.asarray(candidate)
+        missing = candidate[np.isnan(score[candidate])]
+        if missing.size:
+            self.miss += 1
+            score[missing] = [
+                self.ngram_lm.BaseScore(prev_state, self.token[c], self.scratch)
+                for c in missing.tolist()
+            ]
+        else:
+            self.hits += 1
+        return score
 
-    def __call__(self, token, state):
+    def _step(self, prev_state) -> np.ndarray:
         """
         Args:
-            token (th.Tensor): V, previous tokens
-            state (list[list[State]] or None): LM states
+            prev_state (State): previous state
+        Return:
+            score (ndarray): V, LM scores
+        """
+        return self._cached_score(prev_state, self.vocab).copy()
+
+    def _step_topk(self, prev_state, candidate: List[int]) -> np.ndarray:
+        """
+        Args:
+            prev_state (State): previous state
+            candidate (list[int]): tokens to be scored
+        Return:
+            score (ndarray): V, LM scores (NEG_INF if not in candidate)
+        """
+        score = np.full(len(self.token), NEG_INF, dtype=np.float32)
+        score[candidate] = self._cached_score(prev_state, candidate)[candidate]
+        return score
+
+    def __call__(self,
+                 token: th.Tensor,
+                 state: Optional[List],
+                 am_prob: Optional[th.Tensor] = None) -> Tuple[th.Tensor, List]:
+        """
+        Args:
+            token (th.Tensor): N, previous tokens
+            state (list[State] or None): LM context states before the previous tokens
+            am_prob (Tensor or None): N x V, acoustic scores used for top-k pruning
         Return:
             score (Tensor): N x V, LM scores
-            state (list[list[State]]), new states
+            state (list[State]), new context states
         """
         device = token.device
         token = token.tolist()
@@ -67,11 +145,16 @@ class NgramLM(object):
             prev_state = [init_state for _ in range(len(token))]
         else:
             assert len(token) == len(state)
-            prev_state = [s[token[i]] for i, s in enumerate(state)]
-        scores, states = [], []
-        for state in prev_state:
-            score, state = self._step(state)
-            scores.append(score)
-            states.append(state)
-        scores = th.stack(scores).to(device)
-        return scores, states
+            prev_state = [
+                self._advance(s, token[i]) for i, s in enumerate(state)
+            ]
+        if self.topk > 0 and am_prob is not None:
+            candidate = th.topk(am_prob, self.topk, dim=-1)[1].tolist()
+            scores = [
+                self._step_topk(s, candidate[i])
+                for i, s in enumerate(prev_state)
+            ]
+        else:
+            scores = [self._step(s) for s in prev_state]
+        scores = th.from_numpy(np.stack(scores)).to(device)
+        return scores, prev_state
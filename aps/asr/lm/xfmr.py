@@ -3,10 +3,11 @@
 
 import torch as th
 import torch.nn as nn
+import torch.nn.functional as tf
 
-from typing import Optional, Tuple
+from typing import Optional, Tuple, List
 from aps.asr.xfmr.pose import get_xfmr_pose
-from aps.asr.xfmr.impl import get_xfmr_encoder
+from aps.asr.xfmr.impl import get_xfmr_encoder, KVType
 from aps.asr.xfmr.decoder import prep_sub_mask
 from aps.asr.base.attention import padding_mask
 from aps.libs import ApsRegisters
@@ -46,33 +47,37 @@ class TorchXfmrLM(nn.Module):
         self.vocab_size = vocab_size
 
     def forward(
-            self,
-            token: th.Tensor,
-            h: Optional[th.Tensor] = None,
-            token_len: Optional[th.Tensor] = None
-    ) -> Tuple[th.Tensor, th.Tensor]:
+        self,
+        token: th.Tensor,
+        h: Optional[List[KVType]] = None,
+        token_len: Optional[th.Tensor] = None
+    ) -> Tuple[th.Tensor, List[KVType]]:
         """
         args:
             token: input token sequence, N x T
-            h: previous sequence embeddings, T x N x E
+            h: key & value cache of the history tokens (per-layer), T' x N x ...
             token_len: length of x, N or None
         return:
             output: N x T x V
-            h: current sequence embeddings, T x N x E
+            h: updated key & value cache, T'+T x N x ...
         """
-        # N x T => T x N x V
-        t = 0 if h is None else h.shape[0]
+        # length of the history tokens
+        t = 0 if h is None else h[0][0].shape[0]
+        # N x T => T x N x E
         x = self.abs_pos_enc(self.vocab_embed(token), t=t)
-        # h == None: training or eval in time = 0
-        h = x if h is None else th.cat([h, x], dim=0)
-        # src_pad_mask: N x T
-        src_pad_mask = None if token_len is None else (padding_mask(token_len)
-                                                       == 1)
-        tgt_mask = prep_sub_mask(t + 1, device=x.device)
-        # N x Ti x D
-        enc_out = self.encoder(h,
-                               mask=tgt_mask,
-                               src_key_padding_mask=src_pad_mask)
-        # N x Ti x V
-        output = self.dist(enc_out)
+        # src_pad_mask: N x T'+T
+        if token_len is None:
+            src_pad_mask = None
+        else:
+            src_pad_mask = tf.pad(padding_mask(token_len) == 1, (t, 0),
+                                  value=False)
+        # T x T'+T
+        tgt_mask = prep_sub_mask(t + x.shape[0], device=x.device)[t:]
+        # T x N x D
+        enc_out, h = self.encoder.step(x,
+                                       cache=h,
+                                       src_mask=tgt_mask,
+                                       src_key_padding_mask=src_pad_mask)
+        # T x N x V => N x T x V
+        output = self.dist(enc_out).transpose(0, 1)
         return output, h
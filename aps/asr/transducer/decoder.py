@@ -6,13 +6,15 @@
 import torch as th
 import torch.nn as nn
 
-from typing import Optional, Tuple
+from typing import Optional, Tuple, List, Union
 from aps.asr.xfmr.decoder import prep_sub_mask
-from aps.asr.xfmr.impl import get_xfmr_encoder
+from aps.asr.xfmr.impl import get_xfmr_encoder, KVType
 from aps.asr.xfmr.pose import get_xfmr_pose
 from aps.asr.base.attention import padding_mask
 from aps.asr.base.layer import OneHotEmbedding, PyTorchRNN
 
+HiddenType = Union[th.Tensor, Tuple[th.Tensor, th.Tensor]]
+
 
 class DecoderBase(nn.Module):
     """
@@ -107,6 +109,38 @@ class PyTorchRNNDecoder(DecoderBase):
         dec_out, hidden = self.decoder(pred_prev_emb, hidden)
         return dec_out[:, -1], hidden
 
+    def batch_step(
+            self,
+            pred_prev: th.Tensor,
+            emit: Optional[th.Tensor] = None,
+            dec_prev: Optional[th.Tensor] = None,
+            hidden: Optional[HiddenType] = None
+    ) -> Tuple[th.Tensor, HiddenType]:
+        """
+        Make one step for the hypotheses which emit a non-blank token and
+        keep the others unchanged (used in batch beam search)
+        Args:
+            pred_prev: N, previous tokens
+            emit: N, true if the hypothesis emits pred_prev
+            dec_prev: N x D, previous decoder output
+            hidden: previous hidden states of the RNN
+        Return:
+            dec_out: N x D
+            hidden: updated hidden states
+        """
+        dec_out, new_hidden = self.step(pred_prev[:, None], hidden=hidden)
+        if emit is None:
+            return dec_out, new_hidden
+        dec_out = th.where(emit[:, None], dec_out, dec_prev)
+        # num_layers x N x D
+        if isinstance(new_hidden, tuple):
+            new_hidden = tuple(
+                th.where(emit[None, :, None], n, h)
+                for n, h in zip(new_hidden, hidden))
+        else:
+            new_hidden = th.where(emit[None, :, None], new_hidden, hidden)
+        return dec_out, new_hidden
+
 
 class TorchTransformerDecoder(DecoderBase):
     """
@@ -129,6 +163,7 @@ class TorchTransformerDecoder(DecoderBase):
                  onehot_embed: bool = False) -> None:
         super(TorchTransformerDecoder,
               self).__init__(vocab_size,
+                             embed_size=att_dim,
                              enc_dim=enc_dim if enc_dim else att_dim,
                              dec_dim=att_dim,
                              jot_dim=jot_dim,
@@ -168,22 +203,67 @@ class TorchTransformerDecoder(DecoderBase):
                                src_key_padding_mask=pad_mask)
         return self.pred(enc_out, dec_out.transpose(0, 1))
 
-    def step(self,
-             pred_prev: th.Tensor,
-             hidden: Optional[th.Tensor] = None) -> Tuple[th.Tensor, th.Tensor]:
+    def step(
+        self,
+        pred_prev: th.Tensor,
+        hidden: Optional[List[KVType]] = None
+    ) -> Tuple[th.Tensor, List[KVType]]:
         """
         Make one step for decoder
         Args:
-            pred_prev: 1 x 1
-            hidden: None or T x 1 x E
+            pred_prev: N x 1
+            hidden: None or key & value cache of each layer
         Return:
-            dec_out: 1 x D
+            dec_out: N x D
+            hidden: updated key & value cache
         """
-        t = 0 if hidden is None else hidden.shape[0]
-        # 1 x 1 x E
+        t = 0 if hidden is None else hidden[0][0].shape[0]
+        # 1 x N x E
         pred_prev_emb = self.abs_pos_enc(self.vocab_embed(pred_prev), t=t)
-        hidden = pred_prev_emb if hidden is None else th.cat(
-            [hidden, pred_prev_emb], dim=0)
-        tgt_mask = prep_sub_mask(t + 1, device=pred_prev.device)
-        dec_out = self.decoder(hidden, mask=tgt_mask)
+        # 1 x N x D
+        dec_out, hidden = self.decoder.step(pred_prev_emb, cache=hidden)
         return dec_out[-1], hidden
+
+    def batch_step(
+        self,
+        pred_prev: th.Tensor,
+        emit: Optional[th.Tensor] = None,
+        dec_prev: Optional[th.Tensor] = None,
+        hidden: Optional[Tuple[List[KVType], th.Tensor]] = None
+    ) -> Tuple[th.Tensor, Tuple[List[KVType], th.Tensor]]:
+        """
+        Make one step for the hypotheses which emit a non-blank token and
+        keep the others unchanged (used in batch beam search). The cache of
+        the non-emitting hypotheses grows as well but is masked out
+        Args:
+            pred_prev: N, previous tokens
+            emit: N, true if the hypothesis emits pred_prev
+            dec_prev: N x D, previous decoder output
+            hidden: None or (key & value cache, T x N padding masks)
+        Return:
+            dec_out: N x D
+            hidden: updated (key & value cache, padding masks)
+        """
+        if emit is None:
+            emit = th.ones_like(pred_prev, dtype=th.bool)
+        if hidden is None:
+            cache = None
+            # N
+            t = th.zeros_like(pred_prev)
+            pad_mask = (~emit)[None]
+        else:
+            cache, pad_mask = hidden
+            # N, number of the valid tokens
+            t = (~pad_mask).sum(0)
+            pad_mask = th.cat([pad_mask, (~emit)[None]], 0)
+        # 1 x N x E
+        pred_prev_emb = self.abs_pos_enc(self.vocab_embed(pred_prev[:, None]),
+                                         t=t)
+        # 1 x N x D
+        dec_out, cache = self.decoder.step(pred_prev_emb,
+                                           cache=cache,
+                                           src_key_padding_mask=pad_mask.T)
+        dec_out = dec_out[-1]
+        if dec_prev is not None:
+            dec_out = th.where(emit[:, None], dec_out, dec_prev)
+        return dec_out, (cache, pad_mask)
@@ -7,12 +7,14 @@ import torch as th
 import torch.nn as nn
 import torch.nn.functional as tf
 
-from typing import Optional, Dict, Tuple, List
+from typing import Optional, Dict, Tuple, List, Iterator
 from aps.asr.transducer.decoder import TorchTransformerDecoder, PyTorchRNNDecoder
 from aps.asr.xfmr.encoder import TransformerEncoder
-from aps.asr.base.encoder import encoder_instance
+from aps.asr.base.encoder import encoder_instance, batch_encode
 from aps.asr.xfmr.impl import TransformerEncoderLayers
 from aps.asr.beam_search.transducer import greedy_search, beam_search
+from aps.asr.beam_search.transducer import greedy_search_stream
+from aps.asr.beam_search.transducer import beam_search_batch
 from aps.libs import ApsRegisters
 
 NoneOrTensor = Optional[th.Tensor]
@@ -74,6 +76,17 @@ class TransducerASRBase(nn.Module):
         enc_out, _ = self.encoder(x, None)
         return enc_out
 
+    def _batch_decoding_prep(
+            self, batch: List[th.Tensor]) -> Tuple[th.Tensor, th.Tensor]:
+        """
+        Prepare data for batch decoding
+        """
+        # N x T x D
+        enc_out, enc_len = batch_encode(self.encoder,
+                                        batch,
+                                        asr_transform=self.asr_transform)
+        return enc_out, enc_len
+
     def _training_prep(
             self, x_pad: th.Tensor, x_len: NoneOrTensor,
             y_pad: th.Tensor) -> Tuple[th.Tensor, NoneOrTensor, th.Tensor]:
@@ -98,6 +111,50 @@ class TransducerASRBase(nn.Module):
             enc_out = self._decoding_prep(x)
             return greedy_search(self.decoder, enc_out, blank=self.blank)
 
+    @th.no_grad()
+    def streaming_greedy_search(self,
+                                x: th.Tensor,
+                                chunk_size: int = 16) -> Iterator[Dict]:
+        """
+        Chunk-wise greedy search for TransducerASR (transformer encoders only),
+        which yields the partial hypothesis after each chunk. Note that the
+        feature front-end (asr_transform, e.g., utterance-level CMVN) runs on
+        the whole input before chunking, so the input should be the complete
+        utterance instead of the audio that arrives so far
+        Args:
+            x (Tensor): audio samples or acoustic features, S or Ti x F
+            chunk_size (int): number of the encoder frames in each chunk,
+                              use the one in training instead if it's > 0
+        """
+        if not self.is_xfmr_encoder:
+            raise RuntimeError(
+                "streaming_greedy_search only supports transformer encoders")
+        if self.encoder.chunk_size > 0:
+            chunk_size = self.encoder.chunk_size
+        if self.asr_transform:
+            x, _ = self.asr_transform(x[None, ...], None)
+        else:
+            x = x[None, ...]
+        proj = self.encoder.proj
+        # number of the feature frames in each chunk, the first chunk needs
+        # additional frames to fill the receptive field of the projection layer
+        stride = chunk_size * proj.subsampling
+        extra = proj.receptive_field - proj.subsampling
+
+        def encoder_chunks():
+            cache = None
+            beg, end = 0, stride + extra
+            while beg < x.shape[1]:
+                # N x Tc x D
+                enc_out, cache = self.encoder.step(x[:, beg:end], cache=cache)
+                beg, end = end, end + stride
+                yield enc_out
+
+        for hyp in greedy_search_stream(self.decoder,
+                                        encoder_chunks(),
+                                        blank=self.blank):
+            yield hyp
+
     def beam_search(self,
                     x: th.Tensor,
                     lm: Optional[nn.Module] = None,
@@ -121,6 +178,33 @@ class TransducerASRBase(nn.Module):
                                lm_weight=lm_weight,
                                len_norm=len_norm)
 
+    def beam_search_batch(self,
+                          batch: List[th.Tensor],
+                          lm: Optional[nn.Module] = None,
+                          lm_weight: float = 0,
+                          beam_size: int = 16,
+                          nbest: int = 8,
+                          len_norm: bool = True,
+                          **kwargs) -> List[List[Dict]]:
+        """
+        Beam search for TransducerASR (batch version)
+        Args
+            batch (list[Tensor]): audio samples or acoustic features, S or Ti x F
+        """
+        if lm is not None and lm_weight > 0:
+            raise RuntimeError(
+                "LM fusion is not supported in beam_search_batch now")
+        with th.no_grad():
+            enc_out, enc_len = self._batch_decoding_prep(batch)
+            return beam_search_batch(self.decoder,
+                                     enc_out,
+                                     enc_len=enc_len,
+                                     beam=beam_size,
+                                     blank=self.blank,
+                                     nbest=nbest,
+                                     len_norm=len_norm,
+                                     **kwargs)
+
 
 @ApsRegisters.asr.register("asr@transducer")
 class TransducerASR(TransducerASRBase):
@@ -5,11 +5,12 @@
 
 import torch as th
 import torch.nn as nn
+import torch.nn.functional as tf
 
 from torch.nn import MultiheadAttention, TransformerDecoder
-from typing import Union, Tuple, Optional
+from typing import Union, Tuple, Optional, List
 from aps.asr.xfmr.pose import get_xfmr_pose
-from aps.asr.xfmr.impl import _get_activation_fn
+from aps.asr.xfmr.impl import _get_activation_fn, KVType
 from aps.asr.base.attention import padding_mask
 
 
@@ -31,6 +32,57 @@ def prep_sub_mask(T: int, device: Union[str, th.device] = "cpu") -> th.Tensor:
     return mask
 
 
+def proj_kv(mha: MultiheadAttention, inp: th.Tensor) -> KVType:
+    """
+    Project the input to the key & value of the MultiheadAttention
+    Args:
+        inp (Tensor): S x N x E
+    Return:
+        key (Tensor): S x N x E
+        value (Tensor): S x N x E
+    """
+    E = mha.embed_dim
+    bias = None if mha.in_proj_bias is None else mha.in_proj_bias[E:]
+    kv = tf.linear(inp, mha.in_proj_weight[E:], bias)
+    return th.chunk(kv, 2, dim=-1)
+
+
+def cached_attention(mha: MultiheadAttention,
+                     query: th.Tensor,
+                     key: th.Tensor,
+                     value: th.Tensor,
+                     key_padding_mask: Optional[th.Tensor] = None) -> th.Tensor:
+    """
+    Run MultiheadAttention with the projected key & value (see proj_kv),
+    numerically same as mha(query, key, value) with the unprojected ones
+    Args:
+        query (Tensor): L x N x E
+        key (Tensor): S x N x E
+        value (Tensor): S x N x E
+        key_padding_mask (Tensor): N x S
+    Return:
+        context (Tensor): L x N x E
+    """
+    E, H = mha.embed_dim, mha.num_heads
+    L, N, _ = query.shape
+    bias = None if mha.in_proj_bias is None else mha.in_proj_bias[:E]
+    query = tf.linear(query, mha.in_proj_weight[:E], bias)
+    query = query * float(E // H)**-0.5
+    # L x N x H x S
+    logit = th.einsum("lnhd,snhd->lnhs", query.view(L, N, H, -1),
+                      key.view(-1, N, H, E // H))
+    if key_padding_mask is not None:
+        logit = logit.masked_fill(key_padding_mask[None, :, None, :],
+                                  float("-inf"))
+    weight = tf.dropout(th.softmax(logit, dim=-1),
+                        p=mha.dropout,
+                        training=mha.training)
+    # L x N x H x D
+    context = th.einsum("lnhs,snhd->lnhd", weight, value.view(-1, N, H, E // H))
+    # L x N x E
+    return mha.out_proj(context.contiguous().view(L, N, E))
+
+
 class TransformerDncoderLayer(nn.Module):
     """
     Standard Transformer decoder layer
@@ -115,6 +167,58 @@ class TransformerDncoderLayer(nn.Module):
             tgt = self.norm3(tgt)
         return tgt
 
+    def step(
+        self,
+        tgt: th.Tensor,
+        memory_kv: KVType,
+        self_kv: Optional[KVType] = None,
+        memory_key_padding_mask: Optional[th.Tensor] = None
+    ) -> Tuple[th.Tensor, KVType]:
+        """
+        Incremental version of the forward function, only process the newest token
+        Args:
+            tgt (Tensor): 1 x N x D, embeddings of the newest token
+            memory_kv (Tensor, Tensor): S x N x D, projected key & value of the encoder output
+            self_kv (None or (Tensor, Tensor)): T x N x D, cached key & value of the history tokens
+            memory_key_padding_mask (Tensor or None): N x S
+        Return
+            out (Tensor): 1 x N x D
+            self_kv (Tensor, Tensor): T+1 x N x D, updated key & value cache
+        """
+        skip_add = tgt
+        if self.pre_norm:
+            tgt = self.norm1(tgt)
+        key, value = proj_kv(self.self_attn, tgt)
+        if self_kv is not None:
+            key = th.cat([self_kv[0], key], 0)
+            value = th.cat([self_kv[1], value], 0)
+        tgt = cached_attention(self.self_attn, tgt, key, value)
+
+        tgt = skip_add + self.dropout1(tgt)
+        if not self.pre_norm:
+            tgt = self.norm1(tgt)
+
+        skip_add = tgt
+        if self.pre_norm:
+            tgt = self.norm2(tgt)
+        tgt = cached_attention(self.multihead_attn,
+                               tgt,
+                               memory_kv[0],
+                               memory_kv[1],
+                               key_padding_mask=memory_key_padding_mask)
+
+        tgt = skip_add + self.dropout2(tgt)
+        if not self.pre_norm:
+            tgt = self.norm2(tgt)
+
+        skip_add = tgt
+        if self.pre_norm:
+            tgt = self.norm3(tgt)
+        tgt = skip_add + self.feedforward(tgt)
+        if not self.pre_norm:
+            tgt = self.norm3(tgt)
+        return tgt, (key, value)
+
 
 class TorchTransformerDecoder(nn.Module):
     """
@@ -195,6 +299,58 @@ class TorchTransformerDecoder(nn.Module):
         dec_out = self.output(dec_out)
         return dec_out, tgt_emb
 
+    def memory_cache(self, enc_out: th.Tensor) -> List[KVType]:
+        """
+        Precompute key & value of the encoder output for each decoder layer
+        (used in cached_step)
+        Args:
+            enc_out (Tensor): T x N x D
+        Return:
+            memory_kv (list[(Tensor, Tensor)]): T x N x D
+        """
+        return [
+            proj_kv(layer.multihead_attn, enc_out)
+            for layer in self.decoder.layers
+        ]
+
+    def cached_step(
+        self,
+        memory_kv: List[KVType],
+        tgt_pad: th.Tensor,
+        enc_len: Optional[th.Tensor] = None,
+        self_kv: Optional[List[KVType]] = None
+    ) -> Tuple[th.Tensor, List[KVType]]:
+        """
+        Decode the newest token using the key & value cache of each layer, which
+        gives same results as step(..., out_idx=-1) but costs O(T) instead of O(T^2)
+        The cache can be reordered by the beam back-pointers using adjust_hidden
+        Args:
+            memory_kv (list[(Tensor, Tensor)]): output of memory_cache
+            tgt_pad (Tensor): N x 1, the newest token
+            enc_len (Tensor): N or None
+            self_kv (list[(Tensor, Tensor)] or None): T x N x D, cache from previous step
+        Return:
+            dec_out (Tensor): N x V
+            self_kv (list[(Tensor, Tensor)]): T+1 x N x D, updated cache
+        """
+        offset = 0 if self_kv is None else self_kv[0][0].shape[0]
+        mem_pad_mask = None if enc_len is None else (padding_mask(enc_len) == 1)
+        # 1 x N x E
+        dec_out = self.abs_pos_enc(self.vocab_embed(tgt_pad), t=offset)
+        update_kv = []
+        for i, layer in enumerate(self.decoder.layers):
+            dec_out, kv = layer.step(
+                dec_out,
+                memory_kv[i],
+                self_kv=None if self_kv is None else self_kv[i],
+                memory_key_padding_mask=mem_pad_mask)
+            update_kv.append(kv)
+        if self.decoder.norm is not None:
+            dec_out = self.decoder.norm(dec_out)
+        # N x V
+        dec_out = self.output(dec_out[0])
+        return dec_out, update_kv
+
     def forward(self, enc_out: th.Tensor, enc_len: Optional[th.Tensor],
                 tgt_pad: th.Tensor, tgt_len: Optional[th.Tensor]) -> th.Tensor:
         """
@@ -6,7 +6,7 @@
 import torch as th
 import torch.nn as nn
 
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple, Union
 from aps.asr.base.attention import padding_mask
 from aps.asr.base.encoder import EncRetType
 from aps.asr.xfmr.impl import get_xfmr_encoder
@@ -14,6 +14,30 @@ from aps.asr.xfmr.pose import get_xfmr_pose
 from aps.asr.xfmr.proj import get_xfmr_proj
 
 
+def prep_chunk_mask(T: int,
+                    chunk_size: int,
+                    left_context: int = -1,
+                    device: Union[str, th.device] = "cpu") -> th.Tensor:
+    """
+    Prepare a square chunk-wise masks (-inf/0), each frame attends to the frames
+    in the same chunk and the left_context frames before the chunk (-1 means
+    unlimited). egs: for T = 6, chunk_size = 2, left_context = 2, output
+    tensor([[0., 0., -inf, -inf, -inf, -inf],
+            [0., 0., -inf, -inf, -inf, -inf],
+            [0., 0., 0., 0., -inf, -inf],
+            [0., 0., 0., 0., -inf, -inf],
+            [-inf, -inf, 0., 0., 0., 0.],
+            [-inf, -inf, 0., 0., 0., 0.]])
+    """
+    pos = th.arange(T, device=device)
+    # start of the chunk
+    beg = (pos // chunk_size) * chunk_size
+    mask = pos[None, :] >= beg[:, None] + chunk_size
+    if left_context >= 0:
+        mask |= pos[None, :] < beg[:, None] - left_context
+    return th.zeros(T, T, device=device).masked_fill(mask, float("-inf"))
+
+
 class TransformerEncoder(nn.Module):
     """
     Transformer based encoders. Currently it supports {xfmr|cfmr}_{abs|rel|xl}
@@ -21,6 +45,10 @@ class TransformerEncoder(nn.Module):
         {xfmr|cfmr}_abs <=> inp_sin
         {xfmr|cfmr}_rel <=> rel
         {xfmr|cfmr}_xl  <=> sin
+    If chunk_size > 0, the self-attention is limited to the current chunk and
+    left_context frames (after the projection layer) before it, and the right
+    context of the conformer convolutions out of the chunk is zero padded,
+    which matches the streaming mode (see step())
     """
 
     def __init__(self,
@@ -39,9 +67,14 @@ class TransformerEncoder(nn.Module):
                  ffn_dropout: float = 0.1,
                  kernel_size: int = 16,
                  post_norm: bool = True,
-                 untie_rel: bool = True):
+                 untie_rel: bool = True,
+                 chunk_size: int = -1,
+                 left_context: int = -1):
         super(TransformerEncoder, self).__init__()
         self.type = enc_type.split("_")[-1]
+        self.att_dim = att_dim
+        self.chunk_size = chunk_size
+        self.left_context = left_context
         self.proj = get_xfmr_proj(proj_layer, input_size, att_dim, proj_kwargs)
         self.pose = get_xfmr_pose(enc_type,
                                   att_dim,
@@ -58,7 +91,8 @@ class TransformerEncoder(nn.Module):
                                         ffn_dropout=ffn_dropout,
                                         kernel_size=kernel_size,
                                         pre_norm=not post_norm,
-                                        untie_rel=untie_rel)
+                                        untie_rel=untie_rel,
+                                        chunk_size=chunk_size)
 
     def forward(self, inp_pad: th.Tensor,
                 inp_len: Optional[th.Tensor]) -> EncRetType:
@@ -89,11 +123,126 @@ class TransformerEncoder(nn.Module):
                 inj_pose = self.pose(
                     th.arange(-nframes + 1, nframes, device=enc_inp.device))
             else:
-                inj_pose = self.pose(
-                    th.arange(0, 2 * nframes - 1, 1.0, device=enc_inp.device))
+                inj_pose = self._xl_pose(0, nframes, enc_inp.device)
+        if self.chunk_size > 0:
+            # Ti x Ti
+            src_mask = prep_chunk_mask(enc_inp.shape[0],
+                                       self.chunk_size,
+                                       left_context=self.left_context,
+                                       device=enc_inp.device)
+        else:
+            src_mask = None
         # Ti x N x D
         enc_out = self.encoder(enc_inp,
                                inj_pose=inj_pose,
+                               src_mask=src_mask,
                                src_key_padding_mask=src_pad_mask)
         # N x Ti x D
         return enc_out.transpose(0, 1), inp_len
+
+    def _xl_pose(self, T: int, L: int, device: th.device) -> th.Tensor:
+        """
+        Return the sinusoidal encodings (T+2L-1 x D) used by the xl-attention,
+        T is the number of the history frames and L is the number of the new
+        frames. In chunk mode, the encodings are computed from the relative
+        distances (-T-L+1, ..., L-1), which keeps them same in the streaming
+        mode. Otherwise positions 0, ..., T+2L-2 are used (as the models
+        trained without chunk_size)
+        """
+        if self.chunk_size > 0:
+            return self.pose(th.arange(-T - L + 1, L, 1.0, device=device))
+        else:
+            return self.pose(th.arange(0, T + 2 * L - 1, 1.0, device=device))
+
+    def step(self,
+             chunk: th.Tensor,
+             cache: Optional[Dict] = None) -> Tuple[th.Tensor, Dict]:
+        """
+        Streaming (chunk-wise) inference. The input frames not consumed by the
+        projection layer are kept in the cache, together with the offset and the
+        key & value (conv inputs for conformer) of each layer. Only the last
+        left_context frames are cached if left_context >= 0. If chunk_size > 0,
+        the new frames are processed chunk by chunk (so the chunk could have
+        any size), to match forward(), each call (except the last one) should
+        end at the chunk boundary
+        Args:
+            chunk: N x Tc x F, the new feature frames
+            cache: None (first chunk) or dict, cache of the history chunks
+        Return:
+            enc_out: N x L x D (L could be 0 if the frames are not enough)
+            cache: updated cache
+        """
+        if not hasattr(self.proj, "receptive_field"):
+            raise RuntimeError("Projection layer " +
+                               f"{self.proj.__class__.__name__} doesn't " +
+                               "support streaming mode")
+        if chunk.dim() != 3:
+            raise RuntimeError(
+                f"Expect 3D tensor in streaming mode, got {chunk.dim()}")
+        if cache is None:
+            cache = {"feats": None, "offset": 0, "layers": None}
+        else:
+            cache = cache.copy()
+        if cache["feats"] is not None:
+            chunk = th.cat([cache["feats"], chunk], 1)
+        ctx, stride = self.proj.receptive_field, self.proj.subsampling
+        num_frames = chunk.shape[1]
+        L = (num_frames - ctx) // stride + 1 if num_frames >= ctx else 0
+        cache["feats"] = chunk[:, L * stride:]
+        if L == 0:
+            return chunk.new_zeros(chunk.shape[0], 0, self.att_dim), cache
+        # N x L x D
+        enc_inp = self.proj(chunk[:, :(L - 1) * stride + ctx])
+        if self.chunk_size <= 0:
+            return self._step_frames(enc_inp, cache)
+        # split the frames at the chunk boundaries, as the self-attention &
+        # convolutions are limited to the chunk in forward()
+        enc_out = []
+        beg = 0
+        while beg < L:
+            end = min(beg + self.chunk_size -
+                      cache["offset"] % self.chunk_size, L)
+            out, cache = self._step_frames(enc_inp[:, beg:end], cache)
+            enc_out.append(out)
+            beg = end
+        return th.cat(enc_out, 1), cache
+
+    def _step_frames(self, enc_inp: th.Tensor,
+                     cache: Dict) -> Tuple[th.Tensor, Dict]:
+        """
+        Go through the encoder layers in the streaming mode
+        Args:
+            enc_inp: N x L x D, the new frames (after projection layer)
+            cache: cache of the history chunks
+        Return:
+            enc_out: N x L x D
+            cache: updated cache
+        """
+        L = enc_inp.shape[1]
+        layers = cache["layers"]
+        # number of the frames in the cache
+        T = 0 if layers is None else layers[0][0].shape[0]
+        if self.type == "abs":
+            # L x N x D
+            enc_inp = self.pose(enc_inp, t=cache["offset"])
+            inj_pose = None
+        else:
+            # L x N x D
+            enc_inp = enc_inp.transpose(0, 1)
+            # T+2L-1 x D
+            if self.type == "rel":
+                inj_pose = self.pose(
+                    th.arange(-T - L + 1, L, device=enc_inp.device))
+            else:
+                inj_pose = self._xl_pose(T, L, enc_inp.device)
+        # L x N x D
+        enc_out, layers = self.encoder.step(enc_inp,
+                                            cache=layers,
+                                            inj_pose=inj_pose)
+        if self.left_context >= 0:
+            beg = max(T + L - self.left_context, 0)
+            layers = [(c[0][beg:], c[1][beg:]) + c[2:] for c in layers]
+        cache["layers"] = layers
+        cache["offset"] += L
+        # N x L x D
+        return enc_out.transpose(0, 1), cache
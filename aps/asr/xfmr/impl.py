@@ -10,12 +10,13 @@ import torch as th
 import torch.nn as nn
 import torch.nn.functional as tf
 
-from typing import Optional, Tuple
+from typing import Optional, Tuple, List
 from aps.libs import Register
-from aps.asr.xfmr.pose import digit_shift
+from aps.asr.xfmr.pose import digit_shift, rel_gather
 
 TransformerEncoderLayers = Register("xfmr_encoder_layer")
 MHSAReturnType = Tuple[th.Tensor, Optional[th.Tensor]]
+KVType = Tuple[th.Tensor, th.Tensor]
 
 
 class Swish(nn.Module):
@@ -59,6 +60,16 @@ def _get_relative_uv(shape: Tuple[int],
     return rel_mat
 
 
+def _rel_shift(term: th.Tensor, S: int) -> th.Tensor:
+    """
+    Got L x N x H x S from the relative logits, using digit_shift() when L == S
+    (full sequence) and rel_gather() in the streaming mode
+    """
+    if term.shape[0] == S:
+        return digit_shift(term)
+    return rel_gather(term, S)
+
+
 class ApsMultiheadAttention(nn.Module):
     """
     My own MultiheadAttention and make sure it's same as torch.nn.MultiheadAttention
@@ -256,6 +267,63 @@ class ApsMultiheadAttention(nn.Module):
                                               key_padding_mask=key_padding_mask)
         return self.wrap_out(context, weight)
 
+    def step_proj(
+        self,
+        query: th.Tensor,
+        cache: Optional[KVType] = None
+    ) -> Tuple[th.Tensor, th.Tensor, th.Tensor]:
+        """
+        Project the new frames/tokens and concatenate the key & value with
+        the cached ones
+        Args:
+            query (Tensor): L x N x E
+            cache (None or (Tensor, Tensor)): T x N x H x D, history key & value
+        Return:
+            query (Tensor): L x N x H x D
+            key (Tensor): T+L x N x H x D
+            value (Tensor): T+L x N x H x D
+        """
+        # L x N x H x D
+        query, key, value = self.inp_proj(query, query, query)
+        if cache is not None:
+            key = th.cat([cache[0], key], 0)
+            value = th.cat([cache[1], value], 0)
+        return query, key, value
+
+    def step(
+        self,
+        query: th.Tensor,
+        placehold: Optional[th.Tensor],
+        cache: Optional[KVType] = None,
+        key_padding_mask: Optional[th.Tensor] = None,
+        attn_mask: Optional[th.Tensor] = None
+    ) -> Tuple[th.Tensor, th.Tensor, KVType]:
+        """
+        Self-attention on the new frames/tokens with the cached key & value
+        of the history ones (for incremental inference)
+        Args:
+            query (Tensor): L x N x E
+            placehold (None): keep compatiable with rel/xl-attention layer
+            cache (None or (Tensor, Tensor)): T x N x H x D, history key & value
+            key_padding_mask (Tensor): N x T+L
+            attn_mask (Tensor): L x T+L, additional mask
+        Return:
+            context (Tensor): L x N x E
+            weight (Tensor): N x L x T+L
+            cache (Tensor, Tensor): T+L x N x H x D, updated key & value
+        """
+        # query: L x N x H x D
+        # key, value: T+L x N x H x D
+        query, key, value = self.step_proj(query, cache=cache)
+        # L x N x H x T+L
+        logit = self.dot_att(query, key)
+        context, weight = self.context_weight(logit,
+                                              value,
+                                              attn_mask=attn_mask,
+                                              key_padding_mask=key_padding_mask)
+        context, weight = self.wrap_out(context, weight)
+        return context, weight, (key, value)
+
 
 class RelMultiheadAttention(ApsMultiheadAttention):
     """
@@ -280,7 +348,7 @@ class RelMultiheadAttention(ApsMultiheadAttention):
         Args:
             query (Tensor): L x N x H x D
             key (tensor): S x N x H x D
-            key_rel_pose (Tensor): 2L(S)-1 x D
+            key_rel_pose (Tensor): S+L-1 x D (2L-1 x D if L == S)
         Return:
             logit (Tensor): L x N x H x S
         """
@@ -290,11 +358,11 @@ class RelMultiheadAttention(ApsMultiheadAttention):
         #           "...hd,...sd->...hs", query,
         #       th.repeat_interleave(key_rel_pose[:, None], query.shape[1], dim=1))
         #   b) term_b = th.matmul(query, key_rel_pose[:, None].transpose(-1, -2))
-        # 2) key_rel_pose is 2L-1 x D
+        # 2) key_rel_pose is 2L-1 x D (or S+L-1 x D in streaming mode)
         # L x N x H x 2L-1
         term_b = th.matmul(query, key_rel_pose.transpose(0, 1))
         # L x N x H x S
-        return term_a + digit_shift(term_b)
+        return term_a + _rel_shift(term_b, key.shape[0])
 
     def forward(self,
                 query: th.Tensor,
@@ -328,6 +396,36 @@ class RelMultiheadAttention(ApsMultiheadAttention):
                                               key_padding_mask=key_padding_mask)
         return self.wrap_out(context, weight)
 
+    def step(
+        self,
+        query: th.Tensor,
+        key_rel_pose: th.Tensor,
+        cache: Optional[KVType] = None,
+        key_padding_mask: Optional[th.Tensor] = None,
+        attn_mask: Optional[th.Tensor] = None
+    ) -> Tuple[th.Tensor, th.Tensor, KVType]:
+        """
+        Args:
+            query (Tensor): L x N x E
+            key_rel_pose (Tensor): T+2L-1 x D, relative distances -T-L+1, ..., L-1
+            cache (None or (Tensor, Tensor)): T x N x H x D, history key & value
+            key_padding_mask (Tensor): N x T+L
+            attn_mask (Tensor): L x T+L, additional mask
+        Return:
+            context (Tensor): L x N x E
+            weight (Tensor): N x L x T+L
+            cache (Tensor, Tensor): T+L x N x H x D, updated key & value
+        """
+        query, key, value = self.step_proj(query, cache=cache)
+        # L x N x H x T+L
+        logit = self.dot_att(query, key, key_rel_pose)
+        context, weight = self.context_weight(logit,
+                                              value,
+                                              attn_mask=attn_mask,
+                                              key_padding_mask=key_padding_mask)
+        context, weight = self.wrap_out(context, weight)
+        return context, weight, (key, value)
+
 
 class XlMultiheadAttention(ApsMultiheadAttention):
     """
@@ -360,10 +458,10 @@ class XlMultiheadAttention(ApsMultiheadAttention):
         Compute dot attention logits
         Args:
             query (Tensor): L x N x H x D
-            key (tensor): S(L) x N x H x D
-            sin_pose (Tensor): 2L-1 x E
+            key (tensor): S x N x H x D
+            sin_pose (Tensor): S+L-1 x E (2L-1 x E if L == S)
         Return:
-            logit (Tensor): L x N x H x S(L)
+            logit (Tensor): L x N x H x S
         """
         # L x N x H x S
         term_ac = th.einsum("lnhd,snhd->lnhs", query + self.rel_u, key)
@@ -373,7 +471,7 @@ class XlMultiheadAttention(ApsMultiheadAttention):
         # L x N x H x 2S-1
         term_bd = th.einsum("lnhd,shd->lnhs", query + self.rel_v, rel_pos)
         # L x N x H x S
-        return term_ac + digit_shift(term_bd)
+        return term_ac + _rel_shift(term_bd, key.shape[0])
 
     def forward(self,
                 query: th.Tensor,
@@ -405,6 +503,36 @@ class XlMultiheadAttention(ApsMultiheadAttention):
                                               key_padding_mask=key_padding_mask)
         return self.wrap_out(context, weight)
 
+    def step(
+        self,
+        query: th.Tensor,
+        sin_pose: th.Tensor,
+        cache: Optional[KVType] = None,
+        key_padding_mask: Optional[th.Tensor] = None,
+        attn_mask: Optional[th.Tensor] = None
+    ) -> Tuple[th.Tensor, th.Tensor, KVType]:
+        """
+        Args:
+            query (Tensor): L x N x E
+            sin_pose (Tensor): T+2L-1 x E
+            cache (None or (Tensor, Tensor)): T x N x H x D, history key & value
+            key_padding_mask (Tensor): N x T+L
+            attn_mask (Tensor): L x T+L, additional mask
+        Return:
+            context (Tensor): L x N x E
+            weight (Tensor): N x L x T+L
+            cache (Tensor, Tensor): T+L x N x H x D, updated key & value
+        """
+        _, key, value = self.step_proj(query, cache=cache)
+        # L x N x H x T+L, keep consistent with forward()
+        logit = self.dot_att(value[-query.shape[0]:], key, sin_pose)
+        context, weight = self.context_weight(logit,
+                                              value,
+                                              attn_mask=attn_mask,
+                                              key_padding_mask=key_padding_mask)
+        context, weight = self.wrap_out(context, weight)
+        return context, weight, (key, value)
+
 
 class ApsTransformerEncoderLayer(nn.Module):
     """
@@ -462,6 +590,41 @@ class ApsTransformerEncoderLayer(nn.Module):
             src = self.norm2(src + self.feedforward(src))
         return src
 
+    def step(self,
+             src: th.Tensor,
+             inj_pose: Optional[th.Tensor] = None,
+             src_mask: Optional[th.Tensor] = None,
+             src_key_padding_mask: Optional[th.Tensor] = None,
+             cache: Optional[KVType] = None) -> Tuple[th.Tensor, KVType]:
+        """
+        Incremental version of the forward function
+        Args:
+            src (Tensor): L x N x D, the new frames/tokens
+            inj_pose (None or Tensor): injected positional encodings
+            src_mask (None or Tensor): L x T+L
+            src_key_padding_mask (None or Tensor): N x T+L
+            cache (None or (Tensor, Tensor)): key & value of the history T frames/tokens
+        Return:
+            out (Tensor): L x N x D
+            cache (Tensor, Tensor): updated key & value
+        """
+        inp = src
+        if self.pre_norm:
+            src = self.norm1(src)
+        att, _, cache = self.self_attn.step(
+            src,
+            inj_pose,
+            cache=cache,
+            attn_mask=src_mask,
+            key_padding_mask=src_key_padding_mask)
+        src = inp + self.dropout(att)
+        if self.pre_norm:
+            src = src + self.feedforward(self.norm2(src))
+        else:
+            src = self.norm1(src)
+            src = self.norm2(src + self.feedforward(src))
+        return src, cache
+
 
 class ApsConformerEncoderLayer(nn.Module):
     """
@@ -475,9 +638,11 @@ class ApsConformerEncoderLayer(nn.Module):
                  dim_feedforward: int = 2048,
                  dropout: float = 0.1,
                  kernel_size: int = 16,
-                 activation: str = "swish"):
+                 activation: str = "swish",
+                 chunk_size: int = -1):
         super(ApsConformerEncoderLayer, self).__init__()
         self.self_attn = self_attn
+        self.chunk_size = chunk_size
         self.feedforward1 = nn.Sequential(nn.LayerNorm(d_model),
                                           nn.Linear(d_model, dim_feedforward),
                                           _get_activation_fn(activation),
@@ -515,11 +680,74 @@ class ApsConformerEncoderLayer(nn.Module):
         src = self.norm2(inp)
         # T x N x F => N x F x T
         src = th.einsum("tnf->nft", src)
-        out = self.convolution(src)
+        if self.chunk_size > 0:
+            # pointwise conv & GLU
+            src = self.convolution[1](self.convolution[0](src))
+            out = self.convolution[3:](self.chunk_depthwise(src))
+        else:
+            out = self.convolution(src)
         # N x F x T => T x N x F
         out = th.einsum("nft->tnf", out)
         return out
 
+    def chunk_depthwise(self, inp: th.Tensor) -> th.Tensor:
+        """
+        Chunk-wise depthwise conv, the right context out of each chunk is
+        zero padded (same as conv_step())
+        Args:
+            inp (Tensor): N x F x T
+        Return
+            out (Tensor): N x F x T
+        """
+        depthwise = self.convolution[2]
+        K, C = depthwise.padding[0], self.chunk_size
+        N, F, T = inp.shape
+        num_chunks = (T + C - 1) // C
+        # N x F x K+C*num_chunks
+        inp = tf.pad(inp, (K, num_chunks * C - T))
+        # N x F x num_chunks x K+C+K, with left context & zero right context
+        chunks = tf.pad(inp.unfold(-1, K + C, C), (0, K))
+        # N*num_chunks x F x C+2K
+        chunks = chunks.transpose(1, 2).reshape(N * num_chunks, F, -1)
+        # N*num_chunks x F x C
+        out = tf.conv1d(chunks,
+                        depthwise.weight,
+                        bias=depthwise.bias,
+                        groups=depthwise.groups)
+        # N x F x T
+        out = out.view(N, num_chunks, F, C).transpose(1, 2)
+        return out.reshape(N, F, -1)[..., :T]
+
+    def conv_step(
+            self,
+            inp: th.Tensor,
+            cache: Optional[th.Tensor] = None) -> Tuple[th.Tensor, th.Tensor]:
+        """
+        Incremental version of conv(), the left context comes from the cache
+        and the right context out of the chunk is zero padded
+        Args:
+            inp (Tensor): L x N x D
+            cache (None or Tensor): N x D x K, history inputs of the depthwise conv
+        Return:
+            out (Tensor): L x N x D
+            cache (Tensor): N x D x K, updated cache
+        """
+        # L x N x F => N x F x L
+        src = th.einsum("tnf->nft", self.norm2(inp))
+        # pointwise conv & GLU
+        src = self.convolution[1](self.convolution[0](src))
+        depthwise = self.convolution[2]
+        K = depthwise.padding[0]
+        if cache is None:
+            cache = th.zeros_like(src[..., :1]).expand(-1, -1, K)
+        # N x F x K+L
+        src = th.cat([cache, src], -1)
+        # N x F x L
+        out = self.convolution[3:](depthwise(src)[..., K:])
+        # N x F x T => T x N x F
+        out = th.einsum("nft->tnf", out)
+        return out, src[..., -K:]
+
     def forward(self,
                 src: th.Tensor,
                 inj_pose: Optional[th.Tensor] = None,
@@ -552,6 +780,47 @@ class ApsConformerEncoderLayer(nn.Module):
         # layernorm
         return self.norm3(src)
 
+    def step(
+        self,
+        src: th.Tensor,
+        inj_pose: Optional[th.Tensor] = None,
+        src_mask: Optional[th.Tensor] = None,
+        src_key_padding_mask: Optional[th.Tensor] = None,
+        cache: Optional[Tuple[th.Tensor, ...]] = None
+    ) -> Tuple[th.Tensor, Tuple[th.Tensor, ...]]:
+        """
+        Incremental version of the forward function
+        Args:
+            src (Tensor): L x N x D, the new frames
+            inj_pose (None or Tensor): injected positional encodings
+            src_mask (None or Tensor): L x T+L
+            src_key_padding_mask (None or Tensor): N x T+L
+            cache (None or (Tensor, Tensor, Tensor)): key & value of the
+                history T frames and the cache of the convolution module
+        Return:
+            out (Tensor): L x N x D
+            cache (Tensor, Tensor, Tensor): updated cache
+        """
+        # 1) FFN
+        src1 = self.feedforward1(src) * 0.5 + src
+        # self-attention block
+        src2 = self.norm1(src1)
+        att, _, kv = self.self_attn.step(
+            src2,
+            inj_pose,
+            cache=None if cache is None else cache[:2],
+            attn_mask=src_mask,
+            key_padding_mask=src_key_padding_mask)
+        src = src1 + self.dropout(att)
+        # conv
+        conv, conv_cache = self.conv_step(
+            src, cache=None if cache is None else cache[2])
+        src = conv + src
+        # 2) FFN
+        src = self.feedforward2(src) * 0.5 + src
+        # layernorm
+        return self.norm3(src), kv + (conv_cache,)
+
 
 @TransformerEncoderLayers.register("xfmr_abs")
 class TransformerEncoderLayer(ApsTransformerEncoderLayer):
@@ -648,7 +917,8 @@ class ConformerEncoderLayer(ApsConformerEncoderLayer):
                  ffn_dropout: float = 0.1,
                  pre_norm: bool = True,
                  kernel_size: int = 16,
-                 activation: str = "swish") -> None:
+                 activation: str = "swish",
+                 chunk_size: int = -1) -> None:
         self_attn = ApsMultiheadAttention(d_model,
                                           nhead,
                                           dropout=att_dropout,
@@ -659,7 +929,8 @@ class ConformerEncoderLayer(ApsConformerEncoderLayer):
                              dim_feedforward=dim_feedforward,
                              dropout=ffn_dropout,
                              activation=activation,
-                             kernel_size=kernel_size)
+                             kernel_size=kernel_size,
+                             chunk_size=chunk_size)
 
 
 @TransformerEncoderLayers.register("cfmr_rel")
@@ -677,6 +948,7 @@ class ConformerRelEncoderLayer(ApsConformerEncoderLayer):
                  pre_norm: bool = True,
                  kernel_size: int = 16,
                  activation: str = "swish",
+                 chunk_size: int = -1,
                  rel_u: Optional[nn.Parameter] = None,
                  rel_v: Optional[nn.Parameter] = None) -> None:
         self_attn = RelMultiheadAttention(d_model, nhead, dropout=att_dropout)
@@ -686,7 +958,8 @@ class ConformerRelEncoderLayer(ApsConformerEncoderLayer):
                              dim_feedforward=dim_feedforward,
                              dropout=ffn_dropout,
                              activation=activation,
-                             kernel_size=kernel_size)
+                             kernel_size=kernel_size,
+                             chunk_size=chunk_size)
 
 
 @TransformerEncoderLayers.register("cfmr_xl")
@@ -704,6 +977,7 @@ class ConformerXLEncoderLayer(ApsConformerEncoderLayer):
                  pre_norm: bool = True,
                  kernel_size: int = 16,
                  activation: str = "swish",
+                 chunk_size: int = -1,
                  rel_u: Optional[nn.Parameter] = None,
                  rel_v: Optional[nn.Parameter] = None) -> None:
         self_attn = XlMultiheadAttention(d_model,
@@ -717,7 +991,8 @@ class ConformerXLEncoderLayer(ApsConformerEncoderLayer):
                              dim_feedforward=dim_feedforward,
                              dropout=ffn_dropout,
                              activation=activation,
-                             kernel_size=kernel_size)
+                             kernel_size=kernel_size,
+                             chunk_size=chunk_size)
 
 
 class ApsTransformerEncoder(nn.Module):
@@ -753,6 +1028,32 @@ class ApsTransformerEncoder(nn.Module):
 
         return out
 
+    def step(self,
+             src: th.Tensor,
+             cache: Optional[List[KVType]] = None,
+             **kwargs) -> Tuple[th.Tensor, List[KVType]]:
+        """
+        Args:
+            src (Tensor): L x N x D
+            cache (list[(Tensor, Tensor)] or None): key & value cache of each layer
+        Return:
+            out (Tensor): L x N x D
+            cache (list[(Tensor, Tensor)]): updated cache
+        """
+        out = src
+
+        new_cache = []
+        for i, mod in enumerate(self.layers):
+            out, kv = mod.step(out,
+                               cache=None if cache is None else cache[i],
+                               **kwargs)
+            new_cache.append(kv)
+
+        if self.norm is not None:
+            out = self.norm(out)
+
+        return out, new_cache
+
 
 def get_xfmr_encoder(name: str,
                      num_layers: int,
@@ -763,7 +1064,8 @@ def get_xfmr_encoder(name: str,
                      ffn_dropout: float = 0.0,
                      kernel_size: int = 16,
                      pre_norm: bool = True,
-                     untie_rel: bool = True) -> nn.Module:
+                     untie_rel: bool = True,
+                     chunk_size: int = -1) -> nn.Module:
     """
     Return transformer based encoders
     """
@@ -781,6 +1083,7 @@ def get_xfmr_encoder(name: str,
     # for conformer
     if arch == "cfmr":
         enc_kwargs["kernel_size"] = kernel_size
+        enc_kwargs["chunk_size"] = chunk_size
     # for xl-attention
     if att == "xl":
         if not untie_rel:
@@ -8,6 +8,7 @@ import torch as th
 import torch.nn as nn
 import torch.nn.functional as tf
 
+from typing import Union
 from aps.libs import Register
 
 PosEncodings = Register("pos_encodings")
@@ -64,6 +65,30 @@ def digit_shift(term: th.Tensor) -> th.Tensor:
     return term.transpose(1, -1)
 
 
+def rel_gather(term: th.Tensor, S: int) -> th.Tensor:
+    """
+    Got L x N x H x S from tensor L x N x H x S+L-1. It's the general version of
+    digit_shift(), used when the query is the last L frames of the S keys (e.g.,
+    chunk-wise streaming with cached key & value), and equals to digit_shift()
+    when L == S
+    Args:
+        term (Tensor): L x N x H x S+L-1, the relative distances are
+                       -S+1, ..., L-1 on the last axis
+        S (int): number of the keys
+    Return:
+        term (Tensor): L x N x H x S
+    """
+    L, N, H, X = term.shape
+    if S + L - 1 != X:
+        raise RuntimeError("rel_gather: tensor shape should be: " +
+                           f"L x N x H x {S + L - 1}, but got {term.shape}")
+    pos = th.arange(S, device=term.device)
+    # L x S: key_pos - query_pos + S - 1
+    index = pos[None, :] - pos[S - L:, None] + S - 1
+    index = index[:, None, None, :].expand(L, N, H, S)
+    return th.gather(term, -1, index)
+
+
 @PosEncodings.register("xl")
 class SinPosEncoding(nn.Module):
     """
@@ -154,17 +179,27 @@ class InputSinPosEncoding(SinPosEncoding):
         super(InputSinPosEncoding, self).__init__(embed_dim, dropout=dropout)
         self.factor = embed_dim**0.5 if scale_embed else 1
 
-    def forward(self, inp: th.Tensor, t: int = 0) -> th.Tensor:
+    def forward(self,
+                inp: th.Tensor,
+                t: Union[int, th.Tensor] = 0) -> th.Tensor:
         """
         Args:
             inp (Tensor): N x T x D
+            t (int or Tensor): start position (N if tensor, for each sequence)
         Return:
             out (Tensor): T x N x D (for transformer input)
         """
-        # T
-        pos = th.arange(t, t + inp.shape[1], 1.0, device=inp.device)
-        # T x D
-        sin_enc = self._get_sin_pos_enc(pos)
+        if isinstance(t, th.Tensor):
+            N, T, _ = inp.shape
+            # N x T
+            pos = t[:, None] + th.arange(T, device=inp.device)
+            # N x T x D
+            sin_enc = self._get_sin_pos_enc(pos.view(-1).float()).view(N, T, -1)
+        else:
+            # T
+            pos = th.arange(t, t + inp.shape[1], 1.0, device=inp.device)
+            # T x D
+            sin_enc = self._get_sin_pos_enc(pos)
         # add dropout
         out = self.dropout(inp * self.factor + sin_enc)
         # T x N x D
@@ -44,6 +44,9 @@ class LinearProj(nn.Module):
         self.proj = nn.Linear(input_size, embed_dim)
         self.norm = Normalize1d(norm, embed_dim)
         self.drop = nn.Dropout(p=dropout)
+        # used in streaming mode
+        self.receptive_field = 1
+        self.subsampling = 1
 
     def num_frames(self, inp_len: Optional[th.Tensor]) -> Optional[th.Tensor]:
         """
@@ -133,6 +136,11 @@ class Conv2dProj(nn.Module):
         self.conv2 = Conv2d(conv_channels, conv_channels)
         input_size = self.conv2.compute_outp_dim(input_size, 1)
         self.proj = nn.Linear(input_size * conv_channels, embed_dim)
+        # used in streaming mode (no padding on time axis)
+        stride1, stride2 = self.conv1.stride[0], self.conv2.stride[0]
+        self.receptive_field = self.conv1.kernel_size[0] + (
+            self.conv2.kernel_size[0] - 1) * stride1
+        self.subsampling = stride1 * stride2
 
     def check_args(self, inp: th.Tensor) -> NoReturn:
         """
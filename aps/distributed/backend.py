@@ -17,9 +17,12 @@ except ImportError:
 BACKEND = "none"
 
 
-def init(backend) -> NoReturn:
+def init(backend: str, cpu: bool = False) -> NoReturn:
     """
     Set distributed backend
+    Args:
+        backend: torch, horovod or none
+        cpu: train on CPUs or not (use gloo instead of nccl for torch backend)
     """
     if backend not in ["torch", "horovod", "none"]:
         raise ValueError(f"Unsupported backend: {backend}")
@@ -33,7 +36,7 @@ def init(backend) -> NoReturn:
                 raise RuntimeError(
                     f"Not found in {env} environments, using python "
                     "-m torch.distributed.launch to launch the command")
-        dist.init_process_group(backend="nccl",
+        dist.init_process_group(backend="gloo" if cpu else "nccl",
                                 init_method="env://",
                                 rank=int(environ["LOCAL_RANK"]),
                                 world_size=int(environ["WORLD_SIZE"]))
@@ -74,7 +74,8 @@ class ApsModules(object):
         "bss.dccrn", "bss.dprnn", "bss.tasnet", "bss.xfmr", "bss.dense_unet"
     ]
     loader_submodules = [
-        "am.kaldi", "am.raw", "se.chunk", "se.online", "lm.utt", "lm.bptt"
+        "am.kaldi", "am.raw", "se.chunk", "se.online", "se.packed", "lm.utt",
+        "lm.bptt"
     ]
     asr = Module("aps.asr", asr_submodules)
     sse = Module("aps.sse", sse_submodules)
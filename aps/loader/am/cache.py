@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+# Copyright 2020 Jian Wu
+# License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+"""
+Memory-mapped feature cache (outputs of the deterministic stages in asr
+FeatureTransform, see cmd/cache_feats.py)
+"""
+import numpy as np
+
+from pathlib import Path
+from typing import Iterable, Tuple, Union
+
+
+def write_feature_cache(feats: Iterable[Tuple[str, np.ndarray]],
+                        cache_dir: Union[str, Path],
+                        key: str,
+                        dtype: str = "float32") -> int:
+    """
+    Write the features to a flat array ({cache_dir}/feats.bin) with the
+    index ({cache_dir}/feats.idx, in npy format, offset/#channel/#frame/#bin
+    of each utterance) and the utterance list ({cache_dir}/utt.list)
+    Args:
+        feats: iterable of (utterance, feature (C x T x F or T x F))
+        cache_dir: directory of the feature cache
+        key: hash key of the feature transform
+        dtype: data type of the cached features
+    Return:
+        num_utts: number of utterances written
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    index = []
+    offset = 0
+    with open(cache_dir / "feats.bin", "wb") as bin_f, \
+            open(cache_dir / "utt.list", "w") as utt_f:
+        for utt, mat in feats:
+            if mat.ndim not in [2, 3]:
+                raise RuntimeError(f"Expect 2/3D features, got {mat.ndim}D")
+            # use -1 for single channel features
+            C = mat.shape[0] if mat.ndim == 3 else -1
+            index.append([offset, C, mat.shape[-2], mat.shape[-1]])
+            np.ascontiguousarray(mat, dtype=dtype).tofile(bin_f)
+            offset += mat.size
+            utt_f.write(f"{utt}\n")
+    with open(cache_dir / "feats.idx", "wb") as idx_f:
+        np.save(idx_f, np.array(index, dtype=np.int64).reshape(-1, 4))
+    with open(cache_dir / "meta", "w") as meta_f:
+        meta_f.write(f"key {key}\ndtype {dtype}\n")
+    return len(index)
+
+
+class FeatureCache(object):
+    """
+    Reader of the feature cache. The features are memory-mapped, so the
+    workers share the pages of the cache
+    Args:
+        cache_dir: directory of the feature cache
+    """
+
+    def __init__(self, cache_dir: Union[str, Path]) -> None:
+        cache_dir = Path(cache_dir)
+        with open(cache_dir / "meta", "r") as meta_f:
+            meta = dict(line.split() for line in meta_f)
+        self.key = meta["key"]
+        self.dtype = meta["dtype"]
+        self.bin_path = cache_dir / "feats.bin"
+        # N x 4
+        self.index = np.load(cache_dir / "feats.idx", mmap_mode="r")
+        with open(cache_dir / "utt.list", "r") as utt_f:
+            self.utt2idx = {utt.strip(): idx for idx, utt in enumerate(utt_f)}
+        self.mmap = None
+
+    @property
+    def feats(self) -> np.ndarray:
+        # opened lazily, in each worker process
+        if self.mmap is None:
+            self.mmap = np.memmap(self.bin_path, dtype=self.dtype, mode="r")
+        return self.mmap
+
+    def __contains__(self, utt: str) -> bool:
+        return utt in self.utt2idx
+
+    def __len__(self) -> int:
+        return len(self.utt2idx)
+
+    def __getitem__(self, utt: str) -> np.ndarray:
+        """
+        Return the cached feature, (C) x T x F (in float32)
+        """
+        offset, C, T, F = self.index[self.utt2idx[utt]].tolist()
+        shape = (T, F) if C < 0 else (C, T, F)
+        size = T * F * max(C, 1)
+        mat = self.feats[offset:offset + size].reshape(shape)
+        return mat.astype(np.float32)
@@ -10,7 +10,8 @@ import torch as th
 from torch.nn.utils.rnn import pad_sequence
 from typing import Dict, Iterable, Optional
 from kaldi_python_io import ScriptReader
-from aps.loader.am.utils import AsrDataset, AsrDataLoader
+from aps.loader.ark import MmapArkReader
+from aps.loader.am.utils import AsrDataset, AsrDataLoader, pad_arrays
 from aps.libs import ApsRegisters
 from aps.const import IGNORE_ID
 
@@ -21,6 +22,7 @@ def DataLoader(train: bool = True,
                feats_scp: str = "",
                text: str = "",
                utt2num_frames: str = "",
+               mmap_ark: bool = False,
                vocab_dict: Optional[Dict] = None,
                max_dur: float = 3000,
                min_dur: float = 40,
@@ -40,6 +42,7 @@ def DataLoader(train: bool = True,
         feats_scp: path of the feature script
         text: path of the text/token file
         utt2num_frames: path of the utt2num_frames file
+        mmap_ark: load the features from the memory-mapped archives
         skip_utts: skips utterances if the key is in this file
         vocab_dict: vocabulary dictionary object
         {min|max}_dur: discard utterance when #num_frames not in [min_dur, max_dur]
@@ -54,6 +57,7 @@ def DataLoader(train: bool = True,
                       text,
                       utt2num_frames,
                       vocab_dict,
+                      mmap_ark=mmap_ark,
                       skip_utts=skip_utts,
                       min_token_num=min_token_num,
                       max_token_num=max_token_num,
@@ -79,6 +83,7 @@ class Dataset(AsrDataset):
         text: path of the text/token file
         utt2dur: path of the duration file (should be utt2num_frames here)
         vocab_dict: vocabulary dictionary object
+        mmap_ark: load the features from the memory-mapped archives
         skip_utts: skips utterances if the key is in this file
         {min|max}_token_num: filter the utterances if the token number not in [#min_token_num, #max_token_num]
         {min|max}_frame_num: discard utterance when #num_frames not in [#min_frame_num, #max_frame_num]
@@ -89,12 +94,16 @@ class Dataset(AsrDataset):
                  text: str,
                  utt2num_frames: str,
                  vocab_dict: Optional[Dict],
+                 mmap_ark: bool = False,
                  skip_utts: str = "",
                  min_token_num: int = 1,
                  max_token_num: int = 400,
                  max_frame_num: float = 3000,
                  min_frame_num: float = 40) -> None:
-        feats_reader = ScriptReader(feats_scp)
+        if mmap_ark:
+            feats_reader = MmapArkReader(feats_scp)
+        else:
+            feats_reader = ScriptReader(feats_scp)
         super(Dataset, self).__init__(feats_reader,
                                       text,
                                       utt2num_frames,
@@ -127,7 +136,7 @@ def egs_collate(egs: Dict) -> Dict:
         "#tok":  # add 1 as during training we pad sos
             sum([int(eg["len"]) + 1 for eg in egs]),
         "src_pad":
-            pad_seq([th.from_numpy(eg["inp"].copy()) for eg in egs], value=0),
+            pad_arrays([eg["inp"] for eg in egs], axis=0),
         "tgt_pad":
             pad_seq([th.as_tensor(eg["ref"]) for eg in egs], value=IGNORE_ID),
         "src_len":
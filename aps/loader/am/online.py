@@ -7,7 +7,7 @@ Online simulation dataloader for ASR
 """
 import numpy as np
 
-from typing import Optional, Dict, Iterable
+from typing import Optional, Dict, Iterable, Union
 from aps.loader.am.utils import AsrDataset, AsrDataLoader
 from aps.loader.se.online import SimuOptionsDataset
 from aps.loader.am.raw import egs_collate
@@ -31,7 +31,9 @@ def DataLoader(train: bool = True,
                batch_mode: str = "adaptive",
                num_workers: int = 0,
                max_batch_size: int = 32,
-               min_batch_size: int = 4) -> Iterable[Dict]:
+               min_batch_size: int = 4,
+               cache_size: float = 256,
+               conv_method: Optional[str] = None) -> Iterable[Dict]:
     """
     Return the online simulation dataloader (for AM training)
     Args:
@@ -49,6 +51,8 @@ def DataLoader(train: bool = True,
         num_workers: number of the workers
         max_batch_size: maximum #batch_size
         min_batch_size: minimum #batch_size
+        cache_size: size (MB) of the RIR/noise cache in each worker
+        conv_method: if not None, override --conv-method in simu_cfg
     """
     dataset = Dataset(simu_cfg,
                       text,
@@ -57,7 +61,9 @@ def DataLoader(train: bool = True,
                       skip_utts=skip_utts,
                       max_token_num=max_token_num,
                       max_wav_dur=max_dur,
-                      min_wav_dur=min_dur)
+                      min_wav_dur=min_dur,
+                      cache_size=cache_size,
+                      conv_method=conv_method)
     return AsrDataLoader(dataset,
                          egs_collate,
                          shuffle=train,
@@ -75,20 +81,29 @@ class AsrSimuReader(SimuOptionsDataset):
     Simulation audio reader for ASR task
     Args:
         simu_cfg: path of the audio simulation configuraton file
+        cache_size: size (MB) of the RIR/noise cache
+        conv_method: if not None, override --conv-method in simu_cfg
     """
 
-    def __init__(self, simu_cfg: str) -> None:
-        super(AsrSimuReader, self).__init__(simu_cfg, return_in_egs=["mix"])
+    def __init__(self,
+                 simu_cfg: str,
+                 cache_size: float = 256,
+                 conv_method: Optional[str] = None) -> None:
+        super(AsrSimuReader, self).__init__(simu_cfg,
+                                            return_in_egs=["mix"],
+                                            cache_size=cache_size,
+                                            conv_method=conv_method)
 
-    def __getitem__(self, index: int) -> np.ndarray:
+    def __getitem__(self, index: Union[int, str]) -> np.ndarray:
         """
         Args:
-            index: index ID
+            index: index ID or key
         Return:
             egs: simulated audio
         """
-        opts_str = self.simu_cfg[index]
-        return self._simu(opts_str)["mix"]
+        if isinstance(index, int):
+            index = self.simu_cfg.index_keys[index]
+        return self._simu(index)["mix"]
 
 
 class Dataset(AsrDataset):
@@ -104,6 +119,8 @@ class Dataset(AsrDataset):
         {min|max}_token_num: filter the utterances if the token number not in [#min_token_num, #max_token_num]
         {min|max}_wav_dur: discard utterance when duration is not in [#min_wav_dur, #max_wav_dur]
         adapt_wav_dur|adapt_token_num: used in adaptive mode
+        cache_size: size (MB) of the RIR/noise cache
+        conv_method: if not None, override --conv-method in simu_cfg
     """
 
     def __init__(self,
@@ -117,8 +134,12 @@ class Dataset(AsrDataset):
                  max_wav_dur: float = 30,
                  min_wav_dur: float = 0.4,
                  adapt_wav_dur: float = 8,
-                 adapt_token_num: int = 150) -> None:
-        audio_reader = AsrSimuReader(simu_cfg)
+                 adapt_token_num: int = 150,
+                 cache_size: float = 256,
+                 conv_method: Optional[str] = None) -> None:
+        audio_reader = AsrSimuReader(simu_cfg,
+                                     cache_size=cache_size,
+                                     conv_method=conv_method)
         super(Dataset, self).__init__(audio_reader,
                                       text,
                                       utt2dur,
@@ -7,9 +7,11 @@ Dataloader for raw waveforms in asr tasks
 """
 import torch as th
 
+from functools import partial
 from torch.nn.utils.rnn import pad_sequence
 from typing import Dict, Iterable, Optional
-from aps.loader.am.utils import AsrDataset, AsrDataLoader
+from aps.loader.am.utils import AsrDataset, AsrDataLoader, pad_arrays
+from aps.loader.am.cache import FeatureCache
 from aps.loader.audio import AudioReader
 from aps.const import IGNORE_ID
 from aps.libs import ApsRegisters
@@ -23,6 +25,11 @@ def DataLoader(train: bool = True,
                channel: int = -1,
                text: str = "",
                utt2dur: str = "",
+               dur_cache: str = "",
+               feats_cache: str = "",
+               pipe_cache: str = "",
+               pipe_prefetch: int = 0,
+               mmap_ark: bool = False,
                vocab_dict: Optional[Dict] = None,
                min_token_num: int = 1,
                max_token_num: int = 400,
@@ -44,7 +51,13 @@ def DataLoader(train: bool = True,
         channel: which channel to load, -1 means all
         wav_scp: path of the audio script
         text: path of the token file
-        utt2dur: path of the duration file
+        utt2dur: path of the duration file, if empty, probe it from the audio headers
+        dur_cache: path of the duration cache used when utt2dur is empty
+        feats_cache: directory of the feature cache (see cmd/cache_feats.py),
+                     if assigned, load the cached features instead of audio
+        pipe_cache: cache directory of the command pipe outputs in wav_scp
+        pipe_prefetch: maximum number of the command pipes running in parallel
+        mmap_ark: load the wav.ark entries from the memory-mapped archives
         vocab_dict: dictionary object
         skip_utts: skips utterances that the file shows
         {min|max}_token_num: filter the utterances if the token number not in [#min_token_num, #max_token_num]
@@ -61,13 +74,22 @@ def DataLoader(train: bool = True,
                       vocab_dict,
                       sr=sr,
                       channel=channel,
+                      dur_cache=dur_cache,
+                      feats_cache=feats_cache,
+                      pipe_cache=pipe_cache,
+                      pipe_prefetch=pipe_prefetch,
+                      mmap_ark=mmap_ark,
                       skip_utts=skip_utts,
                       min_token_num=min_token_num,
                       max_token_num=max_token_num,
                       max_wav_dur=max_dur,
                       min_wav_dur=min_dur)
+    if feats_cache:
+        collate = partial(feats_collate, key=dataset.input_reader.key)
+    else:
+        collate = egs_collate
     return AsrDataLoader(dataset,
-                         egs_collate,
+                         collate,
                          shuffle=train,
                          distributed=distributed,
                          num_workers=num_workers,
@@ -84,10 +106,15 @@ class Dataset(AsrDataset):
     Args:
         wav_scp: path of the audio script
         text: path of the token file
-        utt2dur: path of the duration file
+        utt2dur: path of the duration file, if empty, probe it from the audio headers
         vocab_dict: vocabulary dictionary object
         sr: sample rate of the audio
         channel: which channel to load, -1 means all
+        dur_cache: path of the duration cache used when utt2dur is empty
+        feats_cache: directory of the feature cache (load features if assigned)
+        pipe_cache: cache directory of the command pipe outputs in wav_scp
+        pipe_prefetch: maximum number of the command pipes running in parallel
+        mmap_ark: load the wav.ark entries from the memory-mapped archives
         skip_utts: skips utterances that the file shows
         audio_norm: loading normalized samples (-1, 1) when reading audio
         {min|max}_token_num: filter the utterances if the token number not in [#min_token_num, #max_token_num]
@@ -102,6 +129,11 @@ class Dataset(AsrDataset):
                  vocab_dict: Optional[Dict],
                  sr: int = 16000,
                  channel: int = -1,
+                 dur_cache: str = "",
+                 feats_cache: str = "",
+                 pipe_cache: str = "",
+                 pipe_prefetch: int = 0,
+                 mmap_ark: bool = False,
                  skip_utts: str = "",
                  audio_norm: bool = True,
                  min_token_num: int = 1,
@@ -113,17 +145,36 @@ class Dataset(AsrDataset):
         audio_reader = AudioReader(wav_scp,
                                    sr=sr,
                                    channel=channel,
-                                   norm=audio_norm)
-        super(Dataset, self).__init__(audio_reader,
+                                   norm=audio_norm,
+                                   pipe_cache=pipe_cache,
+                                   pipe_prefetch=pipe_prefetch,
+                                   mmap_ark=mmap_ark)
+        if not utt2dur:
+            utt2dur = audio_reader.durations(cache=dur_cache)
+        # skip audio decoding & feature extraction
+        if feats_cache:
+            input_reader = FeatureCache(feats_cache)
+        else:
+            input_reader = audio_reader
+        super(Dataset, self).__init__(input_reader,
                                       text,
                                       utt2dur,
                                       vocab_dict,
                                       max_dur=max_wav_dur,
                                       min_dur=min_wav_dur,
-                                      dur_axis=0,
+                                      dur_axis=-2 if feats_cache else 0,
                                       skip_utts=skip_utts,
                                       min_token_num=min_token_num,
                                       max_token_num=max_token_num)
+        if feats_cache:
+            missing = [
+                tok["key"]
+                for tok in self.token_reader.token_list
+                if tok["key"] not in input_reader
+            ]
+            if missing:
+                raise RuntimeError(f"{len(missing)} utterances are not " +
+                                   f"found in the feature cache {feats_cache}")
 
 
 def egs_collate(egs: Dict) -> Dict:
@@ -138,17 +189,7 @@ def egs_collate(egs: Dict) -> Dict:
     """
 
     def pad_seq(seq, value=0):
-        peek_dim = seq[0].dim()
-        assert peek_dim in [1, 2]
-        # C x S => S x C
-        if peek_dim == 2:
-            seq = [s.transpose(0, 1) for s in seq]
-        # N x S x C
-        pad_mat = pad_sequence(seq, batch_first=True, padding_value=value)
-        # N x (C) x S
-        if peek_dim == 2:
-            pad_mat = pad_mat.transpose(1, 2)
-        return pad_mat
+        return pad_sequence(seq, batch_first=True, padding_value=value)
 
     egs = {
         "#utt":
@@ -156,7 +197,7 @@ def egs_collate(egs: Dict) -> Dict:
         "#tok":  # add 1 as during training we pad sos
             sum([int(eg["len"]) + 1 for eg in egs]),
         "src_pad":
-            pad_seq([th.from_numpy(eg["inp"]) for eg in egs], value=0),
+            pad_arrays([eg["inp"] for eg in egs], axis=-1),
         "tgt_pad":
             pad_seq([th.as_tensor(eg["ref"]) for eg in egs], value=IGNORE_ID),
         "src_len":
@@ -165,3 +206,31 @@ def egs_collate(egs: Dict) -> Dict:
             th.tensor([eg["len"] for eg in egs], dtype=th.int64)
     }
     return egs
+
+
+def feats_collate(egs: Dict, key: str = "") -> Dict:
+    """
+    Batch collate function for the cached features, return dict object with
+    the same keys as egs_collate, except:
+        src_pad: cached features, N x (C) x T x F
+        src_len: number of the frames, N
+        cached: hash key of the feature cache
+    """
+    return {
+        "#utt":
+            len(egs),
+        "#tok":  # add 1 as during training we pad sos
+            sum([int(eg["len"]) + 1 for eg in egs]),
+        "src_pad":
+            pad_arrays([eg["inp"] for eg in egs], axis=-2),
+        "tgt_pad":
+            pad_sequence([th.as_tensor(eg["ref"]) for eg in egs],
+                         batch_first=True,
+                         padding_value=IGNORE_ID),
+        "src_len":
+            th.tensor([eg["dur"] for eg in egs], dtype=th.int64),
+        "tgt_len":
+            th.tensor([eg["len"] for eg in egs], dtype=th.int64),
+        "cached":
+            key
+    }
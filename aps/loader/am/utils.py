@@ -4,14 +4,16 @@
 # License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
 
 import warnings
+import numpy as np
 import torch as th
 
 import torch.utils.data as dat
 import aps.distributed as dist
 
-from typing import Dict, List, Tuple, NoReturn, Optional, Callable
+from typing import Dict, List, Tuple, NoReturn, Optional, Callable, Union
 from kaldi_python_io import Reader as BaseReader
 from aps.const import UNK_TOKEN
+from aps.loader.audio import AudioReader
 
 
 def derive_indices(num_batches: int,
@@ -37,6 +39,32 @@ def derive_indices(num_batches: int,
         return indices
 
 
+def pad_arrays(seq: List[np.ndarray],
+               axis: int = 0,
+               value: float = 0) -> th.Tensor:
+    """
+    Pad the arrays along the axis and stack them to a tensor (N x ...). The
+    arrays are copied to the padded one directly, so the read-only views (e.g.,
+    from the memory-mapped archives) are supported without the extra copy
+    Args:
+        seq: list of the arrays, with the same shape except the padding axis
+        axis: padding axis of the arrays
+        value: padding value
+    Return:
+        pad_mat: padded tensor
+    """
+    peek = seq[0]
+    axis = axis % peek.ndim
+    shape = list(peek.shape)
+    shape[axis] = max([arr.shape[axis] for arr in seq])
+    pad_mat = np.full([len(seq)] + shape, value, dtype=peek.dtype)
+    for n, arr in enumerate(seq):
+        index = [n] + [slice(None)] * peek.ndim
+        index[axis + 1] = slice(0, arr.shape[axis])
+        pad_mat[tuple(index)] = arr
+    return th.from_numpy(pad_mat)
+
+
 class AsrDataset(dat.Dataset):
     """
     A base dataset class for AM training
@@ -44,7 +72,7 @@ class AsrDataset(dat.Dataset):
     Args:
         input_reader: source feature reader instance
         text: path of the token file
-        utt2dur: path of the duration file
+        utt2dur: path of the duration file (or key => duration dict)
         vocab_dict: vocabulary dictionary object
         dur_axis: duration axis index for input_reader
         skip_utts: skips utterances that the file shows
@@ -55,7 +83,7 @@ class AsrDataset(dat.Dataset):
     def __init__(self,
                  input_reader,
                  text: str,
-                 utt2dur: str,
+                 utt2dur: Union[str, Dict[str, float]],
                  vocab_dict: Optional[Dict],
                  dur_axis: int = -1,
                  skip_utts: str = "",
@@ -73,10 +101,30 @@ class AsrDataset(dat.Dataset):
                                         max_token_num=max_token_num,
                                         min_token_num=min_token_num)
         self.dur_axis = dur_axis
+        # end index of the batch that each utterance belongs to
+        self.batch_end = None
+
+    def set_batches(self, batches: List[Tuple[int, int]]) -> NoReturn:
+        """
+        Assign the batch boundaries (contiguous in token_reader)
+        """
+        self.batch_end = np.zeros(len(self), dtype=np.int64)
+        for beg, end in batches:
+            self.batch_end[beg:end] = end
 
     def __getitem__(self, idx: int) -> Dict:
         tok = self.token_reader[idx]
         key = tok["key"]
+        # the batches are contiguous in token_reader, prefetch the following
+        # command pipes of the current batch in advance (see
+        # AudioReader.prefetch)
+        if isinstance(self.input_reader,
+                      AudioReader) and self.input_reader.pipe_prefetch > 0:
+            end = idx + self.input_reader.pipe_prefetch
+            if self.batch_end is not None:
+                end = min(end, self.batch_end[idx])
+            self.input_reader.prefetch(
+                [t["key"] for t in self.token_reader.token_list[idx:end]])
         inp = self.input_reader[key]
         return {
             "dur": inp.shape[self.dur_axis],
@@ -100,7 +148,7 @@ class TokenReader(object):
 
     def __init__(self,
                  text: str,
-                 utt2dur: str,
+                 utt2dur: Union[str, Dict[str, float]],
                  vocab_dict: Optional[Dict],
                  max_token_num: int = 400,
                  min_token_num: int = 2,
@@ -122,7 +170,7 @@ class TokenReader(object):
 
     def _pre_process(self,
                      text: str,
-                     utt2dur: str,
+                     utt2dur: Union[str, Dict[str, float]],
                      max_token_num: int = 400,
                      min_token_num: int = 2,
                      skip_utts: str = "",
@@ -136,7 +184,8 @@ class TokenReader(object):
                 skip_keys = [k.strip() for k in skip_fd.readlines()]
         else:
             skip_keys = []
-        utt2dur = BaseReader(utt2dur, value_processor=float)
+        if isinstance(utt2dur, str):
+            utt2dur = BaseReader(utt2dur, value_processor=float)
         if self.vocab_dict:
             text_reader = BaseReader(text, num_tokens=-1, restrict=False)
         else:
@@ -325,6 +374,7 @@ class AsrDataLoader(dat.DataLoader):
                                distributed=distributed,
                                min_batch_size=min_batch_size,
                                adapt_token_num=adapt_token_num)
+        dataset.set_batches(sampler.batches)
         super(AsrDataLoader, self).__init__(dataset,
                                             collate_fn=collate_fn,
                                             num_workers=num_workers,
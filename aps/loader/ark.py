@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+# Copyright 2020 Jian Wu
+# License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+"""
+Memory-mapped backend of the archives (wav.ark & kaldi's ark). The headers of
+the entries (path:offset in the scripts) are parsed once and the payloads are
+returned as the numpy views of the memory-mapped archives
+"""
+import os
+import mmap
+import struct
+
+import numpy as np
+
+from typing import Dict, Optional, Tuple, NamedTuple
+from kaldi_python_io import ScriptReader
+
+WAV_FORMAT_PCM = 1
+WAV_FORMAT_FLOAT = 3
+WAV_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class ArkEntry(NamedTuple):
+    """
+    Entry of the archive: payload offset, shape & data type (and sample
+    rate for the wav.ark)
+    """
+    path: str
+    offset: int
+    shape: Tuple[int, ...]
+    dtype: str
+    sr: int = 0
+
+
+class MmapManager(object):
+    """
+    Maintain the memory-mapped archives (opened lazily, in each process)
+    """
+
+    def __init__(self) -> None:
+        self.pid = os.getpid()
+        self.mmaps = {}
+
+    def __getitem__(self, path: str) -> mmap.mmap:
+        if os.getpid() != self.pid:
+            self.pid = os.getpid()
+            self.mmaps = {}
+        if path not in self.mmaps:
+            with open(path, "rb") as ark:
+                self.mmaps[path] = mmap.mmap(ark.fileno(),
+                                             0,
+                                             access=mmap.ACCESS_READ)
+        return self.mmaps[path]
+
+    def view(self, entry: ArkEntry) -> np.ndarray:
+        """
+        Return the (read-only) payload of the entry
+        """
+        count = int(np.prod(entry.shape))
+        arr = np.frombuffer(self[entry.path],
+                            dtype=entry.dtype,
+                            count=count,
+                            offset=entry.offset)
+        return arr.reshape(entry.shape)
+
+
+def parse_wav_header(buf: mmap.mmap, offset: int) -> Optional[Tuple]:
+    """
+    Parse the RIFF header of the wav starting at offset
+    Return:
+        (payload offset, (#samples, #channel), data type, sample rate) or None
+        if it's not supported
+    """
+    if buf[offset:offset + 4] != b"RIFF" or buf[offset + 8:offset +
+                                                12] != b"WAVE":
+        return None
+    pos = offset + 12
+    fmt = None
+    while pos + 8 <= len(buf):
+        chunk_id = buf[pos:pos + 4]
+        chunk_size, = struct.unpack("<I", buf[pos + 4:pos + 8])
+        pos += 8
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", buf[pos:pos + 16])
+            if fmt[0] == WAV_FORMAT_EXTENSIBLE and chunk_size >= 26:
+                # sub-format GUID starts with the format code
+                sub_fmt, = struct.unpack("<H", buf[pos + 24:pos + 26])
+                fmt = (sub_fmt,) + fmt[1:]
+        elif chunk_id == b"data":
+            if fmt is None:
+                return None
+            audio_fmt, num_channels, sr, _, _, bits = fmt
+            if (audio_fmt, bits) == (WAV_FORMAT_PCM, 16):
+                dtype = "<i2"
+            elif (audio_fmt, bits) == (WAV_FORMAT_FLOAT, 32):
+                dtype = "<f4"
+            else:
+                return None
+            # 0xFFFFFFFF for the streaming wav (e.g., sox ... -t wav -)
+            if chunk_size == 0xFFFFFFFF:
+                return None
+            num_samples = chunk_size // (bits // 8) // num_channels
+            return (pos, (num_samples, num_channels), dtype, sr)
+        # padded to even size
+        pos += chunk_size + (chunk_size & 1)
+    return None
+
+
+def parse_kaldi_header(buf: mmap.mmap, offset: int) -> Optional[Tuple]:
+    """
+    Parse the header of the kaldi's binary matrix/vector starting at offset
+    Return:
+        (payload offset, shape, data type) or None if it's not supported
+    """
+    if buf[offset:offset + 2] != b"\0B":
+        return None
+    token = buf[offset + 2:offset + 5]
+    if token not in [b"FM ", b"DM ", b"FV ", b"DV "]:
+        # e.g., the compressed matrix
+        return None
+    dtype = "<f4" if token[0:1] == b"F" else "<f8"
+    pos = offset + 5
+    shape = []
+    for _ in range(2 if token[1:2] == b"M" else 1):
+        if buf[pos:pos + 1] != b"\4":
+            return None
+        shape.append(struct.unpack("<i", buf[pos + 1:pos + 5])[0])
+        pos += 5
+    return (pos, tuple(shape), dtype)
+
+
+def parse_ark_table(addrs: Dict[str, Tuple[str, int]],
+                    mngr: MmapManager,
+                    wav: bool = True) -> Dict[str, ArkEntry]:
+    """
+    Parse the headers of the ark entries
+    Args:
+        addrs: key => (path, offset)
+        mngr: memory-mapped archives
+        wav: wav.ark or kaldi's ark
+    Return:
+        table: key => ArkEntry for the supported entries
+    """
+    table = {}
+    for key, (path, offset) in addrs.items():
+        if wav:
+            header = parse_wav_header(mngr[path], offset)
+        else:
+            header = parse_kaldi_header(mngr[path], offset)
+        if header is None:
+            continue
+        table[key] = ArkEntry(path, *header)
+    return table
+
+
+class MmapArkReader(ScriptReader):
+    """
+    Memory-mapped reader of the kaldi's feature script (float/double matrix
+    or vector, others, e.g., the compressed matrix, fall back to the
+    ScriptReader). The returned features are read-only numpy views
+    Args:
+        ark_scp: path of the kaldi's script
+    """
+
+    def __init__(self, ark_scp: str) -> None:
+        super(MmapArkReader, self).__init__(ark_scp)
+        self.mngr = MmapManager()
+        self.table = parse_ark_table(self.index_dict, self.mngr, wav=False)
+
+    def _load(self, key: str) -> np.ndarray:
+        if key in self.table:
+            return self.mngr.view(self.table[key])
+        return super(MmapArkReader, self)._load(key)
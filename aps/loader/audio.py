@@ -5,14 +5,37 @@
 
 import io
 import os
+import signal
+import hashlib
+import tempfile
 import subprocess
+import multiprocessing.util as mp_util
 
 import numpy as np
 import soundfile as sf
 import scipy.signal as ss
+import aps.distributed as dist
 
 from kaldi_python_io import Reader as BaseReader
-from typing import Optional, IO, Union, Any, NoReturn, Tuple
+from aps.loader.ark import MmapManager, parse_ark_table
+from typing import Optional, IO, Union, Any, NoReturn, Tuple, Dict, List
+
+
+def _kill_pipes(running: Dict) -> NoReturn:
+    """
+    Kill the running command pipes and remove their outputs
+    """
+    while running:
+        _, (p, output, stderr) = running.popitem()
+        if p.poll() is None:
+            try:
+                os.killpg(p.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        p.wait()
+        stderr.close()
+        if os.path.exists(output):
+            os.remove(output)
 
 
 def read_audio(fname: Union[str, IO[Any]],
@@ -77,7 +100,8 @@ def write_audio(fname: Union[str, IO[Any]],
 def add_room_response(spk: np.ndarray,
                       rir: np.ndarray,
                       early_energy: bool = False,
-                      sr: int = 16000) -> Tuple[np.ndarray, float]:
+                      sr: int = 16000,
+                      conv_method: str = "auto") -> Tuple[np.ndarray, float]:
     """
     Convolute source signal with selected rirs
     Args
@@ -85,13 +109,20 @@ def add_room_response(spk: np.ndarray,
         rir: N x R, single or multi-channel RIRs
         early_energy: return energy of early parts
         sr: sample rate of the signal
+        conv_method: auto|direct|fft|oa, method used for convolution, "oa"
+                     means overlap-add FFT convolution (for long RIRs)
     Return
         revb: N x S, reverberated signals
     """
     if spk.ndim != 1:
         raise RuntimeError(f"Can not convolve rir with {spk.ndim}D signals")
     S = spk.shape[-1]
-    revb = ss.convolve(spk[None, ...], rir)[..., :S]
+    if conv_method == "oa":
+        revb = ss.oaconvolve(spk[None, ...], rir, axes=-1)[..., :S]
+    elif conv_method in ["auto", "direct", "fft"]:
+        revb = ss.convolve(spk[None, ...], rir, method=conv_method)[..., :S]
+    else:
+        raise ValueError(f"Unknown conv_method: {conv_method}")
     revb = np.asarray(revb)
 
     if early_energy:
@@ -143,53 +174,242 @@ class AudioReader(BaseReader):
         key2 /path/to/ark1:XXXY
     are supported
 
+    For the command pipes, the outputs could be spooled to the files: with
+    pipe_cache, the decoded audio is kept in the cache directory on the first
+    access and loaded from it later; with pipe_prefetch > 0, the commands of
+    the upcoming utterances (in the iteration order or assigned by prefetch())
+    are started in advance and run in parallel
+
+    With mmap_ark, the headers of the wav.ark entries (PCM int16 or float32)
+    are parsed once and the audio is loaded from the memory-mapped archives
+    (read-only views are returned for the float32 payloads, if normalized)
+
     Args:
         wav_scp: path of the audio script
         sr: sample rate of the audio
         norm: normalize audio samples between (-1, 1) if true
         channel: read audio at #channel if > 0 (-1 means all)
+        pipe_cache: cache directory of the command pipe outputs
+        pipe_prefetch: maximum number of the command pipes running in parallel
+        mmap_ark: load the wav.ark entries from the memory-mapped archives
     """
 
     def __init__(self,
                  wav_scp: str,
                  sr: int = 16000,
                  norm: bool = True,
-                 channel: int = -1) -> None:
+                 channel: int = -1,
+                 pipe_cache: str = "",
+                 pipe_prefetch: int = 0,
+                 mmap_ark: bool = False) -> None:
         super(AudioReader, self).__init__(wav_scp, num_tokens=2)
+        self.wav_scp = wav_scp
         self.sr = sr
         self.ch = channel
         self.norm = norm
         self.mngr = {}
+        self.pipe_cache = pipe_cache
+        self.pipe_prefetch = pipe_prefetch
+        if pipe_cache:
+            os.makedirs(pipe_cache, exist_ok=True)
+        # running command pipes: key => (process, output, stderr), owned by
+        # the process (dataloader worker) that starts them
+        self.pipe_pid = None
+        self.pipe_proc = {}
+        # key => ArkEntry
+        self.ark_mngr = MmapManager()
+        self.ark_table = {}
+        if mmap_ark:
+            addrs = {}
+            for key, fname in self.index_dict.items():
+                tokens = fname.split(":")
+                if len(tokens) == 2 and tokens[1].isdigit():
+                    addrs[key] = (tokens[0], int(tokens[1]))
+            table = parse_ark_table(addrs, self.ark_mngr, wav=True)
+            # float32 => int16 (norm = False) is left to soundfile
+            self.ark_table = {
+                key: entry
+                for key, entry in table.items()
+                if norm or entry.dtype == "<i2"
+            }
+
+    def __iter__(self):
+        for n, key in enumerate(self.index_keys):
+            if self.pipe_prefetch > 0:
+                self.prefetch(self.index_keys[n:n + self.pipe_prefetch])
+            yield key, self._load(key)
+
+    def _pipe_spool(self, key: str) -> str:
+        """
+        Return the cache path of the command pipe output
+        """
+        sha1 = hashlib.sha1(self.index_dict[key].encode()).hexdigest()
+        return os.path.join(self.pipe_cache, f"{sha1}.wav")
+
+    def _pipe_running(self) -> Dict:
+        # the processes inherited from the parent (fork) are not ours
+        if os.getpid() != self.pipe_pid:
+            self.pipe_pid = os.getpid()
+            self.pipe_proc = {}
+            # kill the leftovers when the reader is released or the process
+            # exits (unlike atexit, it also works for the dataloader workers)
+            mp_util.Finalize(self,
+                             _kill_pipes,
+                             args=(self.pipe_proc,),
+                             exitpriority=0)
+        return self.pipe_proc
+
+    def _pipe_start(self, key: str) -> NoReturn:
+        """
+        Start the command pipe, with the output redirected to a file
+        """
+        if self.pipe_cache:
+            output = self._pipe_spool(key) + f".{os.getpid()}.part"
+        else:
+            fd, output = tempfile.mkstemp(suffix=".wav", prefix="aps-pipe-")
+            os.close(fd)
+        # stderr goes to an anonymous file, in case the pipe buffer is full
+        stderr = tempfile.TemporaryFile()
+        with open(output, "wb") as output_fd:
+            p = subprocess.Popen(self.index_dict[key][:-1],
+                                 shell=True,
+                                 stdout=output_fd,
+                                 stderr=stderr,
+                                 start_new_session=True)
+        self._pipe_running()[key] = (p, output, stderr)
+
+    def _pipe_wait(self, key: str) -> str:
+        """
+        Wait for the command pipe and return the output file
+        """
+        p, output, stderr = self._pipe_running().pop(key)
+        p.wait()
+        stderr.seek(0)
+        errors = stderr.read()
+        stderr.close()
+        if p.returncode != 0:
+            os.remove(output)
+            raise Exception("There was an error while running the command " +
+                            f"\"{self.index_dict[key][:-1]}\":\n" +
+                            f"{bytes.decode(errors)}\n")
+        if self.pipe_cache:
+            spool = self._pipe_spool(key)
+            os.replace(output, spool)
+            return spool
+        return output
+
+    def _pipe_drop(self, key: str) -> NoReturn:
+        """
+        Drop the command pipe (not used in the near future)
+        """
+        p, _, _ = self._pipe_running()[key]
+        # keep the finished ones in the cache
+        if p.poll() is not None and self.pipe_cache:
+            try:
+                self._pipe_wait(key)
+            except Exception:
+                pass
+            return
+        # kill the whole pipeline
+        _kill_pipes({key: self._pipe_running().pop(key)})
+
+    def _is_pipe(self, key: str) -> bool:
+        return self.index_dict[key][-1] == "|"
+
+    def prefetch(self, keys: List[str]) -> NoReturn:
+        """
+        Start the command pipes of the upcoming utterances (at most
+        #pipe_prefetch ones), the other running ones are dropped
+        Args:
+            keys: upcoming utterances, in loading order
+        """
+        running = self._pipe_running()
+        keys = [k for k in keys if self._is_pipe(k)][:self.pipe_prefetch]
+        for key in [k for k in running if k not in keys]:
+            self._pipe_drop(key)
+        for key in keys:
+            if key in running:
+                continue
+            if self.pipe_cache and os.path.exists(self._pipe_spool(key)):
+                continue
+            self._pipe_start(key)
+
+    def _load_pipe(self, key: str) -> Tuple[Union[str, IO[Any]], bool]:
+        """
+        Run the command pipe and return the output (file or bytes object)
+        and whether it's a temporary file
+        """
+        if not self.pipe_cache and self.pipe_prefetch <= 0:
+            shell, _ = run_command(self.index_dict[key][:-1], wait=True)
+            return io.BytesIO(shell), False
+        if key not in self._pipe_running():
+            if self.pipe_cache and os.path.exists(self._pipe_spool(key)):
+                return self._pipe_spool(key), False
+            self._pipe_start(key)
+        output = self._pipe_wait(key)
+        return output, not self.pipe_cache
+
+    def _seek_ark(self, fname: str) -> Tuple[str, int, IO[Any]]:
+        """
+        Return ark object which points to the offset of the audio
+        """
+        tokens = fname.split(":")
+        if len(tokens) != 2:
+            raise RuntimeError(f"Value format error: {fname}")
+        fname, offset = tokens[0], int(tokens[1])
+        # get ark object
+        if fname not in self.mngr:
+            self.mngr[fname] = open(fname, "rb")
+        wav_ark = self.mngr[fname]
+        # seek and read
+        wav_ark.seek(offset)
+        return fname, offset, wav_ark
+
+    def _load_mmap(self, key: str) -> np.ndarray:
+        """
+        Load audio from the memory-mapped archive (same as read_audio)
+        """
+        entry = self.ark_table[key]
+        if entry.sr != self.sr:
+            raise RuntimeError(f"Expect sr={self.sr} of {key}, " +
+                               f"get {entry.sr} instead")
+        # N x C
+        samps = self.ark_mngr.view(entry)
+        # keep the view for the float32 payloads
+        if samps.dtype == np.int16:
+            samps = samps.astype(np.float32)
+            if self.norm:
+                samps /= 32768
+        # C x N or N
+        return samps[:, 0] if samps.shape[-1] == 1 else samps.T
 
     def _load(self, key: str) -> Optional[np.ndarray]:
         fname = self.index_dict[key]
         samps = None
         # return C x N or N
-        if ":" in fname:
-            tokens = fname.split(":")
-            if len(tokens) != 2:
-                raise RuntimeError(f"Value format error: {fname}")
-            fname, offset = tokens[0], int(tokens[1])
-            # get ark object
-            if fname not in self.mngr:
-                self.mngr[fname] = open(fname, "rb")
-            wav_ark = self.mngr[fname]
-            # wav_ark = open(fname, "rb")
-            # seek and read
-            wav_ark.seek(offset)
+        if key in self.ark_table:
+            try:
+                samps = self._load_mmap(key)
+            except RuntimeError:
+                print(f"Read audio {key} {fname} (mmap) failed...", flush=True)
+        elif ":" in fname:
+            fname, offset, wav_ark = self._seek_ark(fname)
             try:
                 samps = read_audio(wav_ark, norm=self.norm, sr=self.sr)
             except RuntimeError:
                 print(f"Read audio {key} {fname}:{offset} failed...",
                       flush=True)
         else:
+            temp = False
             if fname[-1] == "|":
-                shell, _ = run_command(fname[:-1], wait=True)
-                fname = io.BytesIO(shell)
+                fname, temp = self._load_pipe(key)
             try:
                 samps = read_audio(fname, norm=self.norm, sr=self.sr)
             except RuntimeError:
                 print(f"Load audio {key} {fname} failed...", flush=True)
+            finally:
+                if temp:
+                    os.remove(fname)
         if samps is None:
             raise RuntimeError("Audio IO failed ...")
         if self.ch >= 0 and samps.ndim == 2:
@@ -198,10 +418,18 @@ class AudioReader(BaseReader):
 
     def nsamps(self, key: str) -> int:
         """
-        Number of samples
+        Number of samples (parsed from the audio header, except for the
+        command pipe, which needs to be decoded)
         """
-        data = self._load(key)
-        return data.shape[-1]
+        if key in self.ark_table:
+            return self.ark_table[key].shape[0]
+        fname = self.index_dict[key]
+        if fname[-1] == "|":
+            data = self._load(key)
+            return data.shape[-1]
+        if ":" in fname:
+            _, _, fname = self._seek_ark(fname)
+        return sf.info(fname).frames
 
     def power(self, key: str) -> float:
         """
@@ -217,3 +445,29 @@ class AudioReader(BaseReader):
         """
         N = self.nsamps(key)
         return N / self.sr
+
+    def durations(self, cache: str = "") -> Dict[str, float]:
+        """
+        Return durations (in seconds) of all the utterances. If cache is
+        given, load them from the cache file when it's newer than the wav_scp
+        and covers all the utterances, otherwise write them to it
+        Args:
+            cache: path of the utt2dur cache file
+        Return:
+            utt2dur: key => duration
+        """
+        if cache and os.path.exists(cache) and os.path.getmtime(
+                cache) >= os.path.getmtime(self.wav_scp):
+            utt2dur = BaseReader(cache, value_processor=float).index_dict
+            if all(key in utt2dur for key in self.index_keys):
+                return utt2dur
+        utt2dur = {key: self.duration(key) for key in self.index_keys}
+        # only rank 0 writes the cache (the others keep it in memory), via an
+        # atomic rename, so that the readers never see a partial file
+        if cache and (dist.get_backend() == "none" or dist.rank() == 0):
+            cache_tmp = f"{cache}.{os.getpid()}.tmp"
+            with open(cache_tmp, "w") as cache_fd:
+                for key, dur in utt2dur.items():
+                    cache_fd.write(f"{key}\t{dur:.4f}\n")
+            os.replace(cache_tmp, cache)
+        return utt2dur
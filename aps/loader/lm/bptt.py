@@ -11,9 +11,9 @@ import torch.utils.data as dat
 import aps.distributed as dist
 
 from typing import Optional, Iterable, Iterator, Dict, List, NoReturn
-from aps.loader.lm.utils import filter_utts, concat_data
+from aps.loader.lm.utils import filter_utts, concat_data, token_lengths
 from aps.loader.am.utils import derive_indices
-from aps.loader.lm.utt import Dataset
+from aps.loader.lm.utt import lm_dataset
 from aps.utils import get_logger
 from aps.libs import ApsRegisters
 
@@ -36,7 +36,7 @@ def DataLoader(text: str = "",
     """
     The BPTT dataloader for LM training
     Args:
-        text: path of the text/token file
+        text: path of the text/token file or the binarized corpus (*.bin)
         vocab_dict: vocabulary dictionary
         sos|eos: sos|eos ID
         distributed: for distributed training or not
@@ -47,7 +47,9 @@ def DataLoader(text: str = "",
         min_batch_size: not used here
         num_workers: number workers used in dataloader, not used here
     """
-    return BpttDataloader(Dataset(text, vocab_dict, kaldi_format=kaldi_format),
+    return BpttDataloader(lm_dataset(text,
+                                     vocab_dict,
+                                     kaldi_format=kaldi_format),
                           max_batch_size,
                           bptt_size=bptt_size,
                           sos=sos,
@@ -81,7 +83,7 @@ class SequenceSampler(dat.Sampler):
             self.world_size = 1
             self.header = "SequenceSampler"
         logger.info(f"{self.header}: filtering utterances ...")
-        self.indices = filter_utts(dataset,
+        self.indices = filter_utts(token_lengths(dataset),
                                    min_token_num=min_token_num,
                                    max_token_num=max_token_num)
         kept_utt_num = len(self.indices)
@@ -136,7 +138,7 @@ class BpttDataloader(object):
 
     def __iter__(self) -> Iterator[Dict]:
         # B x N
-        # TODO: may be slow when dataset is large
+        # NOTE: may be slow for large text corpus, use binarized one instead
         batch = concat_data(self.batch_size,
                             self.dataset,
                             self.sampler,
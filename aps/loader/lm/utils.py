@@ -3,36 +3,64 @@
 # Copyright 2020 Jian Wu
 # License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
 
+import array
 import warnings
+import numpy as np
 import torch as th
 import torch.utils.data as dat
 
-from typing import List
+from typing import List, Iterable
 
 
-def filter_utts(dataset: dat.Dataset,
+def token_lengths(dataset: dat.Dataset) -> np.ndarray:
+    """
+    Return number of tokens of each utterance in the dataset
+    """
+    # binarized corpus keeps the lengths in the index
+    if hasattr(dataset, "lengths"):
+        return dataset.lengths
+    return np.array([len(tokseq) for tokseq in dataset], dtype=np.int64)
+
+
+def filter_utts(toks_len: np.ndarray,
                 min_token_num: int = 4,
                 max_token_num: int = 1000) -> List[int]:
     """
     Return utterance index used for training (pass short/long utterances)
     """
-    kept_index = []
-    filter_sutt, filter_lutt = 0, 0
-    for index, tokseq in enumerate(dataset):
-        tok_len = len(tokseq)
-        if tok_len < min_token_num:
-            filter_sutt += 1
-        elif tok_len > max_token_num:
-            filter_lutt += 1
-        else:
-            kept_index.append(index)
+    num_utts = toks_len.size
+    filter_sutt = np.sum(toks_len < min_token_num)
+    filter_lutt = np.sum(toks_len > max_token_num)
+    kept_index = np.nonzero((toks_len >= min_token_num) &
+                            (toks_len <= max_token_num))[0]
     if filter_lutt or filter_sutt:
-        ratio_lutt = filter_lutt * 100.0 / len(dataset)
-        ratio_sutt = filter_sutt * 100.0 / len(dataset)
+        ratio_lutt = filter_lutt * 100.0 / num_utts
+        ratio_sutt = filter_sutt * 100.0 / num_utts
         warnings.warn(
             f"filter {ratio_lutt:.2f}% long utterance & {ratio_sutt:.2f}% " +
             "short utterances...")
-    return kept_index
+    return kept_index.tolist()
+
+
+def binarize_corpus(dataset: Iterable[List[int]], bin_path: str) -> int:
+    """
+    Write the token sequences to a flat int32 array ({bin_path}) with
+    an int64 offset index ({bin_path}.idx, in npy format) which can be
+    memory-mapped by BinaryDataset
+    Args:
+        dataset: iterable of the token sequences
+        bin_path: path of the binarized corpus
+    Return:
+        num_utts: number of utterances written
+    """
+    offsets = array.array("q", [0])
+    with open(bin_path, "wb") as bin_f:
+        for tokseq in dataset:
+            np.asarray(tokseq, dtype=np.int32).tofile(bin_f)
+            offsets.append(offsets[-1] + len(tokseq))
+    with open(f"{bin_path}.idx", "wb") as idx_f:
+        np.save(idx_f, np.frombuffer(offsets, dtype=np.int64))
+    return len(offsets) - 1
 
 
 def concat_data(batch_size: int,
@@ -43,10 +71,27 @@ def concat_data(batch_size: int,
     """
     Concatenate data sequence in the dataset
     """
-    data = []
-    for index in sampler:
-        data += ([sos] + dataset[index] + [eos])
+    if hasattr(dataset, "offsets"):
+        # gather from the memory-mapped corpus without python loop
+        index = np.array(list(sampler), dtype=np.int64)
+        toks_len = dataset.lengths[index]
+        end = np.cumsum(toks_len + 2)
+        beg = end - toks_len - 2
+        data = np.empty(end[-1] if end.size else 0, dtype=np.int64)
+        data[beg] = sos
+        data[end - 1] = eos
+        is_tok = np.ones_like(data, dtype=bool)
+        is_tok[beg] = False
+        is_tok[end - 1] = False
+        dst = np.nonzero(is_tok)[0]
+        src = np.repeat(dataset.offsets[index] - beg - 1, toks_len) + dst
+        data[dst] = dataset.tokens[src]
+        data = th.from_numpy(data)
+    else:
+        data = []
+        for index in sampler:
+            data += ([sos] + dataset[index] + [eos])
+        data = th.tensor(data, dtype=th.int64)
     truncated = (len(data) // batch_size) * batch_size
-    data = th.tensor(data, dtype=th.int64)
     batch = data[:truncated].view(batch_size, -1)
     return batch
@@ -14,7 +14,7 @@ import aps.distributed as dist
 
 from torch.nn.utils.rnn import pad_sequence
 from typing import NoReturn, List, Dict, Optional, Iterator, Iterable
-from aps.loader.lm.utils import filter_utts
+from aps.loader.lm.utils import filter_utts, token_lengths
 from aps.loader.am.utils import derive_indices
 from aps.utils import get_logger
 from aps.const import IGNORE_ID, UNK_TOKEN
@@ -41,7 +41,7 @@ def DataLoader(text: str = "",
     """
     The utterance-level dataloader for LM training
     Args:
-        text: path of the text/token file
+        text: path of the text/token file or the binarized corpus (*.bin)
         vocab_dict: vocabulary dictionary
         sos|eos: sos|eos ID
         distributed: for distributed training or not
@@ -55,7 +55,8 @@ def DataLoader(text: str = "",
         chunk_size_for_sort: #chunk_size for mini-batch sorting, we perform sort
                              in each chunk (because LM corpus may very big)
     """
-    return UttDataLoader(Dataset(text, vocab_dict, kaldi_format=kaldi_format),
+    return UttDataLoader(lm_dataset(text, vocab_dict,
+                                    kaldi_format=kaldi_format),
                          sos=sos,
                          eos=eos,
                          shuffle=train,
@@ -69,6 +70,38 @@ def DataLoader(text: str = "",
                          chunk_size_for_sort=chunk_size_for_sort)
 
 
+def str2tokens(line: str,
+               vocab_dict: Optional[Dict],
+               kaldi_format: bool = True) -> List[int]:
+    """
+    Map one line of the text/token file to the token IDs
+    """
+    str_toks = line.split()
+    # remove the first token (key)
+    if kaldi_format:
+        str_toks = str_toks[1:]
+    if vocab_dict:
+        int_toks = [
+            (vocab_dict[t] if t in vocab_dict else vocab_dict[UNK_TOKEN])
+            for t in str_toks
+        ]
+    else:
+        int_toks = list(map(int, str_toks))
+    return int_toks
+
+
+def lm_dataset(text: str,
+               vocab_dict: Optional[Dict],
+               kaldi_format: bool = True) -> dat.Dataset:
+    """
+    Return BinaryDataset for the binarized corpus (*.bin), otherwise Dataset
+    """
+    if text[-4:] == ".bin":
+        return BinaryDataset(text)
+    else:
+        return Dataset(text, vocab_dict, kaldi_format=kaldi_format)
+
+
 class Dataset(dat.Dataset):
     """
     Dataset for text corpus
@@ -99,23 +132,44 @@ class Dataset(dat.Dataset):
         return token
 
     def __getitem__(self, index: int) -> List[int]:
-        str_toks = self.token[index].split()
-        # remove the first token (key)
-        if self.kaldi_format:
-            str_toks = str_toks[1:]
-        if self.vocab:
-            int_toks = [
-                (self.vocab[t] if t in self.vocab else self.vocab[UNK_TOKEN])
-                for t in str_toks
-            ]
-        else:
-            int_toks = list(map(int, str_toks))
-        return int_toks
+        return str2tokens(self.token[index],
+                          self.vocab,
+                          kaldi_format=self.kaldi_format)
 
     def __len__(self) -> int:
         return len(self.token)
 
 
+class BinaryDataset(dat.Dataset):
+    """
+    Dataset for the binarized corpus (see cmd/binarize_text.py). The token IDs
+    are memory-mapped, so the workers share the pages of the corpus
+    Args:
+        bin_path: path of the binarized corpus
+    """
+
+    def __init__(self, bin_path: str) -> None:
+        self.bin_path = bin_path
+        # N + 1
+        self.offsets = np.load(f"{bin_path}.idx", mmap_mode="r")
+        self.lengths = np.diff(self.offsets)
+        self.mmap = None
+
+    @property
+    def tokens(self) -> np.ndarray:
+        # opened lazily, in each worker process
+        if self.mmap is None:
+            self.mmap = np.memmap(self.bin_path, dtype=np.int32, mode="r")
+        return self.mmap
+
+    def __getitem__(self, index: int) -> List[int]:
+        beg, end = self.offsets[index], self.offsets[index + 1]
+        return self.tokens[beg:end].tolist()
+
+    def __len__(self) -> int:
+        return self.lengths.size
+
+
 class BatchSampler(dat.Sampler):
     """
     A custom batch sampler for LM dataset
@@ -149,7 +203,8 @@ class BatchSampler(dat.Sampler):
         batches = []
         chunk_size = chunk_size_for_sort
         logger.info(f"{self.header}: filtering utterances ...")
-        kept_index = filter_utts(dataset,
+        toks_len = token_lengths(dataset)
+        kept_index = filter_utts(toks_len,
                                  min_token_num=min_token_num,
                                  max_token_num=max_token_num)
         total_utts = len(kept_index)
@@ -160,7 +215,7 @@ class BatchSampler(dat.Sampler):
                 kept_index[i]
                 for i in range(base, min(base + chunk_size, total_utts))
             ]
-            indices = self._sort_indices(dataset,
+            indices = self._sort_indices(toks_len,
                                          subset,
                                          max_batch_size,
                                          min_batch_size=min_batch_size,
@@ -175,7 +230,7 @@ class BatchSampler(dat.Sampler):
         self.num_batches = len(batches) // self.world_size
 
     def _sort_indices(self,
-                      dataset: dat.Dataset,
+                      toks_len: np.ndarray,
                       subset: List[int],
                       max_batch_size: int,
                       min_batch_size: int = 4,
@@ -183,7 +238,7 @@ class BatchSampler(dat.Sampler):
         """
         Return utterance index used for training (pass short/long utterances)
         """
-        toks_len = [len(dataset[i]) for i in subset]
+        toks_len = toks_len[subset]
         # long -> short
         sort_idx = np.argsort(toks_len)[::-1]
         batches = []
@@ -6,13 +6,15 @@
 Dataloader of the raw waveform in enhancement/separation tasks
 """
 import random
+import bisect
 import numpy as np
+import torch as th
 import torch.utils.data as dat
 import aps.distributed as dist
 
 from torch.utils.data.dataloader import default_collate
 from kaldi_python_io import Reader as BaseReader
-from typing import List, Dict, Iterator, NoReturn, Union, Iterable
+from typing import List, Dict, Iterator, NoReturn, Union, Iterable, Tuple, Optional
 from aps.loader.audio import AudioReader
 from aps.libs import ApsRegisters
 
@@ -26,6 +28,8 @@ def DataLoader(train: bool = True,
                emb_scp: str = "",
                chunk_size: int = 64000,
                batch_size: int = 16,
+               bucket_size: int = 0,
+               dur_cache: str = "",
                distributed: bool = False,
                num_workers: int = 4) -> Iterable[Dict]:
     """
@@ -39,6 +43,9 @@ def DataLoader(train: bool = True,
         ref_scp: reference audio scripts, e.g., "spk1.scp" or "spk1.scp,spk2.scp"
         chunk_size: #chunk_size (s)
         batch_size: #batch_size
+        bucket_size: if > 0, plan the batches of each epoch in advance and load
+                     #bucket_size batches in one worker (see ChunkBucketSampler)
+        dur_cache: path of the duration cache used in bucket mode
         distributed: in distributed mode or not
         num_workers: number of workers used in dataloader
     """
@@ -64,6 +71,8 @@ def DataLoader(train: bool = True,
                                train=train,
                                chunk_size=chunk_size,
                                batch_size=batch_size,
+                               bucket_size=bucket_size,
+                               dur_cache=dur_cache,
                                num_workers=num_workers,
                                distributed=distributed)
 
@@ -146,6 +155,18 @@ class ScriptDataset(dat.Dataset):
             eg["emb"] = self.emb[key]
         return eg
 
+    def nsamps(self, cache: str = "") -> List[int]:
+        """
+        Return number of samples of the mixture utterances (in index order)
+        Args:
+            cache: path of the duration cache (see AudioReader.durations)
+        """
+        utt2dur = self.mix.durations(cache=cache)
+        return [
+            int(round(utt2dur[key] * self.mix.sr))
+            for key in self.mix.index_keys
+        ]
+
     def __getitem__(self, index: int) -> Dict:
         key = self.mix.index_keys[index]
         eg = self._idx(key)
@@ -215,7 +236,46 @@ class ChunkSplitter(object):
             chunk["emb"] = eg["emb"]
         return chunk
 
-    def split(self, eg: Dict) -> List[Dict]:
+    def num_chunks(self, N: int) -> int:
+        """
+        Return number of the chunks split from the utterance with length N
+        """
+        if N < self.hop:
+            return 0
+        if N < self.chunk_size:
+            return 1
+        return (N - self.chunk_size) // self.hop + 1
+
+    def fit(self, eg: Dict, N: int) -> Dict:
+        """
+        Crop or pad the utterance to length N
+        """
+        P = N - eg["mix"].shape[-1]
+        if P == 0:
+            return eg
+        eg = dict(eg)
+        if P > 0:
+            pad_width = ((0, 0), (0, P)) if eg["mix"].ndim == 2 else (0, P)
+            eg["mix"] = np.pad(eg["mix"], pad_width, "constant")
+            if "ref" in eg:
+                eg["ref"] = self.pad(eg["ref"], P)
+        else:
+            eg["mix"] = eg["mix"][..., :N]
+            if "ref" in eg:
+                ref = eg["ref"]
+                eg["ref"] = [r[:N] for r in ref] if isinstance(
+                    ref, list) else ref[:N]
+        return eg
+
+    def split(self,
+              eg: Dict,
+              rng: Optional[random.Random] = None) -> List[Dict]:
+        """
+        Split the utterance into chunks
+        Args:
+            eg: utterance egs
+            rng: random generator used to choose the start point
+        """
         N = eg["mix"].shape[-1]
         # too short, throw away
         if N < self.hop:
@@ -236,8 +296,10 @@ class ChunkSplitter(object):
                 chunk["emb"] = eg["emb"]
             chunks.append(chunk)
         else:
-            # random select start point for training
-            s = random.randint(0, N % self.hop) if self.train else 0
+            # random select start point for training (keep #chunks unchanged)
+            rng = random if rng is None else rng
+            s = rng.randint(0, (N - self.chunk_size) %
+                            self.hop) if self.train else 0
             while True:
                 if s + self.chunk_size > N:
                     break
@@ -247,6 +309,119 @@ class ChunkSplitter(object):
         return chunks
 
 
+class ChunkBucketSampler(dat.Sampler):
+    """
+    Plan the chunk batches of each epoch in advance. The chunks of the
+    (shuffled) utterances are laid out one by one and cut into the batches of
+    exact #batch_size chunks, and every #bucket_size batches are grouped into
+    a bucket, which is handled by one worker. The sampler yields the bucket
+    plans: (epoch, bucket_offset, [(utt_index, chunk_beg, chunk_end), ...])
+    Args:
+        num_chunks: number of the chunks of each utterance
+        batch_size: #batch_size (number of chunks)
+        bucket_size: number of the batches in one bucket
+        shuffle: shuffle utterances or not
+        distributed: in distributed mode or not
+    """
+
+    def __init__(self,
+                 num_chunks: List[int],
+                 batch_size: int = 16,
+                 bucket_size: int = 8,
+                 shuffle: bool = True,
+                 distributed: bool = False) -> None:
+        self.num_chunks = num_chunks
+        self.batch_size = batch_size
+        self.bucket_size = bucket_size
+        self.shuffle = shuffle
+        self.epoch = 0
+        world_size = dist.world_size() if distributed else 1
+        self.rank = dist.rank() if distributed else 0
+        # same number of batches on each rank
+        self.num_batches = sum(num_chunks) // batch_size // world_size
+        if self.num_batches == 0:
+            raise RuntimeError(
+                f"No batch of {batch_size} chunks in the dataset")
+
+    def _bucket_plan(self, order: List[int], cum_chunks: List[int], beg: int,
+                     end: int) -> List[Tuple[int, int, int]]:
+        """
+        Return the utterances (with chunk spans) that cover chunk [beg, end)
+        """
+        plan = []
+        n = bisect.bisect_right(cum_chunks, beg)
+        while beg < end:
+            utt_beg = cum_chunks[n - 1] if n else 0
+            utt_end = min(cum_chunks[n], end)
+            plan.append((order[n], beg - utt_beg, utt_end - utt_beg))
+            beg = utt_end
+            n += 1
+        return plan
+
+    def __iter__(self) -> Iterator[Tuple]:
+        if self.shuffle:
+            g = th.Generator()
+            g.manual_seed(self.epoch)
+            order = th.randperm(len(self.num_chunks), generator=g).tolist()
+        else:
+            order = list(range(len(self.num_chunks)))
+        order = [i for i in order if self.num_chunks[i]]
+        cum_chunks = np.cumsum([self.num_chunks[i] for i in order]).tolist()
+        bucket_chunks = self.bucket_size * self.batch_size
+        # chunk range of current rank
+        beg = self.rank * self.num_batches * self.batch_size
+        end = beg + self.num_batches * self.batch_size
+        for s in range(beg, end, bucket_chunks):
+            plan = self._bucket_plan(order, cum_chunks, s,
+                                     min(s + bucket_chunks, end))
+            yield (self.epoch, s, plan)
+
+    def set_epoch(self, epoch: int) -> NoReturn:
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        return (self.num_batches + self.bucket_size - 1) // self.bucket_size
+
+
+class ChunkBucketDataset(dat.Dataset):
+    """
+    Load the utterances of the bucket and make the chunk batches
+    Args:
+        dataset: instance of the audio dataset
+        splitter: instance of the ChunkSplitter
+        nsamps: number of samples of each utterance (used in the planning)
+        batch_size: #batch_size
+    """
+
+    def __init__(self, dataset: dat.Dataset, splitter: ChunkSplitter,
+                 nsamps: List[int], batch_size: int) -> None:
+        self.dataset = dataset
+        self.splitter = splitter
+        self.nsamps = nsamps
+        self.batch_size = batch_size
+
+    def __getitem__(self, bucket: Tuple) -> List[Dict]:
+        epoch, offset, plan = bucket
+        chunks = []
+        for idx, beg, end in plan:
+            # fit to the planned length (in case of the cached durations)
+            eg = self.splitter.fit(self.dataset[idx], self.nsamps[idx])
+            # the utterances split across buckets have the same chunks
+            rng = random.Random(f"{epoch}-{idx}")
+            chunks += self.splitter.split(eg, rng=rng)[beg:end]
+        if self.splitter.train:
+            random.Random(f"{epoch}-{offset}").shuffle(chunks)
+        batches = []
+        for s in range(0, len(chunks), self.batch_size):
+            batch = default_collate(chunks[s:s + self.batch_size])
+            batch["#utt"] = self.batch_size
+            batches.append(batch)
+        return batches
+
+    def __len__(self) -> int:
+        return len(self.dataset)
+
+
 class WaveChunkDataLoader(object):
     """
     The audio chunk dataloader for SE/SS tasks (do chunk splitting on-the-fly)
@@ -255,6 +430,8 @@ class WaveChunkDataLoader(object):
         num_workers: number of the workers used in dataloader
         chunk_size: #chunk_size (s)
         batch_size: #batch_size
+        bucket_size: if > 0, load #bucket_size planned batches in one worker
+        dur_cache: path of the duration cache used in bucket mode
         distributed: in distributed mode or not
         train: in training mode or not
     """
@@ -264,6 +441,8 @@ class WaveChunkDataLoader(object):
                  num_workers: int = 4,
                  chunk_size: int = 64000,
                  batch_size: int = 16,
+                 bucket_size: int = 0,
+                 dur_cache: str = "",
                  distributed: bool = False,
                  train: bool = True) -> None:
         self.dataset = dataset
@@ -272,23 +451,40 @@ class WaveChunkDataLoader(object):
         self.splitter = ChunkSplitter(chunk_size,
                                       train=train,
                                       hop=chunk_size // 2)
-        if distributed:
-            self.sampler = dat.DistributedSampler(
-                dataset,
+        self.bucket = bucket_size > 0
+        if self.bucket:
+            nsamps = dataset.nsamps(cache=dur_cache)
+            self.sampler = ChunkBucketSampler(
+                [self.splitter.num_chunks(n) for n in nsamps],
+                batch_size=batch_size,
+                bucket_size=bucket_size,
                 shuffle=train,
-                num_replicas=dist.world_size(),
-                rank=dist.rank())
+                distributed=distributed)
+            bucket_dataset = ChunkBucketDataset(dataset, self.splitter, nsamps,
+                                                batch_size)
+            # each worker returns a bucket of batches
+            self.eg_loader = dat.DataLoader(bucket_dataset,
+                                            batch_size=None,
+                                            num_workers=num_workers,
+                                            sampler=self.sampler)
         else:
-            self.sampler = None
-        # just return batch of egs, support multiple workers
-        # NOTE: batch_size is not the batch_size of the audio chunk
-        self.eg_loader = dat.DataLoader(self.dataset,
-                                        batch_size=min(batch_size, 64),
-                                        num_workers=num_workers,
-                                        sampler=self.sampler,
-                                        shuffle=(train and
-                                                 self.sampler is None),
-                                        collate_fn=self._collate)
+            if distributed:
+                self.sampler = dat.DistributedSampler(
+                    dataset,
+                    shuffle=train,
+                    num_replicas=dist.world_size(),
+                    rank=dist.rank())
+            else:
+                self.sampler = None
+            # just return batch of egs, support multiple workers
+            # NOTE: batch_size is not the batch_size of the audio chunk
+            self.eg_loader = dat.DataLoader(self.dataset,
+                                            batch_size=min(batch_size, 64),
+                                            num_workers=num_workers,
+                                            sampler=self.sampler,
+                                            shuffle=(train and
+                                                     self.sampler is None),
+                                            collate_fn=self._collate)
 
     def _collate(self, batch):
         chunk = []
@@ -318,13 +514,18 @@ class WaveChunkDataLoader(object):
         return blist, chunk_list[-rn:] if rn else []
 
     def __len__(self) -> int:
-        return 0
+        return self.sampler.num_batches if self.bucket else 0
 
     def set_epoch(self, epoch: int) -> NoReturn:
         if self.sampler:
             self.sampler.set_epoch(epoch)
 
     def __iter__(self) -> Iterator[Dict]:
+        if self.bucket:
+            for batches in self.eg_loader:
+                for obj in batches:
+                    yield obj
+            return
         chunk_list = []
         for chunks in self.eg_loader:
             chunk_list += chunks
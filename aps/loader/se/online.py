@@ -6,14 +6,16 @@
 Online simulation dataloader for speech enhancement & separation tasks
 """
 
+import argparse
 import torch.utils.data as dat
 
-from typing import Dict, Iterable, List, Iterator
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Iterator, Optional
 from kaldi_python_io import Reader as BaseReader
 
 from aps.loader.se.chunk import WaveChunkDataLoader
 from aps.libs import ApsRegisters
-from aps.loader.simu import run_simu, make_argparse
+from aps.loader.simu import run_simu, make_argparse, AudioCache
 
 
 @ApsRegisters.loader.register("se@online")
@@ -24,7 +26,9 @@ def DataLoader(train: bool = True,
                chunk_size: int = 64000,
                batch_size: int = 16,
                distributed: bool = False,
-               num_workers: int = 4) -> Iterable[Dict]:
+               num_workers: int = 4,
+               cache_size: float = 256,
+               conv_method: Optional[str] = None) -> Iterable[Dict]:
     """
     Return a online simulation dataloader for enhancement/separation tasks
     Args
@@ -35,10 +39,15 @@ def DataLoader(train: bool = True,
         batch_size: #batch_size
         distributed: in distributed mode or not
         num_workers: number of workers used in dataloader
+        cache_size: size (MB) of the RIR/noise cache in each worker
+        conv_method: if not None, override --conv-method in simu_cfg
+        max_recipes: maximum number of the cached parsed options
     """
     dataset = SimuOptionsDataset(simu_cfg,
                                  return_in_egs=["mix", "ref", "noise"]
-                                 if noise_label else ["mix", "ref"])
+                                 if noise_label else ["mix", "ref"],
+                                 cache_size=cache_size,
+                                 conv_method=conv_method)
     return WaveChunkDataLoader(dataset,
                                train=train,
                                chunk_size=chunk_size,
@@ -63,27 +72,55 @@ class SimuOptionsDataset(dat.Dataset):
     2) https://github.com/funcwj/setk/tree/master/doc/data_simu for command line usage
 
     The user should write the script to generate the simu.cfg based on the requirements.
+    The parsed command options (the last max_recipes ones) and the RIRs/noises are kept in
+    bounded LRU caches, so they are not parsed or read from disk again.
     Args:
         simu_cfg: path of the audio simulation configuraton file
         return_in_egs: mix|ref|noise, return mixture, reference, noise signals or not
+        cache_size: size (MB) of the RIR/noise cache, 0 to disable it
+        conv_method: if not None, override --conv-method in simu_cfg
+        max_recipes: maximum number of the cached parsed options
     """
 
     def __init__(self,
                  simu_cfg: str,
-                 return_in_egs: List[str] = ["mix"]) -> None:
+                 return_in_egs: List[str] = ["mix"],
+                 cache_size: float = 256,
+                 conv_method: Optional[str] = None,
+                 max_recipes: int = 4096) -> None:
         self.simu_cfg = BaseReader(simu_cfg, num_tokens=-1)
         self.parser = make_argparse()
         self.return_in_egs = return_in_egs
+        self.conv_method = conv_method
+        self.cache = AudioCache(max_size=cache_size) if cache_size > 0 else None
+        self.max_recipes = max_recipes
+        # key => parsed options (LRU)
+        self.recipes = OrderedDict()
 
-    def _simu(self, opts_str: str) -> Dict:
+    def _recipe(self, key: str) -> argparse.Namespace:
+        """
+        Return the parsed options of the given key
+        """
+        if key in self.recipes:
+            self.recipes.move_to_end(key)
+            return self.recipes[key]
+        args = self.parser.parse_args(self.simu_cfg[key])
+        if self.conv_method is not None:
+            args.conv_method = self.conv_method
+        self.recipes[key] = args
+        while len(self.recipes) > self.max_recipes:
+            self.recipes.popitem(last=False)
+        return args
+
+    def _simu(self, key: str) -> Dict:
         """
         Args:
-            opts_str: command options for aps/loader/simu.py
+            key: key of the simulation recipe
         Return:
             egs: training egs
         """
-        args = self.parser.parse_args(opts_str)
-        mix, spk_ref, noise = run_simu(args)
+        args = self._recipe(key)
+        mix, spk_ref, noise = run_simu(args, cache=self.cache)
         egs = {"mix": mix}
         if "noise" in self.return_in_egs and noise is not None:
             spk_ref.append(noise)
@@ -98,8 +135,7 @@ class SimuOptionsDataset(dat.Dataset):
         Return:
             egs: training egs
         """
-        opts_str = self.simu_cfg[index]
-        return self._simu(opts_str)
+        return self._simu(self.simu_cfg.index_keys[index])
 
     def __len__(self) -> int:
         """
@@ -111,5 +147,5 @@ class SimuOptionsDataset(dat.Dataset):
         """
         Return audio chunk iterator
         """
-        for _, opts_str in self.simu_cfg:
-            yield self._simu(opts_str)
+        for key in self.simu_cfg.index_keys:
+            yield self._simu(key)
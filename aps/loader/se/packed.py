@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+# Copyright 2020 Jian Wu
+# License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+"""
+Dataloader of the pre-chunked (packed, see cmd/pack_ss_egs.py) egs in
+enhancement/separation tasks
+"""
+import random
+import numpy as np
+import torch.utils.data as dat
+import aps.distributed as dist
+
+from pathlib import Path
+from torch.utils.data.dataloader import default_collate
+from typing import Dict, List, Iterable, Tuple, Union, NoReturn
+from aps.loader.se.chunk import ChunkSplitter
+from aps.libs import ApsRegisters
+
+
+@ApsRegisters.loader.register("se@packed")
+def DataLoader(train: bool = True,
+               pack_dir: str = "",
+               chunk_size: int = 64000,
+               batch_size: int = 16,
+               distributed: bool = False,
+               num_workers: int = 4) -> Iterable[Dict]:
+    """
+    Return a chunk dataloader of the packed egs for enhancement/separation
+    tasks. The chunks are sliced from the memory-mapped egs directly.
+    Args:
+        train: in training mode or not
+        pack_dir: directory of the packed egs (see cmd/pack_ss_egs.py)
+        chunk_size: #chunk_size (s)
+        batch_size: #batch_size
+        distributed: in distributed mode or not
+        num_workers: number of workers used in dataloader
+    """
+    if not pack_dir:
+        raise RuntimeError("pack_dir can not be None")
+    dataset = PackedChunkDataset(pack_dir, chunk_size=chunk_size, train=train)
+    return PackedChunkDataLoader(dataset,
+                                 train=train,
+                                 batch_size=batch_size,
+                                 num_workers=num_workers,
+                                 distributed=distributed)
+
+
+def pack_egs(egs: Iterable[Tuple[str, Dict]],
+             pack_dir: Union[str, Path],
+             shard_size: float = 2048,
+             dtype: str = "float32") -> int:
+    """
+    Pack the egs of the enhancement/separation tasks. The mixture (C x N or N)
+    and the references (N or [N, ...]) of each utterance are stored as a
+    N x (C + #ref) matrix (fixed stride) in the shards ({pack_dir}/egs.*.bin),
+    with the index ({pack_dir}/egs.idx, in npy format, shard/offset/#samples
+    of each utterance), the utterance list ({pack_dir}/utt.list) and the
+    embeddings & DoAs ({pack_dir}/{emb,doa}.npy, if exist)
+    Args:
+        egs: iterable of (utterance, egs (see ScriptDataset))
+        pack_dir: directory of the packed egs
+        shard_size: maximum size (MB) of each shard
+        dtype: data type of the packed audio
+    Return:
+        num_utts: number of utterances packed
+    """
+    pack_dir = Path(pack_dir)
+    pack_dir.mkdir(parents=True, exist_ok=True)
+    index, emb, doa = [], [], []
+    shard, offset, stride = 0, 0, None
+    shard_f = open(pack_dir / f"egs.{shard}.bin", "wb")
+    max_rows = None
+    with open(pack_dir / "utt.list", "w") as utt_f:
+        for utt, eg in egs:
+            mix = eg["mix"]
+            mix = mix[..., None] if mix.ndim == 1 else mix.T
+            ref = eg.get("ref", [])
+            ref = [ref] if isinstance(ref, np.ndarray) else ref
+            if any(r.ndim != 1 or r.shape[-1] != mix.shape[0] for r in ref):
+                raise RuntimeError(
+                    f"Reference of {utt} should be 1D with the same " +
+                    "length as the mixture")
+            # N x (C + #ref)
+            mat = np.concatenate([mix] + [r[:, None] for r in ref], -1)
+            if stride is None:
+                stride = (mix.shape[-1], len(ref))
+                max_rows = int(shard_size * 1024**2 /
+                               (np.dtype(dtype).itemsize * sum(stride)))
+            if (mix.shape[-1], len(ref)) != stride:
+                raise RuntimeError(f"Mismatched #channel/#ref of {utt}")
+            # start a new shard
+            if offset and offset + mat.shape[0] > max_rows:
+                shard_f.close()
+                shard, offset = shard + 1, 0
+                shard_f = open(pack_dir / f"egs.{shard}.bin", "wb")
+            index.append([shard, offset, mat.shape[0]])
+            np.ascontiguousarray(mat, dtype=dtype).tofile(shard_f)
+            offset += mat.shape[0]
+            if "emb" in eg:
+                emb.append(eg["emb"])
+            if "doa" in eg:
+                doa.append(eg["doa"])
+            utt_f.write(f"{utt}\n")
+    shard_f.close()
+    if not index:
+        raise RuntimeError("No egs to pack")
+    with open(pack_dir / "egs.idx", "wb") as idx_f:
+        np.save(idx_f, np.array(index, dtype=np.int64))
+    if emb:
+        np.save(pack_dir / "emb.npy", np.stack(emb).astype(np.float32))
+    if doa:
+        doa = np.array(doa, dtype=np.float32).reshape(len(doa), -1)
+        np.save(pack_dir / "doa.npy", doa)
+    with open(pack_dir / "meta", "w") as meta_f:
+        meta_f.write(f"dtype {dtype}\nchannel {stride[0]}\n" +
+                     f"num_ref {stride[1]}\nnum_shards {shard + 1}\n")
+    return len(index)
+
+
+class PackedEgsReader(object):
+    """
+    Reader of the packed egs. The shards are memory-mapped, so only the
+    requested samples are read
+    Args:
+        pack_dir: directory of the packed egs
+    """
+
+    def __init__(self, pack_dir: Union[str, Path]) -> None:
+        pack_dir = Path(pack_dir)
+        with open(pack_dir / "meta", "r") as meta_f:
+            meta = dict(line.split() for line in meta_f)
+        self.dtype = meta["dtype"]
+        self.num_channels = int(meta["channel"])
+        self.num_ref = int(meta["num_ref"])
+        self.shard_path = [
+            pack_dir / f"egs.{n}.bin" for n in range(int(meta["num_shards"]))
+        ]
+        # N x 3
+        self.index = np.load(pack_dir / "egs.idx")
+        with open(pack_dir / "utt.list", "r") as utt_f:
+            self.index_keys = [utt.strip() for utt in utt_f]
+        emb, doa = pack_dir / "emb.npy", pack_dir / "doa.npy"
+        self.emb = np.load(emb) if emb.exists() else None
+        self.doa = np.load(doa) if doa.exists() else None
+        self.mmap = [None] * len(self.shard_path)
+
+    def _shard(self, n: int) -> np.ndarray:
+        # opened lazily, in each worker process
+        if self.mmap[n] is None:
+            self.mmap[n] = np.memmap(self.shard_path[n],
+                                     dtype=self.dtype,
+                                     mode="r").reshape(
+                                         -1, self.num_channels + self.num_ref)
+        return self.mmap[n]
+
+    def nsamps(self, idx: int) -> int:
+        return int(self.index[idx, 2])
+
+    def __len__(self) -> int:
+        return len(self.index_keys)
+
+    def __getitem__(self, idx: Tuple[int, int, int]) -> Dict:
+        """
+        Return the egs of utterance idx[0] in [idx[1], idx[1] + idx[2])
+        """
+        idx, beg, size = idx
+        shard, offset, nsamps = self.index[idx].tolist()
+        end = min(beg + size, nsamps)
+        # T x (C + #ref)
+        mat = self._shard(shard)[offset + beg:offset + end]
+        mat = np.ascontiguousarray(mat.T, dtype=np.float32)
+        # C x T or T
+        eg = {
+            "mix": mat[0] if self.num_channels == 1 else mat[:self.num_channels]
+        }
+        if self.num_ref:
+            ref = list(mat[self.num_channels:])
+            eg["ref"] = ref[0] if self.num_ref == 1 else ref
+        if self.emb is not None:
+            eg["emb"] = self.emb[idx]
+        if self.doa is not None:
+            doa = list(self.doa[idx])
+            eg["doa"] = doa[0] if len(doa) == 1 else doa
+        return eg
+
+
+class PackedChunkDataset(dat.Dataset):
+    """
+    Chunk dataset of the packed egs. The number of the chunks of each
+    utterance is the same as ChunkSplitter, but the start point of each chunk
+    is sampled randomly (in training) and read from the memory-mapped egs
+    Args:
+        pack_dir: directory of the packed egs
+        chunk_size: size of audio chunk
+        train: in training mode or not
+    """
+
+    def __init__(self,
+                 pack_dir: Union[str, Path],
+                 chunk_size: int = 64000,
+                 train: bool = True) -> None:
+        self.reader = PackedEgsReader(pack_dir)
+        self.splitter = ChunkSplitter(chunk_size,
+                                      train=train,
+                                      hop=chunk_size // 2)
+        # (utterance, chunk) pairs
+        self.chunks = []
+        for n in range(len(self.reader)):
+            num_chunks = self.splitter.num_chunks(self.reader.nsamps(n))
+            self.chunks += [(n, c) for c in range(num_chunks)]
+
+    def __getitem__(self, index: int) -> Dict:
+        idx, c = self.chunks[index]
+        N, S = self.reader.nsamps(idx), self.splitter.chunk_size
+        beg = c * self.splitter.hop
+        if self.splitter.train and N > S:
+            beg += random.randint(0, (N - S) % self.splitter.hop)
+        eg = self.reader[(idx, beg, S)]
+        # padding zeros for short utterances
+        return self.splitter.fit(eg, S)
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+
+class PackedChunkDataLoader(dat.DataLoader):
+    """
+    The chunk dataloader of the packed egs
+    Args:
+        dataset: instance of the PackedChunkDataset
+        num_workers: number of the workers used in dataloader
+        batch_size: #batch_size
+        distributed: in distributed mode or not
+        train: in training mode or not
+    """
+
+    def __init__(self,
+                 dataset: dat.Dataset,
+                 num_workers: int = 4,
+                 batch_size: int = 16,
+                 distributed: bool = False,
+                 train: bool = True) -> None:
+        if distributed:
+            sampler = dat.DistributedSampler(dataset,
+                                             shuffle=train,
+                                             num_replicas=dist.world_size(),
+                                             rank=dist.rank())
+        else:
+            sampler = None
+        super(PackedChunkDataLoader, self).__init__(dataset,
+                                                    batch_size=batch_size,
+                                                    num_workers=num_workers,
+                                                    sampler=sampler,
+                                                    shuffle=(train and
+                                                             sampler is None),
+                                                    drop_last=True,
+                                                    collate_fn=self._collate)
+
+    def _collate(self, chunks: List[Dict]) -> Dict:
+        batch = default_collate(chunks)
+        batch["#utt"] = len(chunks)
+        return batch
+
+    def set_epoch(self, epoch: int) -> NoReturn:
+        if isinstance(self.sampler, dat.DistributedSampler):
+            self.sampler.set_epoch(epoch)
@@ -8,12 +8,72 @@ See https://github.com/funcwj/setk/tree/master/doc/data_simu for command line us
 """
 import argparse
 import numpy as np
+import soundfile as sf
 
+from collections import OrderedDict
+from typing import Optional
 from aps.loader.audio import read_audio, add_room_response
 from aps.opts import StrToBoolAction
 from aps.const import EPSILON
 
 
+class AudioCache(object):
+    """
+    Bounded LRU cache of the decoded audio (e.g., RIRs & noises that are
+    reused among the simulation recipes). As the dataloader workers are
+    separate processes, each worker owns its own cache.
+
+    Args:
+        max_size: maximum size (MB) of the cached samples
+    """
+
+    def __init__(self, max_size: float = 256) -> None:
+        self.cache = OrderedDict()
+        self.max_bytes = int(max_size * 1024**2)
+        self.cur_bytes = 0
+        self.hits = 0
+        self.miss = 0
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Return hit rate of the audio cache
+        """
+        total = self.hits + self.miss
+        return self.hits / total if total else 0
+
+    def load(self,
+             path: str,
+             beg: Optional[int] = None,
+             end: Optional[int] = None,
+             sr: int = 16000) -> np.ndarray:
+        """
+        Load audio [beg, end) from the cache (read the whole file on miss,
+        unless it is too large to be cached)
+        """
+        if path in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(path)
+            return self.cache[path][..., beg:end]
+        self.miss += 1
+        info = sf.info(path)
+        # decoded as float32
+        if info.frames * info.channels * 4 > self.max_bytes:
+            return read_audio(path, beg=beg or 0, end=end, sr=sr)
+        samps = read_audio(path, sr=sr)
+        # cached samples are shared, make sure no one modifies them
+        samps.flags.writeable = False
+        self.cache[path] = samps
+        self.cur_bytes += samps.nbytes
+        while self.cur_bytes > self.max_bytes:
+            _, drop = self.cache.popitem(last=False)
+            self.cur_bytes -= drop.nbytes
+        return samps[..., beg:end]
+
+
 def coeff_snr(sig_pow, ref_pow, snr):
     """
     For
@@ -32,7 +92,8 @@ def add_speaker(mix_nsamps,
                 sdr,
                 src_rir=None,
                 channel=-1,
-                sr=16000):
+                sr=16000,
+                conv_method="auto"):
     """
     Mix source speakers
     """
@@ -49,7 +110,10 @@ def add_speaker(mix_nsamps,
             if channel >= 0:
                 if rir.ndim == 2:
                     rir = rir[channel:channel + 1]
-            revb, p = add_room_response(spk, rir, sr=sr)
+            revb, p = add_room_response(spk,
+                                        rir,
+                                        sr=sr,
+                                        conv_method=conv_method)
             spk_image.append(revb)
             spk_power.append(p)
     # make mix
@@ -73,7 +137,8 @@ def add_point_noise(mix_nsamps,
                     noise_rir=None,
                     channel=-1,
                     repeat=False,
-                    sr=16000):
+                    sr=16000,
+                    conv_method="auto"):
     """
     Add pointsource noises
     """
@@ -101,7 +166,10 @@ def add_point_noise(mix_nsamps,
             if channel >= 0:
                 if rir.ndim == 2:
                     rir = rir[channel:channel + 1]
-            revb, revb_power = add_room_response(noise[:dur], rir, sr=sr)
+            revb, revb_power = add_room_response(noise[:dur],
+                                                 rir,
+                                                 sr=sr,
+                                                 conv_method=conv_method)
             image.append(revb)
             image_power.append(revb_power)
     # make noise mix
@@ -115,9 +183,9 @@ def add_point_noise(mix_nsamps,
     return mix
 
 
-def load_audio(src_args, beg=None, end=None, sr=16000):
+def load_audio(src_args, beg=None, end=None, sr=16000, cache=None):
     """
-    Load audio from args.xxx
+    Load audio from args.xxx (through the AudioCache if given)
     """
     if src_args:
         src_path = src_args.split(",")
@@ -127,6 +195,11 @@ def load_audio(src_args, beg=None, end=None, sr=16000):
             beg_int = [int(v) for v in beg.split(",")]
         if end:
             end_int = [int(v) for v in end.split(",")]
+        if cache is not None:
+            return [
+                cache.load(s, sr=sr, beg=b, end=e)
+                for s, b, e in zip(src_path, beg_int, end_int)
+            ]
         return [
             read_audio(s, sr=sr, beg=b, end=e)
             for s, b, e in zip(src_path, beg_int, end_int)
@@ -135,13 +208,18 @@ def load_audio(src_args, beg=None, end=None, sr=16000):
         return None
 
 
-def run_simu(args):
+def run_simu(args, cache=None):
+    """
+    Run data simulation given the parsed options. The RIRs and noises are
+    loaded through the AudioCache if given, while the source speakers are
+    always read from disk as they are seldom reused
+    """
 
     def arg_float(src_args):
         return [float(s) for s in src_args.split(",")] if src_args else None
 
     src_spk = load_audio(args.src_spk, sr=args.sr)
-    src_rir = load_audio(args.src_rir, sr=args.sr)
+    src_rir = load_audio(args.src_rir, sr=args.sr, cache=cache)
     if src_rir:
         if len(src_rir) != len(src_spk):
             raise RuntimeError(
@@ -166,15 +244,18 @@ def run_simu(args):
     # number samples of the mixture
     mix_nsamps = max([b + s.size for b, s in zip(src_begin, src_spk)])
 
-    point_noise_rir = load_audio(args.point_noise_rir, sr=args.sr)
+    point_noise_rir = load_audio(args.point_noise_rir, sr=args.sr, cache=cache)
 
     point_noise_end = [
-        str(int(v) + mix_nsamps) for v in args.point_noise_offset.split()
+        str(int(v) + mix_nsamps)
+        for v in args.point_noise_offset.split(",")
+        if v
     ]
     point_noise = load_audio(args.point_noise,
                              beg=args.point_noise_offset,
                              end=",".join(point_noise_end),
-                             sr=args.sr)
+                             sr=args.sr,
+                             cache=cache)
 
     if args.point_noise:
         if point_noise_rir:
@@ -201,7 +282,8 @@ def run_simu(args):
                                  beg=str(args.isotropic_noise_offset),
                                  end=str(args.isotropic_noise_offset +
                                          mix_nsamps),
-                                 sr=args.sr)
+                                 sr=args.sr,
+                                 cache=cache)
     if isotropic_noise:
         isotropic_noise = isotropic_noise[0]
         isotropic_snr = arg_float(args.isotropic_noise_snr)
@@ -220,7 +302,8 @@ def run_simu(args):
                       sdr,
                       src_rir=src_rir,
                       channel=args.dump_channel,
-                      sr=args.sr)
+                      sr=args.sr,
+                      conv_method=args.conv_method)
     spk_utt = sum(spk)
     mix = spk_utt.copy()
 
@@ -234,7 +317,8 @@ def run_simu(args):
                                 noise_rir=point_noise_rir,
                                 channel=args.dump_channel,
                                 repeat=args.point_noise_repeat,
-                                sr=args.sr)
+                                sr=args.sr,
+                                conv_method=args.conv_method)
         num_channels = spk_utt.shape[0]
         if num_channels != noise.shape[0]:
             if num_channels == 1:
@@ -360,4 +444,10 @@ def make_argparse():
                         type=int,
                         default=16000,
                         help="Value of the sample rate")
+    parser.add_argument("--conv-method",
+                        type=str,
+                        default="auto",
+                        choices=["auto", "direct", "fft", "oa"],
+                        help="Method used for RIR convolution, "
+                        "\"oa\" means overlap-add FFT convolution")
     return parser
@@ -6,6 +6,7 @@
 import numpy as np
 
 from itertools import permutations
+from scipy.optimize import linear_sum_assignment
 
 from typing import Optional, Callable, Union, Tuple
 from pypesq import pesq
@@ -69,9 +70,6 @@ def _permute_eval(eval_func: Callable,
         fs: sample rate of the audio
     """
 
-    def eval_sum(ref, est):
-        return sum([eval_func(s, x, fs=fs) for s, x in zip(ref, est)])
-
     if est.ndim == 1:
         return eval_func(ref, est, fs=fs)
 
@@ -79,17 +77,22 @@ def _permute_eval(eval_func: Callable,
     if N != ref.shape[0]:
         raise RuntimeError(
             "Size do not match between estimated and reference signal")
-    metric = []
-    perm = []
-    for order in permutations(range(N)):
-        est_permu = np.stack([est[n] for n in order])
-        metric.append(eval_sum(ref, est_permu) / N)
-        perm.append(order)
+    # N x N, metric of each (reference, estimated) pair
+    pair_mat = np.array([[eval_func(s, x, fs=fs) for x in est] for s in ref])
+    if N <= 4:
+        perm = list(permutations(range(N)))
+        # search on the cached pair-wise metrics
+        metric = [pair_mat[range(N), order].sum() / N for order in perm]
+        max_idx = np.argmax(metric)
+        best_metric, best_perm = metric[max_idx], perm[max_idx]
+    else:
+        _, best_perm = linear_sum_assignment(pair_mat, maximize=True)
+        best_metric = pair_mat[range(N), best_perm].sum() / N
+        best_perm = tuple(best_perm.tolist())
     if not compute_permutation:
-        return max(metric)
+        return best_metric
     else:
-        max_idx = np.argmax(metric)
-        return max(metric), perm[max_idx]
+        return best_metric, best_perm
 
 
 def permute_metric(
@@ -127,6 +127,11 @@ def get_aps_decode_parser():
                         type=str,
                         default="best",
                         help="Tag name for RNNLM")
+    parser.add_argument("--lm-topk",
+                        type=int,
+                        default=0,
+                        help="If > 0, only score the top-k acoustic "
+                        "candidates using the ngram LM")
     parser.add_argument("--temperature",
                         type=float,
                         default=1,
@@ -232,7 +237,8 @@ class DistributedTrainParser(BaseTrainParser):
     parser.add_argument("--device-ids",
                         type=str,
                         default="0,1",
-                        help="Training on which GPU devices")
+                        help="Training on which GPU devices, "
+                        "\"cpu,cpu\" means training on two CPU processes")
     parser.add_argument("--distributed",
                         type=str,
                         default="torch",
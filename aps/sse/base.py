@@ -7,7 +7,9 @@ import torch as th
 import torch.nn as nn
 import torch.nn.functional as tf
 
+from itertools import permutations
 from typing import Optional, Union, List, NoReturn
+from aps.const import EPSILON
 
 supported_nonlinear = {
     "relu": th.relu,  # [0, +oo]
@@ -70,6 +72,74 @@ class SseBase(nn.Module):
         """
         raise NotImplementedError
 
+    def infer_chunk(self,
+                    mix: th.Tensor,
+                    chunk_len: int,
+                    chunk_hop: int = -1,
+                    mode: str = "time") -> Union[th.Tensor, List[th.Tensor]]:
+        """
+        Chunk-wise inference for long-form audio: run self.infer on the
+        overlapped chunks, align the speaker permutation of each chunk with
+        the previous one on the overlapped region, and stitch the outputs
+        using windowed overlap-add. The outputs are accumulated on CPU, so
+        the device memory is bounded by the chunk size
+        Args:
+            mix (Tensor): S or N x S (multi-channel)
+            chunk_len: length of the chunk (in samples)
+            chunk_hop: hop size of the chunk, chunk_len // 2 if <= 0
+        Return:
+            Tensor: S or [Tensor, ...]
+        """
+        if mode != "time":
+            raise RuntimeError("infer_chunk only supports time mode")
+        if chunk_hop <= 0:
+            chunk_hop = chunk_len // 2
+        if chunk_hop > chunk_len:
+            raise ValueError("chunk_hop should not be larger than chunk_len: "
+                             f"{chunk_hop} vs {chunk_len}")
+        N = mix.shape[-1]
+        if N <= chunk_len:
+            return self.infer(mix, mode=mode)
+        beg = list(range(0, N - chunk_len + 1, chunk_hop))
+        # the last chunk is aligned to the end of the audio (no padding)
+        if beg[-1] + chunk_len < N:
+            beg.append(N - chunk_len)
+        # window is non-zero everywhere, so the first/last samples are kept
+        wnd = th.hann_window(chunk_len + 2)[1:-1]
+        wnd_sum = th.zeros(N)
+        sep, prev = None, None
+        for t in beg:
+            cur = self.infer(mix[..., t:t + chunk_len], mode=mode)
+            cur = [cur] if isinstance(cur, th.Tensor) else cur
+            # the output may be a bit shorter than the chunk (e.g., STFT)
+            cur = [c[..., :chunk_len].cpu() for c in cur]
+            dur = cur[0].shape[-1]
+            if prev is not None and len(cur) > 1:
+                # choose the permutation that best matches the previous chunk
+                prev_beg, prev = prev
+                lag = t - prev_beg
+                end = min(prev[0].shape[-1] - lag, dur)
+                if end > 0:
+                    ref = [p[..., lag:lag + end].flatten() for p in prev]
+                    est = [c[..., :end].flatten() for c in cur]
+                    sim = [[tf.cosine_similarity(r, e, dim=0)
+                            for e in est]
+                           for r in ref]
+                    permu = max(
+                        permutations(range(len(cur))),
+                        key=lambda p: sum(sim[i][j] for i, j in enumerate(p)))
+                    cur = [cur[j] for j in permu]
+            if sep is None:
+                sep = [th.zeros(c.shape[:-1] + (N,)) for c in cur]
+            for s, c in zip(sep, cur):
+                s[..., t:t + dur] += c * wnd[:dur]
+            wnd_sum[t:t + dur] += wnd[:dur]
+            prev = (t, cur)
+        # samples not covered by any output are zeros
+        wnd_sum = th.clamp_min(wnd_sum, EPSILON)
+        sep = [s / wnd_sum for s in sep]
+        return sep[0] if len(sep) == 1 else sep
+
 
 class MaskNonLinear(nn.Module):
     """
@@ -23,9 +23,11 @@ try:
 except ImportError:
     warprnnt_pt_objf = None
 
-from typing import Tuple, Dict, NoReturn, Optional
+from contextlib import contextmanager
+from typing import Tuple, Dict, NoReturn, Optional, Iterator
 from aps.task.base import Task
 from aps.task.objf import ce_objf, ls_objf, ctc_objf
+from aps.asr.lm.xfmr import TorchXfmrLM
 from aps.const import IGNORE_ID
 from aps.libs import ApsRegisters
 
@@ -78,6 +80,23 @@ def prep_asr_label(
     return tgt_v1, tgt_v2
 
 
+@contextmanager
+def feats_cache(nnet: nn.Module, key: Optional[str]) -> Iterator[None]:
+    """
+    Let asr_transform of the network take the cached features as input
+    (key is the hash key of the feature cache, None if not cached)
+    """
+    if key is None:
+        yield
+        return
+    transform = getattr(nnet, "asr_transform", None)
+    if transform is None or not hasattr(transform, "cached_input"):
+        raise RuntimeError("Got cached features while the network doesn't " +
+                           "have asr FeatureTransform")
+    with transform.cached_input(key):
+        yield
+
+
 def load_label_count(label_count: str) -> Optional[th.Tensor]:
     """
     Load tensor from a label count file
@@ -157,11 +176,12 @@ class CtcXentHybridTask(Task):
         # outs: N x (To+1) x V
         # alis: N x (To+1) x Ti
         ssr = egs["ssr"] if "ssr" in egs else 0
-        outs, _, ctc_enc, enc_len = self.nnet(egs["src_pad"],
-                                              egs["src_len"],
-                                              tgt_pad,
-                                              egs["tgt_len"],
-                                              ssr=ssr)
+        with feats_cache(self.nnet, egs.get("cached", None)):
+            outs, _, ctc_enc, enc_len = self.nnet(egs["src_pad"],
+                                                  egs["src_len"],
+                                                  tgt_pad,
+                                                  egs["tgt_len"],
+                                                  ssr=ssr)
         # compute loss
         if self.lsm_factor > 0:
             att_loss = ls_objf(outs,
@@ -252,8 +272,9 @@ class TransducerTask(Task):
                                     pad_value=self.blank)
         tgt_len = egs["tgt_len"]
         # N x Ti x To+1 x V
-        outs, enc_len = self.nnet(egs["src_pad"], egs["src_len"], tgt_pad,
-                                  tgt_len)
+        with feats_cache(self.nnet, egs.get("cached", None)):
+            outs, enc_len = self.nnet(egs["src_pad"], egs["src_len"], tgt_pad,
+                                      tgt_len)
         rnnt_kwargs = {"blank": self.blank, "reduction": "sum"}
         # add log_softmax if use https://github.com/1ytic/warp-rnnt
         if self.interface == "warp_rnnt":
@@ -272,7 +293,7 @@ class LmXentTask(Task):
     For LM training (Xent loss)
     Args:
         nnet: language model
-        bptt_mode: reuse hidden state in previous batch (for BPTT)
+        bptt_mode: reuse hidden state in previous batch (for BPTT, RNN LM only)
         reduction: reduction option applied to the sum of the loss
     """
 
@@ -284,6 +305,10 @@ class LmXentTask(Task):
                                          description="Xent for LM training")
         if reduction not in ["mean", "batchmean"]:
             raise ValueError(f"Unsupported reduction option: {reduction}")
+        # hidden of the transformer LM is the key & value cache of all the
+        # history tokens, which keeps growing if reused among batches
+        if bptt_mode and isinstance(nnet, TorchXfmrLM):
+            raise ValueError("bptt_mode is not supported by asr@xfmr_lm")
         self.hidden = None
         self.bptt_mode = bptt_mode
         self.reduction = reduction
@@ -6,6 +6,7 @@ import torch.nn as nn
 import torch.nn.functional as tf
 
 from itertools import permutations
+from scipy.optimize import linear_sum_assignment
 from typing import List, Any, Callable, Optional
 from aps.const import IGNORE_ID
 
@@ -164,20 +165,37 @@ def multiple_objf(inp: List[Any],
     return loss
 
 
+def permu_index(permu: List[int]) -> int:
+    """
+    Return index of the permutation in permutations(range(len(permu)))
+    (lexicographic order)
+    """
+    index = 0
+    for i, p in enumerate(permu):
+        index = index * (len(permu) - i) + sum(q < p for q in permu[i + 1:])
+    return index
+
+
 def permu_invarint_objf(inp: List[Any],
                         ref: List[Any],
                         objf: Callable,
                         transform: Optional[Callable] = None,
                         batchmean: bool = False,
-                        return_permutation: bool = False) -> th.Tensor:
+                        return_permutation: bool = False,
+                        search: str = "auto") -> th.Tensor:
     """
-    Compute permutation-invariant loss
+    Compute permutation-invariant loss. The pair-wise loss matrix is computed
+    once and the best assignment is searched on the cached entries
     Args:
         inp (list(Object)): estimated list
         ref (list(Object)): reference list
         objf (function): function to compute single pair loss (per mini-batch)
         transform (callable): transform function on inp & ref
         batchmean (bool): return mean value of the loss
+        search (str): how to search the best assignment
+            exhaustive: enumerate all the permutations
+            hungarian: use Hungarian algorithm (scipy's linear_sum_assignment)
+            auto: exhaustive if #speakers <= 4 else hungarian
     Return:
         loss (Tensor): N (per mini-batch) if batchmean == False
     """
@@ -185,23 +203,41 @@ def permu_invarint_objf(inp: List[Any],
     if num_spks != len(ref):
         raise ValueError("Size mismatch between #inp and " +
                          f"#ref: {num_spks} vs {len(ref)}")
-
-    def permu_objf(permu, out, ref):
-        """
-        Return tensor (P x N) for each permutation and mini-batch
-        """
-        return sum([objf(out[s], ref[t]) for s, t in enumerate(permu)
-                   ]) / len(permu)
+    if search not in ["auto", "exhaustive", "hungarian"]:
+        raise ValueError(f"Unknown search method for PIT: {search}")
+    if search == "auto":
+        search = "exhaustive" if num_spks <= 4 else "hungarian"
 
     if transform:
         inp = [transform(i) for i in inp]
         ref = [transform(r) for r in ref]
 
-    loss_mat = th.stack(
-        [permu_objf(p, inp, ref) for p in permutations(range(num_spks))])
-
+    # S x S x N, loss of each (estimated, reference) pair
+    pair_mat = th.stack([
+        th.stack([objf(inp[s], ref[t])
+                  for t in range(num_spks)])
+        for s in range(num_spks)
+    ])
     # if we want to maximize the objective, i.e, snr, remember to add negative flag to the objf
-    loss, index = th.min(loss_mat, dim=0)
+    if search == "exhaustive":
+        # P x S
+        permu = th.tensor(list(permutations(range(num_spks))),
+                          device=pair_mat.device)
+        # P x S x N => P x N
+        loss_mat = pair_mat[th.arange(num_spks)[None, :], permu].sum(1)
+        loss, index = th.min(loss_mat / num_spks, dim=0)
+    else:
+        # N x S x S
+        cost = pair_mat.detach().permute(2, 0, 1).cpu().numpy()
+        # N x S
+        assignment = [linear_sum_assignment(c)[1].tolist() for c in cost]
+        permu = th.tensor(assignment, device=pair_mat.device)
+        # S x N
+        loss = pair_mat[th.arange(num_spks)[:, None], permu.T,
+                        th.arange(permu.shape[0])]
+        loss = th.mean(loss, 0)
+        index = th.tensor([permu_index(a) for a in assignment],
+                          device=pair_mat.device)
     if batchmean:
         loss = th.mean(loss)
     if return_permutation:
@@ -247,10 +283,12 @@ class PermuInvarintObjfComputer(nn.Module):
                 objf: Callable,
                 transform: Optional[Callable] = None,
                 batchmean: bool = False,
-                return_permutation: bool = False) -> th.Tensor:
+                return_permutation: bool = False,
+                search: str = "auto") -> th.Tensor:
         return permu_invarint_objf(inp,
                                    ref,
                                    objf,
                                    transform=transform,
                                    return_permutation=return_permutation,
-                                   batchmean=batchmean)
+                                   batchmean=batchmean,
+                                   search=search)
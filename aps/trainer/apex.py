@@ -52,6 +52,9 @@ class ApexTrainer(Trainer):
                  report_metrics: List[str] = ["loss"],
                  reduction_tag: str = "none",
                  stop_on_errors: int = 10,
+                 async_checkpoint: int = 0,
+                 profile_interval: int = -1,
+                 profile_trace: Optional[List[int]] = None,
                  **kwargs) -> None:
         super(ApexTrainer,
               self).__init__(task,
@@ -78,12 +81,17 @@ class ApexTrainer(Trainer):
                              no_impr_thres=no_impr_thres,
                              report_metrics=report_metrics,
                              stop_on_errors=stop_on_errors,
+                             async_checkpoint=async_checkpoint,
+                             profile_interval=profile_interval,
+                             profile_trace=profile_trace,
                              reduction_tag=reduction_tag)
         if dist.get_backend() not in ["torch", "none"]:
             raise ValueError(
                 "ApexTrainer should use torch/none as distributed backend")
         if not apex_available:
             raise ValueError("apex is not installed in current machine")
+        if self.default_device.type != "cuda":
+            raise ValueError("ApexTrainer doesn't support CPU training")
         self.setup_distributed(opt_level)
 
     def setup_distributed(self, opt_level: str) -> NoReturn:
@@ -97,7 +105,7 @@ class ApexTrainer(Trainer):
                                                         self.optimizer,
                                                         opt_level=opt_level)
         self.reporter.log(f"Apex: Using opt-level {opt_level}")
-        if self.cuda_devices >= 2:
+        if self.num_devices >= 2:
             self.distributed = True
             self.reporter.log(
                 f"Apex: using distributed data parallel (DDP), rank={self.rank}, "
@@ -123,7 +131,8 @@ class ApexTrainer(Trainer):
         if self.weight_noise_adder:
             self.weight_noise_adder(self.task, self.cur_step)
 
-        stats = self.task(egs)
+        with self.profiler.phase("forward"):
+            stats = self.task(egs)
         # use all reduce to check loss
         if self.distributed:
             loss = dist.all_reduce(stats["loss"].clone()).item()
@@ -131,24 +140,28 @@ class ApexTrainer(Trainer):
             loss = stats["loss"].item()
         # backward if not nan/inf
         if math.isfinite(loss):
-            with apex.amp.scale_loss(stats["loss"],
-                                     self.optimizer) as scaled_loss:
-                scaled_loss.backward()
+            with self.profiler.phase("backward"):
+                with apex.amp.scale_loss(stats["loss"],
+                                         self.optimizer) as scaled_loss:
+                    scaled_loss.backward()
         else:
             self.reporter.log(f"Invalid loss {loss:.3f}, skip...")
             return False
 
         # clip gradient after backward
         norm = -1
-        if self.clip_gradient:
-            # for apex
-            norm = clip_grad_norm_(apex.amp.master_params(self.optimizer),
-                                   self.clip_gradient)
+        with self.profiler.phase("optimizer"):
+            if self.clip_gradient:
+                # for apex
+                norm = clip_grad_norm_(apex.amp.master_params(self.optimizer),
+                                       self.clip_gradient)
+            # step optimizer
+            if math.isfinite(norm):
+                self.optimizer.step()
+                self.optimizer.zero_grad()
 
-        # step optimizer and update statistics
+        # update statistics
         if math.isfinite(norm):
-            self.optimizer.step()
-            self.optimizer.zero_grad()
             if norm != -1:
                 stats["norm"] = norm
             stats["rate"] = self.optimizer.param_groups[0]["lr"]
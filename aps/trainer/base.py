@@ -1,14 +1,22 @@
 # Copyright 2019 Jian Wu
 # License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
 
+import os
+import copy
+import json
 import math
+import time
+import inspect
+import resource
 import warnings
+import threading
 
 from pathlib import Path
+from contextlib import contextmanager
 from collections import defaultdict, OrderedDict
 
 import torch as th
-from typing import Optional, Dict, List, Union, Tuple, NoReturn, Iterable
+from typing import Optional, Dict, List, Union, Tuple, NoReturn, Iterable, Iterator, Any
 from aps.trainer.ss import SsScheduler
 from aps.trainer.lr import LrScheduler
 from aps.utils import load_obj, get_device_ids, get_logger, SimpleTimer
@@ -226,6 +234,206 @@ class ProgressReporter(object):
         return reports, logstr
 
 
+class StepProfiler(object):
+    """
+    Step-level profiler used in Trainer class. It records the time cost of
+    data loading (data), host-to-device copy (h2d), forward, backward and
+    optimizer step, the throughput (#utt/#tok/#frame per second) and the peak
+    memory, and reports the averaged numbers every #interval steps to the
+    tensorboard and a JSON log (one record per line). The trace of the
+    training steps in [beg, end) can be dumped using the PyTorch profiler
+    Args:
+        checkpoint: checkpoint directory (for JSON log & trace files)
+        device: training device
+        reporter: ProgressReporter object
+        rank: rank value (for distributed training only)
+        interval: report interval (disable the timing if <= 0)
+        trace_steps: [beg, end], steps to dump the profiler trace
+    """
+    phases = ["data", "h2d", "forward", "backward", "optimizer"]
+
+    def __init__(self,
+                 checkpoint: Path,
+                 device: th.device,
+                 reporter: ProgressReporter,
+                 rank: Optional[int] = None,
+                 interval: int = -1,
+                 trace_steps: Optional[List[int]] = None) -> None:
+        self.enabled = interval > 0
+        self.interval = interval
+        self.device = device
+        self.reporter = reporter
+        self.checkpoint = checkpoint
+        self.suffix = "" if rank is None else f".rank.{rank}"
+        self.json_path = checkpoint / f"profile{self.suffix}.json"
+        if trace_steps:
+            if len(trace_steps) != 2 or trace_steps[0] >= trace_steps[1]:
+                raise ValueError(f"Invalid trace_steps: {trace_steps}")
+            self.trace_beg, self.trace_end = trace_steps
+        else:
+            self.trace_beg, self.trace_end = -1, -1
+        self.trace = None
+        self.reset()
+        self.begin()
+
+    def reset(self) -> NoReturn:
+        """
+        Clear the accumulated statistics
+        """
+        self.cost = defaultdict(float)
+        self.count = defaultdict(float)
+        self.num_steps = 0
+        self.wall_time = 0
+        if self.device.type == "cuda":
+            th.cuda.reset_peak_memory_stats(self.device)
+
+    def begin(self) -> NoReturn:
+        """
+        Mark the beginning of the training steps (e.g., after validation)
+        """
+        self.last = time.time()
+
+    def _sync(self) -> NoReturn:
+        """
+        Wait for the asynchronous CUDA kernels
+        """
+        if self.device.type == "cuda":
+            th.cuda.synchronize(self.device)
+
+    def _peak_memory(self) -> float:
+        """
+        Return the peak memory (MB)
+        """
+        if self.device.type == "cuda":
+            return th.cuda.max_memory_allocated(self.device) / 1024**2
+        # ru_maxrss is in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    @contextmanager
+    def _timing(self, name: str) -> Iterator[None]:
+        """
+        Accumulate the time cost of the phase
+        """
+        if not self.enabled:
+            yield
+            return
+        self._sync()
+        tic = time.time()
+        yield
+        self._sync()
+        self.cost[name] += time.time() - tic
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Time one phase of the training step (labeled in the trace if the
+        PyTorch profiler is running)
+        """
+        if self.trace is None:
+            with self._timing(name):
+                yield
+        else:
+            with th.autograd.profiler.record_function(name), self._timing(name):
+                yield
+
+    def data_ready(self, egs: Dict, step: int) -> NoReturn:
+        """
+        Called when the egs (on CPU) are loaded for the training step #step
+        """
+        if self.trace is None and self.trace_beg <= step < self.trace_end:
+            self._start_trace()
+        if not self.enabled:
+            return
+        self.cost["data"] += time.time() - self.last
+        for key in ["#utt", "#tok"]:
+            if key in egs:
+                self.count[key] += float(egs[key])
+        if "src_len" in egs:
+            self.count["#frame"] += egs["src_len"].sum().item()
+
+    def step(self, step: int, epoch: int) -> NoReturn:
+        """
+        Called at the end of the training step (step = current step number)
+        """
+        if self.trace is not None and step >= self.trace_end:
+            self._stop_trace()
+        if not self.enabled:
+            return
+        now = time.time()
+        self.wall_time += now - self.last
+        self.num_steps += 1
+        if self.num_steps == self.interval:
+            self._report(step, epoch)
+        self.last = time.time()
+
+    def _report(self, step: int, epoch: int) -> NoReturn:
+        """
+        Report the averaged statistics
+        """
+        record = {"step": step, "epoch": epoch, "#steps": self.num_steps}
+        for name in self.phases:
+            # ms per step
+            record[f"time/{name}"] = self.cost[name] * 1000 / self.num_steps
+        for key, value in self.count.items():
+            record[f"{key[1:]}/s"] = value / max(self.wall_time, 1e-6)
+        record["peak_mem"] = self._peak_memory()
+        with open(self.json_path, "a") as json_f:
+            json_f.write(json.dumps(record) + "\n")
+        board_writer = self.reporter.board_writer
+        if board_writer:
+            for key, value in record.items():
+                if key not in ["step", "epoch", "#steps"]:
+                    board_writer.add_scalar(f"profile/{key}", value, step)
+        cost = "/".join(
+            [f"{record[f'time/{name}']:.1f}" for name in self.phases])
+        speed = ", ".join([
+            f"{key} = {value:.1f}" for key, value in record.items()
+            if key[-2:] == "/s"
+        ])
+        self.reporter.log(f"Profile on step {step}: {'/'.join(self.phases)}" +
+                          f" = {cost} ms, {speed}, peak memory = " +
+                          f"{record['peak_mem']:.1f} MB")
+        self.reset()
+
+    def _start_trace(self) -> NoReturn:
+        """
+        Start the PyTorch profiler
+        """
+        use_cuda = self.device.type == "cuda"
+        if hasattr(th, "profiler") and hasattr(th.profiler, "profile"):
+            activities = [th.profiler.ProfilerActivity.CPU]
+            if use_cuda:
+                activities.append(th.profiler.ProfilerActivity.CUDA)
+            self.trace = th.profiler.profile(activities=activities,
+                                             record_shapes=True)
+        else:
+            self.trace = th.autograd.profiler.profile(use_cuda=use_cuda,
+                                                      record_shapes=True)
+        self.trace.__enter__()
+        self.reporter.log("Start profiling the training steps " +
+                          f"[{self.trace_beg}, {self.trace_end}) ...")
+
+    def _stop_trace(self) -> NoReturn:
+        """
+        Stop the PyTorch profiler and dump the trace (in chrome trace format)
+        """
+        self.trace.__exit__(None, None, None)
+        trace_path = self.checkpoint / (
+            f"trace.{self.trace_beg}-{self.trace_end}{self.suffix}.json")
+        self.trace.export_chrome_trace(trace_path.as_posix())
+        self.trace = None
+        # don't trace again
+        self.trace_beg, self.trace_end = -1, -1
+        self.reporter.log(f"Dump profiler trace to {trace_path}")
+
+    def close(self) -> NoReturn:
+        """
+        Stop the unfinished tracing
+        """
+        if self.trace is not None:
+            self._stop_trace()
+
+
 class ErrorDetector(object):
     """
     Detect the training errors
@@ -266,6 +474,216 @@ class ErrorDetector(object):
         return self.stop()
 
 
+def cpu_snapshot(obj: Any) -> Any:
+    """
+    Return a copy of the object with all tensors copied to CPU memory, so
+    the states can be serialized while the training keeps going
+    """
+    if isinstance(obj, th.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        # keep the type of the dict (e.g., OrderedDict)
+        copied = copy.copy(obj)
+        for key, val in obj.items():
+            copied[key] = cpu_snapshot(val)
+        return copied
+    if isinstance(obj, list):
+        return [cpu_snapshot(val) for val in obj]
+    if isinstance(obj, tuple):
+        return tuple(cpu_snapshot(val) for val in obj)
+    return obj
+
+
+class CheckpointSaver(object):
+    """
+    Write checkpoints to the disk (using atomic rename). If max_inflight > 0,
+    the states are snapshotted to CPU memory first and written by a
+    background thread, with at most #max_inflight saves pending, call flush()
+    to wait for them
+    Args:
+        max_inflight: maximum number of the pending saves (0 means saving
+                      synchronously)
+    """
+
+    def __init__(self, max_inflight: int = 0) -> None:
+        self.max_inflight = max_inflight
+        self.error = None
+        if max_inflight > 0:
+            self.slots = threading.BoundedSemaphore(max_inflight)
+            self.pending = []
+            self.lock = threading.Lock()
+            self.cond = threading.Condition(self.lock)
+            self.worker = threading.Thread(target=self._worker, daemon=True)
+            self.worker.start()
+
+    def _write(self, states: Dict, cpt_path: Path) -> NoReturn:
+        """
+        Write checkpoint to a temporary file and then rename it
+        """
+        tmp_path = cpt_path.with_name(f"{cpt_path.name}.tmp")
+        th.save(states, tmp_path)
+        os.replace(tmp_path, cpt_path)
+
+    def _worker(self) -> NoReturn:
+        """
+        Background thread to write the checkpoints in order
+        """
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                states, cpt_path = self.pending[0]
+            try:
+                self._write(states, cpt_path)
+            except Exception as err:
+                self.error = err
+            with self.cond:
+                self.pending.pop(0)
+                self.cond.notify_all()
+            self.slots.release()
+
+    def _check_error(self) -> NoReturn:
+        """
+        Raise the error in background thread
+        """
+        if self.error is not None:
+            err, self.error = self.error, None
+            raise RuntimeError(f"Failed to save checkpoint: {err}") from err
+
+    def save(self, states: Dict, cpt_path: Path) -> NoReturn:
+        """
+        Save checkpoint (block if there are #max_inflight pending saves)
+        """
+        self._check_error()
+        if self.max_inflight <= 0:
+            self._write(states, cpt_path)
+        else:
+            self.slots.acquire()
+            states = cpu_snapshot(states)
+            with self.cond:
+                self.pending.append((states, cpt_path))
+                self.cond.notify_all()
+
+    def flush(self) -> NoReturn:
+        """
+        Wait until all the pending checkpoints are written
+        """
+        if self.max_inflight > 0:
+            with self.cond:
+                while self.pending:
+                    self.cond.wait()
+        self._check_error()
+
+
+class CheckpointAverager(object):
+    """
+    Average the model parameters of the checkpoints in a streaming manner,
+    i.e., only the running average and one checkpoint are kept in memory
+    Args:
+        mode: mean|ema, (weighted) arithmetic mean or exponential moving
+              average (avg = ema_decay * avg + (1 - ema_decay) * cur)
+        ema_decay: decay factor used in "ema" mode
+        mmap: memory-map the checkpoints when loading (need th.load() to
+              support it, otherwise fall back to the normal loading)
+    """
+
+    def __init__(self,
+                 mode: str = "mean",
+                 ema_decay: float = 0.9,
+                 mmap: bool = False) -> None:
+        if mode not in ["mean", "ema"]:
+            raise ValueError(f"Unsupported averaging mode: {mode}")
+        if mode == "ema" and not 0 <= ema_decay < 1:
+            raise ValueError(f"ema_decay should be in [0, 1), got {ema_decay}")
+        if mmap and "mmap" not in inspect.signature(th.load).parameters:
+            warnings.warn("th.load() doesn't support mmap in current " +
+                          "PyTorch version, load checkpoints as normal")
+            mmap = False
+        self.mode = mode
+        self.ema_decay = ema_decay
+        self.mmap = mmap
+        self.averaged = OrderedDict()
+        self.stats = {}
+        self.num_cpts = 0
+        self.weight_sum = 0
+        self.finalized = False
+
+    def _load(self, cpt_path: Union[str, Path]) -> Dict:
+        """
+        Load the checkpoint to CPU
+        """
+        if self.mmap:
+            return th.load(cpt_path, map_location="cpu", mmap=True)
+        return th.load(cpt_path, map_location="cpu")
+
+    def add(self, cpt_path: Union[str, Path], weight: float = 1) -> NoReturn:
+        """
+        Accumulate the model parameters of one checkpoint (weight is ignored
+        in "ema" mode)
+        """
+        if self.finalized:
+            raise RuntimeError("Can't add checkpoints after average()")
+        if self.mode == "mean" and weight <= 0:
+            raise ValueError(f"weight should be positive, got {weight}")
+        cpt = self._load(cpt_path)
+        param = cpt["model_state"]
+        if self.num_cpts and param.keys() != self.averaged.keys():
+            raise RuntimeError(f"Parameters in {cpt_path} mismatch with " +
+                               "the previous checkpoints")
+        for key, p in param.items():
+            if not p.is_floating_point():
+                # e.g., num_batches_tracked of BatchNorm, keep the sum
+                # in "mean" mode and the latest one in "ema" mode
+                if key not in self.averaged or self.mode == "ema":
+                    self.averaged[key] = p.clone()
+                else:
+                    self.averaged[key] += p
+            elif key not in self.averaged:
+                self.averaged[key] = p.clone() if self.mode == "ema" else (
+                    p * weight)
+            elif self.mode == "ema":
+                self.averaged[key].mul_(self.ema_decay).add_(p,
+                                                             alpha=1 -
+                                                             self.ema_decay)
+            else:
+                self.averaged[key].add_(p, alpha=weight)
+        for key in ["step", "epoch"]:
+            if key in cpt:
+                self.stats[key] = cpt[key]
+        self.num_cpts += 1
+        self.weight_sum += weight
+        # release the checkpoint before loading the next one
+        del cpt, param
+
+    def average(self) -> Dict:
+        """
+        Return the averaged model parameters (no more checkpoints can be
+        added after calling it)
+        """
+        if not self.num_cpts:
+            raise RuntimeError("No checkpoints are added")
+        if not self.finalized and self.mode == "mean":
+            for key, p in self.averaged.items():
+                if p.is_floating_point():
+                    p.div_(self.weight_sum)
+                else:
+                    p //= self.num_cpts
+        self.finalized = True
+        return self.averaged
+
+    def save(self, cpt_path: Union[str, Path], **kwargs) -> NoReturn:
+        """
+        Save the averaged model in the format of the training checkpoints
+        (i.e., loadable by NnetEvaluator)
+        """
+        states = {"step": 0, "epoch": 0}
+        states.update(self.stats)
+        states.update(kwargs)
+        states["model_state"] = self.average()
+        states["num_averaged"] = self.num_cpts
+        CheckpointSaver().save(states, Path(cpt_path))
+
+
 class StopDetector(object):
     """
     To manage the early stop of the training
@@ -344,7 +762,7 @@ class Trainer(object):
     Args:
         task: Task class from aps.task
         rank: rank value (for distributed training)
-        device_ids: GPU device ID
+        device_ids: GPU device ID (negative values for CPU training)
         checkpoint: directory for checkpoint storage
         optimizer: optimizer name (see function create_optimizer)
         optimizer_kwargs: parameters for the optimizer
@@ -366,6 +784,12 @@ class Trainer(object):
         report_metrics: metrics to be tracked during training
         reduction_tag: used in ProgressReporter
         stop_on_errors: stop training if #stop_on_errors consecutive errors exist
+        async_checkpoint: if > 0, save checkpoints in a background thread with
+                          at most #async_checkpoint pending saves
+        profile_interval: if > 0, profile the training steps and report the
+                          statistics every #profile_interval steps
+        profile_trace: [beg, end], dump the PyTorch profiler trace of the
+                       training steps in [beg, end)
     """
 
     def __init__(self,
@@ -396,6 +820,9 @@ class Trainer(object):
                  report_metrics: List[str] = ["loss"],
                  reduction_tag: str = "none",
                  stop_on_errors: int = 10,
+                 async_checkpoint: int = 0,
+                 profile_interval: int = -1,
+                 profile_trace: Optional[List[int]] = None,
                  **kwargs) -> None:
         if not isinstance(task, Task):
             raise TypeError(
@@ -410,21 +837,25 @@ class Trainer(object):
             raise ValueError(f"Got invalid rank value: {rank}")
         if not isinstance(device_ids, tuple):
             device_ids = get_device_ids(device_ids)
-        self.cuda_devices = len(device_ids)
+        self.num_devices = len(device_ids)
         self.device_ids = device_ids
 
         if rank is None:
-            # single GPU
-            self.default_device = th.device(f"cuda:{device_ids[0]:d}")
+            # single device
+            device_id = device_ids[0]
         else:
             # in distributed mode
-            if rank >= self.cuda_devices:
-                raise ValueError("rank value exceeds number of GPUs: " +
-                                 f"{rank} vs {self.cuda_devices}")
-            self.default_device = th.device(f"cuda:{device_ids[rank]:d}")
+            if rank >= self.num_devices:
+                raise ValueError("rank value exceeds number of devices: " +
+                                 f"{rank} vs {self.num_devices}")
+            device_id = device_ids[rank]
 
-        # avoid alloc memory from gpu0
-        th.cuda.set_device(self.default_device)
+        if device_id < 0:
+            self.default_device = th.device("cpu")
+        else:
+            self.default_device = th.device(f"cuda:{device_id:d}")
+            # avoid alloc memory from gpu0
+            th.cuda.set_device(self.default_device)
 
         self.rank = rank
         self.checkpoint = Path(checkpoint)
@@ -439,6 +870,12 @@ class Trainer(object):
                                          period=prog_interval,
                                          tensorboard=tensorboard,
                                          reduction_tag=reduction_tag)
+        self.profiler = StepProfiler(self.checkpoint,
+                                     self.default_device,
+                                     self.reporter,
+                                     rank=rank,
+                                     interval=profile_interval,
+                                     trace_steps=profile_trace)
         if weight_noise_std is None:
             self.weight_noise_adder = None
         else:
@@ -461,6 +898,9 @@ class Trainer(object):
                                           no_impr_thres=no_impr_thres)
         self.stop_on_errors = stop_on_errors
         self.detector = ErrorDetector(stop_on_errors)
+        # only rank 0 saves checkpoints
+        self.saver = CheckpointSaver(async_checkpoint if self.rank in
+                                     [0, None] else 0)
         self.task = task
         self.task.to(self.default_device)
         if self.rank in [0, None]:
@@ -520,12 +960,12 @@ class Trainer(object):
         ]) / 10.0**6
         # logging
         if rank is None:
-            self.reporter.log(f"Load model to GPU:{device_ids[0]}, " +
+            self.reporter.log(f"Load model to {self.default_device}, " +
                               f"#param: {self.num_params:.2f}M")
         else:
-            self.reporter.log(
-                f"Load model to GPU-{rank}/{self.cuda_devices}, " +
-                f"#param: {self.num_params:.2f}M")
+            self.reporter.log(f"Load model to {self.default_device} " +
+                              f"(rank {rank}/{self.num_devices}), " +
+                              f"#param: {self.num_params:.2f}M")
 
         self.reporter.log(
             f"Track the metrics during training: {report_metrics}, " +
@@ -543,6 +983,12 @@ class Trainer(object):
         if save_interval > 0:
             self.reporter.log("Will save model states only in #epoch.pt.tar " +
                               f"(interval = {save_interval})")
+        if async_checkpoint > 0:
+            self.reporter.log("Save checkpoints asynchronously, " +
+                              f"#max_inflight = {async_checkpoint}")
+        if profile_interval > 0:
+            self.reporter.log("Profile the training steps, report per " +
+                              f"{profile_interval} steps")
 
     def create_optimizer(self,
                          optimizer: str,
@@ -638,7 +1084,7 @@ class Trainer(object):
             cpt_name = f"{tag}.pt.tar"
             if not keep_optimizer and "optimizer_state" in cpt:
                 _ = cpt.pop("optimizer_state")
-            th.save(cpt, self.checkpoint / cpt_name)
+            self.saver.save(cpt, self.checkpoint / cpt_name)
             self.reporter.log(
                 f"Save checkpoint ==> {self.checkpoint / cpt_name}")
 
@@ -650,29 +1096,19 @@ class Trainer(object):
             return
         if self.rank not in [0, None]:
             return
+        # make sure the checkpoints are on the disk
+        self.saver.flush()
         self.reporter.log("Average checkpoints best.pt.tar + no_impr" +
                           f".(1..{self.no_impr}).pt.tar ...")
-        averaged = OrderedDict()
+        averager = CheckpointAverager()
         for i in range(self.no_impr + 1):
             name = f"no_impr.{i}.pt.tar" if i else "best.pt.tar"
-            cpt = th.load(self.checkpoint / name, map_location="cpu")
-            param = cpt["model_state"]
-            for key in param.keys():
-                p = param[key]
-                if key not in averaged:
-                    averaged[key] = p.clone()
-                else:
-                    averaged[key] += p
-        for key in averaged:
-            if averaged[key].is_floating_point():
-                averaged[key].div_(self.no_impr + 1)
-            else:
-                averaged[key] //= (self.no_impr + 1)
+            averager.add(self.checkpoint / name)
 
         final = {
             "step": self.cur_step,
             "epoch": self.cur_epoch,
-            "model_state": averaged,
+            "model_state": averager.average(),
             "num_parameters": self.num_params
         }
         self.save_checkpoint(final, tag="avg", enable_subroutine=False)
@@ -709,13 +1145,17 @@ class Trainer(object):
         self.task.train()
         self.reporter.train()
         self.detector.reset()
+        self.profiler.begin()
         for egs in data_loader:
+            self.profiler.data_ready(egs, self.cur_step)
             # load to gpu
-            egs = self.prep_egs(egs)
+            with self.profiler.phase("h2d"):
+                egs = self.prep_egs(egs)
             # make one training step
             succ = self.train_one_step(egs)
             if succ:
                 self.cur_step += 1
+            self.profiler.step(self.cur_step, self.cur_epoch)
             if self.detector.step(succ):
                 break
         stop = self.detector.stop()
@@ -856,6 +1296,7 @@ class Trainer(object):
         Running in batch mode: for large training set, treat several batches as one training epoch
         """
         stop = False
+        self.profiler.begin()
         while True:
             # trained on several batches
             for egs in trn_loader:
@@ -866,10 +1307,13 @@ class Trainer(object):
                     self.detector.reset()
                     trn_loader.set_epoch(self.cur_epoch)
                 # update per-batch
-                egs = self.prep_egs(egs)
+                self.profiler.data_ready(egs, self.cur_step)
+                with self.profiler.phase("h2d"):
+                    egs = self.prep_egs(egs)
                 succ = self.train_one_step(egs)
                 if succ:
                     self.cur_step += 1
+                self.profiler.step(self.cur_step, self.cur_epoch)
                 if self.detector.step(succ):
                     self.reporter.log(
                         f"Stop training as detecting {self.stop_on_errors} " +
@@ -886,6 +1330,8 @@ class Trainer(object):
                     if end or self.cur_epoch == num_epochs:
                         stop = True
                         break
+                    # exclude the validation time
+                    self.profiler.begin()
             if stop:
                 break
             self.reporter.log(
@@ -907,17 +1353,23 @@ class Trainer(object):
         self.reporter.log(f"Training for {num_epochs} epochs ...")
         timer = SimpleTimer()
         self.prep_run(dev_loader)
-        if eval_interval > 0:
-            done_epoch = self.run_in_batch(trn_loader,
-                                           dev_loader,
-                                           num_epochs=num_epochs,
-                                           eval_interval=eval_interval *
-                                           self.acmu_gradient)
-        else:
-            done_epoch = self.run_in_epoch(trn_loader,
-                                           dev_loader,
-                                           num_epochs=num_epochs)
+        try:
+            if eval_interval > 0:
+                done_epoch = self.run_in_batch(trn_loader,
+                                               dev_loader,
+                                               num_epochs=num_epochs,
+                                               eval_interval=eval_interval *
+                                               self.acmu_gradient)
+            else:
+                done_epoch = self.run_in_epoch(trn_loader,
+                                               dev_loader,
+                                               num_epochs=num_epochs)
+        finally:
+            self.profiler.close()
+            # flush the pending checkpoints on shutdown
+            self.saver.flush()
         self.average_checkpoints()
+        self.saver.flush()
         hours = timer.elapsed() / 60
         self.reporter.log(
             f"Training for {done_epoch:d}/{num_epochs:d} epochs " +
@@ -49,6 +49,9 @@ class DdpTrainer(Trainer):
                  report_metrics: List[str] = ["loss"],
                  reduction_tag: str = "none",
                  stop_on_errors: int = 10,
+                 async_checkpoint: int = 0,
+                 profile_interval: int = -1,
+                 profile_trace: Optional[List[int]] = None,
                  **kwargs) -> None:
         super(DdpTrainer,
               self).__init__(task,
@@ -77,7 +80,10 @@ class DdpTrainer(Trainer):
                              average_checkpoint=average_checkpoint,
                              report_metrics=report_metrics,
                              reduction_tag=reduction_tag,
-                             stop_on_errors=stop_on_errors)
+                             stop_on_errors=stop_on_errors,
+                             async_checkpoint=async_checkpoint,
+                             profile_interval=profile_interval,
+                             profile_trace=profile_trace)
         if dist.get_backend() not in ["torch", "none"]:
             raise ValueError(
                 "DdpTrainer should use torch/none as distributed backend")
@@ -87,14 +93,19 @@ class DdpTrainer(Trainer):
         """
         Setup environment for distributed training
         """
-        if self.cuda_devices >= 2:
+        if self.num_devices >= 2:
             self.distributed = True
             self.reporter.log(
                 f"DDP: using distributed data parallel (DDP), rank={self.rank}, "
                 + f"world_size={dist.world_size()}")
+            # device_ids should be None for CPU training (gloo backend)
+            if self.default_device.type == "cuda":
+                device_ids = [self.default_device]
+            else:
+                device_ids = None
             # find_unused_parameters=True helps us report potential code errors
             self.task = DistributedDataParallel(self.task,
-                                                device_ids=[self.rank],
+                                                device_ids=device_ids,
                                                 find_unused_parameters=False)
         else:
             self.distributed = False
@@ -113,11 +124,12 @@ class DdpTrainer(Trainer):
             self.weight_noise_adder(self.task, self.cur_step)
 
         is_backward_step = (self.cur_step + 1) % self.acmu_gradient == 0
-        if self.distributed and not is_backward_step:
-            with self.task.no_sync():
+        with self.profiler.phase("forward"):
+            if self.distributed and not is_backward_step:
+                with self.task.no_sync():
+                    stats = self.task(egs)
+            else:
                 stats = self.task(egs)
-        else:
-            stats = self.task(egs)
 
         # use all reduce to check loss
         if self.distributed and is_backward_step:
@@ -127,7 +139,8 @@ class DdpTrainer(Trainer):
 
         # backward if not nan/inf
         if math.isfinite(loss):
-            (stats["loss"] / self.acmu_gradient).backward()
+            with self.profiler.phase("backward"):
+                (stats["loss"] / self.acmu_gradient).backward()
         else:
             self.reporter.log(f"Invalid loss {loss:.3f}, skip...")
             return False
@@ -138,13 +151,17 @@ class DdpTrainer(Trainer):
 
         # clip gradient after backward
         norm = -1
-        if self.clip_gradient:
-            norm = clip_grad_norm_(self.task.parameters(), self.clip_gradient)
-
-        # step optimizer and update statistics
+        with self.profiler.phase("optimizer"):
+            if self.clip_gradient:
+                norm = clip_grad_norm_(self.task.parameters(),
+                                       self.clip_gradient)
+            # step optimizer
+            if math.isfinite(norm):
+                self.optimizer.step()
+                self.optimizer.zero_grad()
+
+        # update statistics
         if math.isfinite(norm):
-            self.optimizer.step()
-            self.optimizer.zero_grad()
             if norm != -1:
                 stats["norm"] = norm
             stats["rate"] = self.optimizer.param_groups[0]["lr"]
@@ -47,6 +47,9 @@ class HvdTrainer(Trainer):
                  report_metrics: List[str] = ["loss"],
                  reduction_tag: str = "none",
                  stop_on_errors: int = 10,
+                 async_checkpoint: int = 0,
+                 profile_interval: int = -1,
+                 profile_trace: Optional[List[int]] = None,
                  **kwargs) -> None:
         super(HvdTrainer,
               self).__init__(task,
@@ -75,6 +78,9 @@ class HvdTrainer(Trainer):
                              average_checkpoint=average_checkpoint,
                              report_metrics=report_metrics,
                              stop_on_errors=stop_on_errors,
+                             async_checkpoint=async_checkpoint,
+                             profile_interval=profile_interval,
+                             profile_trace=profile_trace,
                              reduction_tag=reduction_tag)
         if dist.get_backend() != "horovod":
             raise ValueError(
@@ -113,7 +119,8 @@ class HvdTrainer(Trainer):
             self.weight_noise_adder(self.task, self.cur_step)
 
         is_backward_step = (self.cur_step + 1) % self.acmu_gradient == 0
-        stats = self.task(egs)
+        with self.profiler.phase("forward"):
+            stats = self.task(egs)
 
         if is_backward_step:
             loss = dist.all_reduce(stats["loss"])
@@ -122,7 +129,8 @@ class HvdTrainer(Trainer):
             loss = stats["loss"].item()
         # backward if not nan/inf
         if math.isfinite(loss):
-            (stats["loss"] / self.acmu_gradient).backward()
+            with self.profiler.phase("backward"):
+                (stats["loss"] / self.acmu_gradient).backward()
         else:
             self.reporter.log(f"Invalid loss {loss:.3f}, skip...")
             return False
@@ -133,20 +141,24 @@ class HvdTrainer(Trainer):
 
         # clip gradient after backward
         norm = -1
-        if self.clip_gradient:
-            # for horovod
-            self.optimizer.synchronize()
-            norm = clip_grad_norm_(self.task.parameters(), self.clip_gradient)
+        with self.profiler.phase("optimizer"):
+            if self.clip_gradient:
+                # for horovod
+                self.optimizer.synchronize()
+                norm = clip_grad_norm_(self.task.parameters(),
+                                       self.clip_gradient)
+            # step optimizer
+            if math.isfinite(norm):
+                # for horovod
+                if norm != -1:
+                    with self.optimizer.skip_synchronize():
+                        self.optimizer.step()
+                else:
+                    self.optimizer.step()
+                self.optimizer.zero_grad()
 
-        # step optimizer and update statistics
+        # update statistics
         if math.isfinite(norm):
-            # for horovod
-            if norm != -1:
-                with self.optimizer.skip_synchronize():
-                    self.optimizer.step()
-            else:
-                self.optimizer.step()
-            self.optimizer.zero_grad()
             if norm != -1:
                 stats["norm"] = norm
             stats["rate"] = self.optimizer.param_groups[0]["lr"]
@@ -12,13 +12,15 @@ Notations:
     S: number of samples in utts
 """
 import math
+import hashlib
 import warnings
 
 import torch as th
 import torch.nn as nn
 import torch.nn.functional as tf
 
-from typing import Optional, Union, Tuple
+from contextlib import contextmanager
+from typing import Optional, Union, Tuple, Iterator
 from aps.transform.utils import STFT, mel_filter, splice_feature, speed_perturb_filter
 from aps.transform.augment import tf_mask, perturb_speed
 from aps.const import EPSILON, MAX_INT16
@@ -168,21 +170,24 @@ class SpeedPerturbTransform(nn.Module):
             raise RuntimeError(f"Now only supports 2D tensor, got {wav.dim()}")
         choice = th.randint(0, len(self.weights) + 1, (wav.shape[0],))
         self.last_choice = choice
+        # each utterance is different, but we resample the utterances
+        # with the same factor as one batch
         wav_sp = []
-        # each utterance is different
-        # NOTE: make it same in previous commits
-        for i, c in enumerate(self.last_choice.tolist()):
+        for c in th.unique(choice).tolist():
+            index = th.nonzero(choice == c, as_tuple=False)[:, 0]
+            index = index.to(wav.device)
             # 1.0, do not apply speed perturb
             if c == len(self.weights):
-                wav_sp.append(wav[i])
+                wav_sp.append((index, wav[index]))
             else:
-                wav_sp.append(perturb_speed(wav[i:i + 1], self.weights[c])[0])
+                wav_sp.append((index, perturb_speed(wav[index],
+                                                    self.weights[c])))
         # may produce longer utterance
         wav_sp_pad = th.zeros(
-            [wav.shape[0], max([w.shape[-1] for w in wav_sp])],
+            [wav.shape[0], max([w.shape[-1] for _, w in wav_sp])],
             device=wav.device)
-        for i, w in enumerate(wav_sp):
-            wav_sp_pad[i, :w.shape[-1]] = w
+        for index, w in wav_sp:
+            wav_sp_pad[index, :w.shape[-1]] = w
         return wav_sp_pad
 
 
@@ -514,10 +519,14 @@ class CmvnTransform(nn.Module):
     def dim_scale(self) -> int:
         return 1
 
-    def forward(self, feats: th.Tensor) -> th.Tensor:
+    def forward(self,
+                feats: th.Tensor,
+                num_frames: Optional[th.Tensor] = None) -> th.Tensor:
         """
         Args:
             feats (Tensor): feature before normalization, N x (C) x T x F
+            num_frames (Tensor or None): N, number of the valid frames (only
+                                         used for utterance level cmvn)
         Return:
             feats (Tensor): normalized feature, N x (C) x T x F
         """
@@ -528,6 +537,8 @@ class CmvnTransform(nn.Module):
                 feats = feats - self.gmean
             if self.norm_var:
                 feats = feats / self.gstd
+        elif num_frames is not None:
+            feats = self._masked_cmvn(feats, num_frames)
         else:
             axis = -2 if self.per_band else (-1, -2)
             if self.norm_mean:
@@ -540,6 +551,27 @@ class CmvnTransform(nn.Module):
                 feats = feats / th.sqrt(var + self.eps)
         return feats
 
+    def _masked_cmvn(self, feats: th.Tensor,
+                     num_frames: th.Tensor) -> th.Tensor:
+        """
+        Utterance level cmvn on the valid frames of the padded features
+        """
+        N, T = feats.shape[0], feats.shape[-2]
+        # N x (1) x T x 1
+        mask = th.arange(T, device=feats.device) < num_frames[:, None]
+        mask = mask.view(N, *[1] * (feats.dim() - 3), T, 1).to(feats.dtype)
+        axis = -2 if self.per_band else (-1, -2)
+        # N x (1) x 1 x 1
+        count = th.sum(mask.expand_as(feats), axis, keepdim=True)
+        mean = th.sum(feats * mask, axis, keepdim=True) / count
+        if self.norm_mean:
+            feats = feats - mean
+        if self.norm_var:
+            diff = feats if self.norm_mean else feats - mean
+            var = th.sum(diff**2 * mask, axis, keepdim=True) / count
+            feats = feats / th.sqrt(var + self.eps)
+        return feats
+
 
 class SpecAugTransform(nn.Module):
     """
@@ -550,6 +582,7 @@ class SpecAugTransform(nn.Module):
         time_args: (T, m_T) in the SpecAugment paper
         freq_args: (F, m_F) in the SpecAugment paper
         mask_zero: use zero value or mean in the masked region
+        seed: random seed for the masks (for reproducibility)
     """
 
     def __init__(self,
@@ -557,7 +590,8 @@ class SpecAugTransform(nn.Module):
                  p_time: float = 1.0,
                  time_args: Tuple[int] = [40, 1],
                  freq_args: Tuple[int] = [30, 1],
-                 mask_zero: bool = True) -> None:
+                 mask_zero: bool = True,
+                 seed: Optional[int] = None) -> None:
         super(SpecAugTransform, self).__init__()
         assert len(freq_args) == 2 and len(time_args) == 2
         self.fnum, self.tnum = freq_args[1], time_args[1]
@@ -567,6 +601,11 @@ class SpecAugTransform(nn.Module):
         self.p = p
         # max portion constraint on time axis
         self.p_time = p_time
+        if seed is None:
+            self.generator = None
+        else:
+            self.generator = th.Generator()
+            self.generator.manual_seed(seed)
 
     def extra_repr(self) -> str:
         return (
@@ -574,14 +613,18 @@ class SpecAugTransform(nn.Module):
             f"p={self.p}, p_time={self.p_time}, mask_zero={self.mask_zero}, "
             f"num_freq_masks={self.fnum}, num_time_masks={self.tnum}")
 
-    def forward(self, x: th.Tensor) -> th.Tensor:
+    def forward(self,
+                x: th.Tensor,
+                x_len: Optional[th.Tensor] = None) -> th.Tensor:
         """
         Args:
             x (Tensor): original features, N x (C) x T x F
+            x_len (Tensor or None): number of the frames, N
         Return:
             y (Tensor): augmented features
         """
-        if self.training and th.rand(1).item() < self.p:
+        if self.training and th.rand(1,
+                                     generator=self.generator).item() < self.p:
             if x.dim() == 4:
                 N, _, T, F = x.shape
             else:
@@ -593,7 +636,9 @@ class SpecAugTransform(nn.Module):
                            max_frame=self.T,
                            num_freq_masks=self.fnum,
                            num_time_masks=self.tnum,
-                           device=x.device)
+                           device=x.device,
+                           lengths=x_len,
+                           generator=self.generator)
             if x.dim() == 4:
                 # N x 1 x T x F
                 mask = mask.unsqueeze(1)
@@ -739,6 +784,7 @@ class FeatureTransform(nn.Module):
         aug_mask_zero: use zero value or mean in the masked region
         aug_time_args: (T, m_T) in the SpecAugment paper
         aug_freq_args: (F, m_F) in the SpecAugment paper
+        aug_seed: random seed for spec-augment (for reproducibility)
         norm_mean|norm_var: normalize mean/var or not (cmvn)
         norm_per_band: do cmvn per-band or not (cmvn)
         gcmvn: global cmvn statistics (cmvn)
@@ -776,6 +822,7 @@ class FeatureTransform(nn.Module):
                  aug_mask_zero: bool = True,
                  aug_time_args: Tuple[int] = (40, 1),
                  aug_freq_args: Tuple[int] = (30, 1),
+                 aug_seed: Optional[int] = None,
                  norm_mean: bool = True,
                  norm_var: bool = True,
                  norm_per_band: bool = True,
@@ -884,7 +931,8 @@ class FeatureTransform(nn.Module):
                                      p_time=aug_maxp_time,
                                      freq_args=aug_freq_args,
                                      time_args=aug_time_args,
-                                     mask_zero=aug_mask_zero))
+                                     mask_zero=aug_mask_zero,
+                                     seed=aug_seed))
             elif tok == "splice":
                 transform.append(
                     SpliceTransform(lctx=lctx,
@@ -902,20 +950,95 @@ class FeatureTransform(nn.Module):
         self.transform = nn.Sequential(*transform)
         self.feats_dim = feats_dim
         self.subsampling_factor = subsampling_factor
+        self.cache_index = self._cache_index()
+        # number of the stages skipped (for cached features)
+        self.skip_index = 0
+
+    def _cache_index(self) -> int:
+        """
+        Return the number of the leading deterministic stages, i.e., the
+        index of the first stochastic (or trainable) stage, whose outputs
+        can be cached (0 if the spectrogram layer is not covered)
+        """
+        for index, transform in enumerate(self.transform):
+            stochastic = isinstance(transform,
+                                    (SpeedPerturbTransform, SpecAugTransform))
+            trainable = any(p.requires_grad for p in transform.parameters())
+            if stochastic or trainable:
+                break
+        else:
+            index = len(self.transform)
+        return index if index > self.spectra_index >= 0 else 0
 
-    def num_frames(self, inp_len: th.Tensor) -> th.Tensor:
+    def cache_key(self) -> str:
+        """
+        Return the hash of the deterministic stages (configurations and
+        the buffers, e.g., mel filters & global cmvn statistics). It's not
+        memoized as the buffers may be changed, e.g., by load_state_dict()
+        """
+        if not self.cache_index:
+            raise RuntimeError("Feature cache is not supported for " +
+                               f"the transform: {self.transform}")
+        prefix = self.transform[:self.cache_index]
+        sha1 = hashlib.sha1(repr(prefix).encode())
+        for name, tensor in prefix.state_dict().items():
+            sha1.update(name.encode())
+            sha1.update(tensor.detach().cpu().numpy().tobytes())
+        return sha1.hexdigest()
+
+    def forward_cache(self, wav: th.Tensor) -> th.Tensor:
+        """
+        Go through the deterministic stages (for feature cache)
+        Args:
+            wav (Tensor): raw waveform of one utterance, C x S or S
+        Return:
+            feats (Tensor): cached feature, (C) x T x F
+        """
+        if not self.cache_index:
+            raise RuntimeError("Feature cache is not supported for " +
+                               f"the transform: {self.transform}")
+        feats = wav[None, ...]
+        for transform in self.transform[:self.cache_index]:
+            feats = transform(feats)
+        return feats[0]
+
+    @contextmanager
+    def cached_input(self, key: str) -> Iterator[None]:
+        """
+        Take the cached features (outputs of the deterministic stages) as
+        the input of the forward function
+        """
+        if key != self.cache_key():
+            raise ValueError("Feature cache is not created by current " +
+                             f"transform (key mismatch: {key})")
+        self.skip_index = self.cache_index
+        try:
+            yield
+        finally:
+            self.skip_index = 0
+
+    def num_frames(self,
+                   inp_len: th.Tensor,
+                   subsampling: bool = True) -> th.Tensor:
         """
         Work out number of frames
         """
         if inp_len is None:
             return None
-        if self.spectra_index == -1:
+        if self.skip_index:
+            # already number of the frames
+            num_frames = inp_len
+        elif self.spectra_index == -1:
             warnings.warn("SpectrogramTransform layer is not found, " +
                           "return input as the #num_frames")
             return inp_len
-        if self.perturb_index != -1:
-            inp_len = self.transform[self.perturb_index].output_length(inp_len)
-        num_frames = self.transform[self.spectra_index].len(inp_len)
+        else:
+            if self.perturb_index != -1:
+                inp_len = self.transform[self.perturb_index].output_length(
+                    inp_len)
+            num_frames = self.transform[self.spectra_index].len(inp_len)
+        if not subsampling:
+            return num_frames
         return num_frames // self.subsampling_factor
 
     def forward(self, inp_pad: th.Tensor,
@@ -923,11 +1046,19 @@ class FeatureTransform(nn.Module):
         """
         Args:
             inp_pad (Tensor): raw waveform or feature: N x C x S or N x S
+                              (N x (C) x T x F for the cached features)
             inp_len (Tensor or None): N or None
         Return:
             feats (Tensor): acoustic features: N x C x T x ...
             num_frames (Tensor or None): number of frames
         """
-        feats = self.transform(inp_pad)
+        feats = inp_pad
+        for transform in self.transform[self.skip_index:]:
+            if isinstance(transform, (CmvnTransform, SpecAugTransform)):
+                # exclude the padding frames (after speed perturbation)
+                feats = transform(feats,
+                                  self.num_frames(inp_len, subsampling=False))
+            else:
+                feats = transform(feats)
         num_frames = self.num_frames(inp_len)
         return check_valid(feats, num_frames)
@@ -7,7 +7,7 @@ import random
 import torch as th
 import torch.nn.functional as tf
 
-from typing import Tuple, Union
+from typing import Optional, Tuple, Union
 
 
 def tf_mask(batch: int,
@@ -17,33 +17,77 @@ def tf_mask(batch: int,
             max_frame: int = 40,
             num_freq_masks: int = 2,
             num_time_masks: int = 2,
-            device: Union[str, th.device] = "cpu") -> th.Tensor:
+            device: Union[str, th.device] = "cpu",
+            lengths: Optional[th.Tensor] = None,
+            generator: Optional[th.Generator] = None) -> th.Tensor:
     """
-    Return batch of TF-masks
+    Return batch of TF-masks (vectorized, same distribution as random_mask()
+    for each utterance)
     Args:
         batch: batch size, N
         shape: (T x F)
+        lengths: valid number of the frames, N (use T if None)
+        generator: random number generator (on CPU) for reproducibility
     Return:
         masks (Tensor): 0,1 masks, N x T x F
     """
     T, F = shape
-    max_frame = min(max_frame, int(T * p))
-    max_bands = min(max_bands, F)
-    mask = []
-    for _ in range(batch):
-        fmask = random_mask(shape,
-                            max_steps=max_bands,
-                            num_masks=num_freq_masks,
-                            order="freq",
-                            device=device)
-        tmask = random_mask(shape,
-                            max_steps=max_frame,
-                            num_masks=num_time_masks,
-                            order="time",
-                            device=device)
-        mask.append(fmask * tmask)
+    if lengths is None:
+        lengths = th.full((batch,), T, dtype=th.int64)
+    else:
+        lengths = th.clamp(lengths.cpu().long(), max=T)
+    # N x F
+    fmask = batch_random_mask(th.full((batch,), F, dtype=th.int64),
+                              F,
+                              max_steps=min(max_bands, F),
+                              num_masks=num_freq_masks,
+                              generator=generator)
+    # N x T
+    tmask = batch_random_mask(lengths,
+                              T,
+                              max_steps=th.clamp((lengths * p).long(),
+                                                 max=max_frame),
+                              num_masks=num_time_masks,
+                              generator=generator)
     # N x T x F
-    return th.stack(mask)
+    masks = tmask[..., None] & fmask[:, None]
+    return masks.to(device=device, dtype=th.float32)
+
+
+def batch_random_mask(lengths: th.Tensor,
+                      size: int,
+                      max_steps: Union[int, th.Tensor] = 30,
+                      num_masks: int = 2,
+                      generator: Optional[th.Generator] = None) -> th.Tensor:
+    """
+    Generate random 0/1 masks for a batch of sequences, mask widths and
+    offsets are drawn as: dur ~ U[1, max_steps - 1], beg ~ U[0, L - dur - 1]
+    and the mask is dropped if dur >= L (L is the valid length)
+    Args:
+        lengths (Tensor): valid lengths, N
+        size: padded length (T or F)
+        max_steps (Tensor or int): maximum width of the masks, N or scalar
+    Return:
+        masks (Tensor): 0/1 (bool) masks, N x size
+    """
+    N = lengths.shape[0]
+    max_steps = th.as_tensor(max_steps, dtype=th.int64).expand(N)
+    # N x M
+    u_dur, u_beg = th.rand(2, N, num_masks, generator=generator)
+    # clamp in case of the rounding errors
+    dur = th.min(1 + (u_dur * (max_steps[:, None] - 1)).long(),
+                 max_steps[:, None] - 1)
+    beg = th.min((u_beg * (lengths[:, None] - dur)).long(),
+                 lengths[:, None] - dur - 1)
+    # no mask if max_steps < 2 or dur >= L
+    valid = (max_steps[:, None] >= 2) & (lengths[:, None] - dur > 0)
+    # 1 x 1 x size
+    index = th.arange(size)[None, None]
+    # N x M x size
+    masked = (index >= beg[..., None]) & (index < (beg + dur)[..., None])
+    masked = masked & valid[..., None]
+    # N x size
+    return ~th.any(masked, 1)
 
 
 def random_mask(shape: Tuple[int],
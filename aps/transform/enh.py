@@ -377,6 +377,7 @@ class FeatureTransform(nn.Module):
         aug_mask_zero: use zero value or mean in the masked region
         aug_time_args: (T, m_T) in the SpecAugment paper
         aug_freq_args: (F, m_F) in the SpecAugment paper
+        aug_seed: random seed for spec-augment (for reproducibility)
         ipd_index: index pairs to compute IPD feature (ipd)
         cos_ipd|sin_ipd: using cos or sin IPDs
         eps: floor number
@@ -402,6 +403,7 @@ class FeatureTransform(nn.Module):
                  aug_mask_zero: bool = True,
                  aug_time_args: Tuple[int] = (40, 1),
                  aug_freq_args: Tuple[int] = (30, 1),
+                 aug_seed: Optional[int] = None,
                  ipd_index: str = "",
                  cos_ipd: bool = True,
                  sin_ipd: bool = False,
@@ -450,7 +452,8 @@ class FeatureTransform(nn.Module):
                                      p_time=aug_maxp_time,
                                      freq_args=aug_freq_args,
                                      time_args=aug_time_args,
-                                     mask_zero=aug_mask_zero))
+                                     mask_zero=aug_mask_zero,
+                                     seed=aug_seed))
             elif tok == "ipd":
                 self.ipd_transform = nn.Sequential(
                     IpdTransform(ipd_index=ipd_index, cos=cos_ipd, sin=sin_ipd),
@@ -43,9 +43,32 @@ def init_window(wnd: str, frame_len: int) -> th.Tensor:
     return c
 
 
+def init_fft_window(frame_len: int,
+                    window: th.Tensor,
+                    round_pow_of_two: bool = True,
+                    mode: str = "librosa") -> Tuple[th.Tensor, int]:
+    """
+    Return the (padded) window and number of the FFT points
+    Args:
+        frame_len: length of the frame
+        window: window coefficients
+        round_pow_of_two: if true, choose round(#power_of_two) as the FFT size
+        mode: framing mode (librosa or kaldi)
+    """
+    if mode not in ["librosa", "kaldi"]:
+        raise ValueError(f"Unsupported mode: {mode}")
+    # FFT points
+    B = 2**math.ceil(math.log2(frame_len)) if round_pow_of_two else frame_len
+    # center padding window if needed
+    if mode == "librosa" and B != frame_len:
+        lpad = (B - frame_len) // 2
+        window = tf.pad(window, (lpad, B - frame_len - lpad))
+    return window, B
+
+
 def init_kernel(frame_len: int,
                 frame_hop: int,
-                window: str,
+                window: th.Tensor,
                 round_pow_of_two: bool = True,
                 normalized: bool = False,
                 inverse: bool = False,
@@ -55,20 +78,16 @@ def init_kernel(frame_len: int,
     Args:
         frame_len: length of the frame
         frame_hop: hop size between frames
-        window: window name
+        window: window coefficients
         round_pow_of_two: if true, choose round(#power_of_two) as the FFT size
         normalized: return normalized DFT matrix
         inverse: return iDFT matrix
         mode: framing mode (librosa or kaldi)
     """
-    if mode not in ["librosa", "kaldi"]:
-        raise ValueError(f"Unsupported mode: {mode}")
-    # FFT points
-    B = 2**math.ceil(math.log2(frame_len)) if round_pow_of_two else frame_len
-    # center padding window if needed
-    if mode == "librosa" and B != frame_len:
-        lpad = (B - frame_len) // 2
-        window = tf.pad(window, (lpad, B - frame_len - lpad))
+    window, B = init_fft_window(frame_len,
+                                window,
+                                round_pow_of_two=round_pow_of_two,
+                                mode=mode)
     if normalized:
         # make K^H * K = I
         S = B**0.5
@@ -263,6 +282,76 @@ def _forward_stft(
         num_bins = kernel.shape[0] // 4 + 1
         real = real[..., :num_bins, :]
         imag = imag[..., :num_bins, :]
+    return _stft_output(real, imag, output=output)
+
+
+def _forward_stft_fft(
+        wav: th.Tensor,
+        window: th.Tensor,
+        num_fft: int,
+        output: str = "polar",
+        pre_emphasis: float = 0,
+        frame_hop: int = 256,
+        onesided: bool = False,
+        center: bool = False,
+        normalized: bool = False
+) -> Union[th.Tensor, Tuple[th.Tensor, th.Tensor]]:
+    """
+    STFT inner function (using FFT on the framed signals)
+    Args:
+        wav (Tensor), N x (C) x S
+        window (Tensor), window coefficients, from init_fft_window(...)
+        num_fft (int), number of the FFT points
+        output (str), output format (see _forward_stft)
+        frame_hop: frame hop size in number samples
+        pre_emphasis: factor of preemphasis
+        onesided: return half FFT bins
+        center: if true, we assumed to have centered frames
+        normalized: use normalized DFT
+    Return:
+        transform (Tensor or [Tensor, Tensor]), STFT transform results
+    """
+    wav_dim = wav.dim()
+    if output not in ["polar", "complex", "real"]:
+        raise ValueError(f"Unknown output format: {output}")
+    if wav_dim not in [2, 3]:
+        raise RuntimeError(f"STFT expect 2D/3D tensor, but got {wav_dim:d}D")
+    N, S = wav.shape[0], wav.shape[-1]
+    wav = wav.view(-1, 1, S)
+    frame_len = window.shape[-1]
+    # NC x 1 x S+2P
+    if center:
+        pad = frame_len // 2
+        # NOTE: match with librosa
+        wav = tf.pad(wav, (pad, pad), mode="reflect")
+    # NC x W x T
+    frames = tf.unfold(wav[:, None], (1, frame_len),
+                       stride=frame_hop,
+                       padding=0)
+    if pre_emphasis > 0:
+        frames[:, 1:] = frames[:, 1:] - pre_emphasis * frames[:, :-1]
+    # NC x T x W
+    frames = frames.transpose(1, 2) * window
+    # kaldi mode: zero padding to the FFT size
+    if frame_len != num_fft:
+        frames = tf.pad(frames, (0, num_fft - frame_len))
+    # NC x T x F x 2
+    packed = th.rfft(frames, 1, normalized=normalized, onesided=onesided)
+    # NC x F x T x 2
+    packed = packed.transpose(1, 2)
+    # NC x F x T => N x C x F x T
+    if wav_dim == 3:
+        packed = packed.view(N, -1, *packed.shape[1:])
+    return _stft_output(packed[..., 0], packed[..., 1], output=output)
+
+
+def _stft_output(
+        real: th.Tensor,
+        imag: th.Tensor,
+        output: str = "polar") -> Union[th.Tensor, Tuple[th.Tensor, th.Tensor]]:
+    """
+    Return STFT results in the given format
+    """
     if output == "complex":
         return (real, imag)
     elif output == "real":
@@ -295,6 +384,68 @@ def _inverse_stft(transform: Union[th.Tensor, Tuple[th.Tensor, th.Tensor]],
     Return:
         wav (Tensor), N x S
     """
+    real, imag = _istft_input(transform, input=input)
+    if onesided:
+        # [self.num_bins - 2, ..., 1]
+        reverse = range(kernel.shape[0] // 4 - 1, 0, -1)
+        # extend matrix: N x B x T
+        real = th.cat([real, real[:, reverse]], 1)
+        imag = th.cat([imag, -imag[:, reverse]], 1)
+    # pack: N x 2B x T
+    packed = th.cat([real, imag], dim=1)
+    # N x 1 x T
+    s = tf.conv_transpose1d(packed, kernel, stride=frame_hop, padding=0)
+    return _istft_norm(s, window, frame_hop=frame_hop, center=center)
+
+
+def _inverse_stft_fft(transform: Union[th.Tensor, Tuple[th.Tensor, th.Tensor]],
+                      window: th.Tensor,
+                      num_fft: int,
+                      input: str = "polar",
+                      frame_hop: int = 256,
+                      onesided: bool = False,
+                      center: bool = False,
+                      normalized: bool = False) -> th.Tensor:
+    """
+    iSTFT inner function (using inverse FFT and overlap-add)
+    Args:
+        transform (Tensor or [Tensor, Tensor]), STFT transform results
+        window (Tensor), window coefficients, from init_fft_window(...)
+        num_fft (int), number of the FFT points
+        input (str), input format (see _inverse_stft)
+        frame_hop: frame hop size in number samples
+        onesided: return half FFT bins
+        center: used in _forward_stft_fft
+        normalized: use normalized DFT
+    Return:
+        wav (Tensor), N x S
+    """
+    real, imag = _istft_input(transform, input=input)
+    # N x T x F x 2
+    packed = th.stack([real, imag], -1).transpose(1, 2)
+    # N x T x B
+    if onesided:
+        frames = th.irfft(packed,
+                          1,
+                          normalized=normalized,
+                          onesided=True,
+                          signal_sizes=(num_fft,))
+    else:
+        frames = th.ifft(packed, 1, normalized=normalized)[..., 0]
+    frame_len = window.shape[-1]
+    # N x W x T
+    frames = (frames[..., :frame_len] * window).transpose(1, 2)
+    num_samples = (frames.shape[-1] - 1) * frame_hop + frame_len
+    # N x 1 x 1 x S
+    s = tf.fold(frames, (1, num_samples), (1, frame_len), stride=(1, frame_hop))
+    return _istft_norm(s[:, 0], window, frame_hop=frame_hop, center=center)
+
+
+def _istft_input(transform: Union[th.Tensor, Tuple[th.Tensor, th.Tensor]],
+                 input: str = "polar") -> Tuple[th.Tensor, th.Tensor]:
+    """
+    Return real & imaginary part (N x F x T) of the iSTFT input
+    """
     if input not in ["polar", "complex", "real"]:
         raise ValueError(f"Unknown output format: {input}")
 
@@ -315,29 +466,26 @@ def _inverse_stft(transform: Union[th.Tensor, Tuple[th.Tensor, th.Tensor]],
     if imag_dim == 2:
         real = th.unsqueeze(real, 0)
         imag = th.unsqueeze(imag, 0)
+    return real, imag
 
-    if onesided:
-        # [self.num_bins - 2, ..., 1]
-        reverse = range(kernel.shape[0] // 4 - 1, 0, -1)
-        # extend matrix: N x B x T
-        real = th.cat([real, real[:, reverse]], 1)
-        imag = th.cat([imag, -imag[:, reverse]], 1)
-    # pack: N x 2B x T
-    packed = th.cat([real, imag], dim=1)
-    # N x 1 x T
-    s = tf.conv_transpose1d(packed, kernel, stride=frame_hop, padding=0)
+
+def _istft_norm(s: th.Tensor,
+                window: th.Tensor,
+                frame_hop: int = 256,
+                center: bool = False) -> th.Tensor:
+    """
+    Normalize the overlap-added samples (N x 1 x S) by the squared window
+    """
+    num_frames = (s.shape[-1] - window.shape[0]) // frame_hop + 1
     # normalized audio samples
     # refer: https://github.com/pytorch/audio/blob/2ebbbf511fb1e6c47b59fd32ad7e66023fa0dff1/torchaudio/functional.py#L171
     # 1 x W x T
-    win = th.repeat_interleave(window[None, ..., None],
-                               packed.shape[-1],
-                               dim=-1)
-    # W x 1 x W
-    I = th.eye(window.shape[0], device=win.device)[:, None]
-    # 1 x 1 x T
-    norm = tf.conv_transpose1d(win**2, I, stride=frame_hop, padding=0)
+    win = th.repeat_interleave(window[None, ..., None], num_frames, dim=-1)
+    # 1 x 1 x 1 x S => 1 x 1 x S
+    norm = tf.fold(win**2, (1, s.shape[-1]), (1, window.shape[0]),
+                   stride=(1, frame_hop))[:, 0]
     if center:
-        pad = kernel.shape[-1] // 2
+        pad = window.shape[0] // 2
         s = s[..., pad:-pad]
         norm = norm[..., pad:-pad]
     s = s / (norm + EPSILON)
@@ -357,7 +505,8 @@ def forward_stft(
         normalized: bool = False,
         onesided: bool = True,
         center: bool = False,
-        mode: str = "librosa") -> Union[th.Tensor, Tuple[th.Tensor, th.Tensor]]:
+        mode: str = "librosa",
+        backend: str = "conv") -> Union[th.Tensor, Tuple[th.Tensor, th.Tensor]]:
     """
     STFT function implementation, equals to STFT layer
     Args:
@@ -373,7 +522,24 @@ def forward_stft(
         onesided: output onesided STFT
         inverse: using iDFT kernel (for iSTFT)
         mode: "kaldi"|"librosa", slight difference on applying window function
+        backend: "conv"|"fft", use DFT kernel (conv1d) or FFT
     """
+    if backend not in ["conv", "fft"]:
+        raise ValueError(f"Unsupported STFT backend: {backend}")
+    if backend == "fft":
+        w, B = init_fft_window(frame_len,
+                               init_window(window, frame_len),
+                               round_pow_of_two=round_pow_of_two,
+                               mode=mode)
+        return _forward_stft_fft(wav,
+                                 w.to(wav.device),
+                                 B,
+                                 output=output,
+                                 frame_hop=frame_hop,
+                                 pre_emphasis=pre_emphasis,
+                                 onesided=onesided,
+                                 center=center,
+                                 normalized=normalized)
     K, _ = init_kernel(frame_len,
                        frame_hop,
                        init_window(window, frame_len),
@@ -399,7 +565,8 @@ def inverse_stft(transform: Union[th.Tensor, Tuple[th.Tensor, th.Tensor]],
                  normalized: bool = False,
                  onesided: bool = True,
                  center: bool = False,
-                 mode: str = "librosa") -> th.Tensor:
+                 mode: str = "librosa",
+                 backend: str = "conv") -> th.Tensor:
     """
     iSTFT function implementation, equals to iSTFT layer
     Args:
@@ -413,11 +580,27 @@ def inverse_stft(transform: Union[th.Tensor, Tuple[th.Tensor, th.Tensor]],
         normalized: use normalized DFT kernel
         onesided: output onesided STFT
         mode: "kaldi"|"librosa", slight difference on applying window function
+        backend: "conv"|"fft", use iDFT kernel (transposed conv1d) or iFFT
     """
+    if backend not in ["conv", "fft"]:
+        raise ValueError(f"Unsupported STFT backend: {backend}")
     if isinstance(transform, th.Tensor):
         device = transform.device
     else:
         device = transform[0].device
+    if backend == "fft":
+        w, B = init_fft_window(frame_len,
+                               init_window(window, frame_len),
+                               round_pow_of_two=round_pow_of_two,
+                               mode=mode)
+        return _inverse_stft_fft(transform,
+                                 w.to(device),
+                                 B,
+                                 input=input,
+                                 frame_hop=frame_hop,
+                                 onesided=onesided,
+                                 center=center,
+                                 normalized=normalized)
     K, w = init_kernel(frame_len,
                        frame_hop,
                        init_window(window, frame_len),
@@ -449,6 +632,7 @@ class STFTBase(nn.Module):
         mode: "kaldi"|"librosa", slight difference on applying window function
         onesided: output onesided STFT
         inverse: using iDFT kernel (for iSTFT)
+        backend: "conv"|"fft", use (i)DFT kernel or (i)FFT to compute (i)STFT
     """
 
     def __init__(self,
@@ -461,8 +645,11 @@ class STFTBase(nn.Module):
                  onesided: bool = True,
                  inverse: bool = False,
                  center: bool = False,
-                 mode="librosa") -> None:
+                 mode: str = "librosa",
+                 backend: str = "conv") -> None:
         super(STFTBase, self).__init__()
+        if backend not in ["conv", "fft"]:
+            raise ValueError(f"Unsupported STFT backend: {backend}")
         K, w = init_kernel(frame_len,
                            frame_hop,
                            init_window(window, frame_len),
@@ -470,6 +657,8 @@ class STFTBase(nn.Module):
                            normalized=normalized,
                            inverse=inverse,
                            mode=mode)
+        # NOTE: kernel is kept for FFT backend as well to make the
+        #       checkpoints compatible between two backends
         self.K = nn.Parameter(K, requires_grad=False)
         self.w = nn.Parameter(w, requires_grad=False)
         self.frame_len = frame_len
@@ -478,12 +667,16 @@ class STFTBase(nn.Module):
         self.pre_emphasis = pre_emphasis
         self.center = center
         self.mode = mode
-        self.num_bins = self.K.shape[0] // 4 + 1
+        self.normalized = normalized
+        self.backend = backend
+        self.num_fft = self.K.shape[0] // 2
+        self.num_bins = self.num_fft // 2 + 1
         self.expr = (
             f"window={window}, stride={frame_hop}, onesided={onesided}, " +
             f"pre_emphasis={self.pre_emphasis}, normalized={normalized}, " +
             f"center={self.center}, mode={self.mode}, " +
-            f"kernel_size={self.num_bins}x{self.K.shape[2]}")
+            f"kernel_size={self.num_bins}x{self.K.shape[2]}, " +
+            f"backend={backend}")
 
     def num_frames(self, wav_len: th.Tensor) -> th.Tensor:
         """
@@ -521,6 +714,16 @@ class STFT(STFTBase):
         Return
             transform (Tensor or [Tensor, Tensor]), N x (C) x F x T
         """
+        if self.backend == "fft":
+            return _forward_stft_fft(wav,
+                                     self.w,
+                                     self.num_fft,
+                                     output=output,
+                                     frame_hop=self.frame_hop,
+                                     pre_emphasis=self.pre_emphasis,
+                                     onesided=self.onesided,
+                                     center=self.center,
+                                     normalized=self.normalized)
         return _forward_stft(wav,
                              self.K,
                              output=output,
@@ -548,6 +751,15 @@ class iSTFT(STFTBase):
         Return
             s (Tensor), N x S
         """
+        if self.backend == "fft":
+            return _inverse_stft_fft(transform,
+                                     self.w,
+                                     self.num_fft,
+                                     input=input,
+                                     frame_hop=self.frame_hop,
+                                     onesided=self.onesided,
+                                     center=self.center,
+                                     normalized=self.normalized)
         return _inverse_stft(transform,
                              self.K,
                              self.w,
@@ -90,21 +90,28 @@ def get_device_ids(device_ids: Union[str, int]) -> Tuple[int]:
     """
     Got device ids
     Args:
-        device_ids: int or string like "0,1"
+        device_ids: int or string like "0,1". Negative values or "cpu" mean
+                    CPU, e.g., "-1" or "cpu,cpu" (two CPU processes)
     """
-    if not th.cuda.is_available():
-        raise RuntimeError("CUDA device unavailable... exist")
     # None or 0
     if not device_ids:
+        if not th.cuda.is_available():
+            raise RuntimeError("CUDA device unavailable... exist")
         # detect number of device available
         dev_cnt = th.cuda.device_count()
         device_ids = tuple(range(0, dev_cnt))
     elif isinstance(device_ids, int):
         device_ids = (device_ids,)
     elif isinstance(device_ids, str):
-        device_ids = tuple(map(int, device_ids.split(",")))
+        device_ids = tuple(
+            -1 if dev == "cpu" else int(dev) for dev in device_ids.split(","))
     else:
         raise ValueError(f"Unsupported value for device_ids: {device_ids}")
+    on_cpu = [dev < 0 for dev in device_ids]
+    if any(on_cpu) and not all(on_cpu):
+        raise ValueError(f"Can not mix CPU and GPU devices: {device_ids}")
+    if not any(on_cpu) and not th.cuda.is_available():
+        raise RuntimeError("CUDA device unavailable... exist")
     return device_ids
 
 
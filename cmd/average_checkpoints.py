@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+# Copyright 2020 Jian Wu
+# License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+import argparse
+
+from aps.trainer.base import CheckpointAverager
+from aps.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def run(args):
+    if args.weights:
+        weights = [float(w) for w in args.weights.split(",")]
+        if len(weights) != len(args.checkpoints):
+            raise RuntimeError(f"Got {len(weights)} weights for " +
+                               f"{len(args.checkpoints)} checkpoints")
+    else:
+        weights = [1] * len(args.checkpoints)
+    averager = CheckpointAverager(mode=args.mode,
+                                  ema_decay=args.ema_decay,
+                                  mmap=args.mmap)
+    for cpt, weight in zip(args.checkpoints, weights):
+        averager.add(cpt, weight=weight)
+        logger.info(f"Accumulate parameters from {cpt} (weight = {weight})")
+    averager.save(args.output)
+    logger.info(f"Average {averager.num_cpts} checkpoints ({args.mode}), " +
+                f"save to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Command to average the model parameters of the "
+        "checkpoints, loading one checkpoint at a time. The output can be "
+        "used in the decoding/separation commands (e.g., write to "
+        "{checkpoint}/avg.pt.tar and use --am-tag avg)",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("checkpoints",
+                        type=str,
+                        nargs="+",
+                        help="Checkpoints to average (in order, "
+                        "from the oldest to the latest for ema)")
+    parser.add_argument("--output",
+                        type=str,
+                        required=True,
+                        help="Path of the averaged checkpoint")
+    parser.add_argument("--mode",
+                        type=str,
+                        default="mean",
+                        choices=["mean", "ema"],
+                        help="Averaging mode, (weighted) arithmetic "
+                        "mean or exponential moving average")
+    parser.add_argument("--weights",
+                        type=str,
+                        default="",
+                        help="Comma separated weights of the checkpoints "
+                        "(for mean mode, uniform weights if not given)")
+    parser.add_argument("--ema-decay",
+                        type=float,
+                        default=0.9,
+                        help="Decay factor of the exponential moving average")
+    parser.add_argument("--mmap",
+                        action="store_true",
+                        help="Memory-map the checkpoints when loading "
+                        "(if supported by the PyTorch version)")
+    args = parser.parse_args()
+    run(args)
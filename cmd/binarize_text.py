@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+# Copyright 2020 Jian Wu
+# License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+import gzip
+import codecs
+import argparse
+
+from aps.loader.lm.utt import str2tokens
+from aps.loader.lm.utils import binarize_corpus
+from aps.conf import load_dict
+from aps.opts import StrToBoolAction
+from aps.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def run(args):
+    vocab_dict = load_dict(args.dict) if args.dict else None
+    if args.text[-3:] == ".gz":
+        text = gzip.open(args.text, "rt", encoding="utf-8")
+    else:
+        text = codecs.open(args.text, "r", encoding="utf-8")
+    with text:
+        num_utts = binarize_corpus(
+            (str2tokens(line, vocab_dict, kaldi_format=args.kaldi_format)
+             for line in text), args.bin)
+    logger.info(f"Binarize {num_utts} utterances to {args.bin} " +
+                f"(index: {args.bin}.idx)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Command to binarize the text/token file for LM "
+        "training (lm@utt & lm@bptt accept the *.bin file as --text)",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("text", type=str, help="Text/token file (or *.gz)")
+    parser.add_argument("bin", type=str, help="Output binarized corpus, *.bin")
+    parser.add_argument("--dict",
+                        type=str,
+                        default="",
+                        help="Vocabulary dictionary, if not assigned, "
+                        "assume the tokens are already integers")
+    parser.add_argument("--kaldi-format",
+                        action=StrToBoolAction,
+                        default=True,
+                        help="Whether the text/token file is in kaldi format")
+    args = parser.parse_args()
+    run(args)
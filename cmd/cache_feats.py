@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+# Copyright 2020 Jian Wu
+# License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+import yaml
+import argparse
+
+import torch as th
+
+from aps.loader import AudioReader
+from aps.loader.am.cache import write_feature_cache
+from aps.libs import aps_transform
+from aps.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def run(args):
+    with open(args.conf, "r") as f:
+        conf = yaml.full_load(f)
+    if "asr_transform" not in conf:
+        raise RuntimeError(f"No asr_transform in {args.conf}")
+    transform = aps_transform("asr")(**conf["asr_transform"])
+    transform.eval()
+    if not transform.cache_index:
+        raise RuntimeError("No deterministic stages to cache (should " +
+                           "cover the spectrogram layer) in the transform:" +
+                           f"\n{transform}")
+    cached_stages = transform.transform[:transform.cache_index]
+    logger.info(f"Cache the outputs of the stages:\n{cached_stages}")
+    key = transform.cache_key()
+    wav_reader = AudioReader(args.wav_scp, sr=args.sr, channel=args.channel)
+
+    def feats_iter():
+        with th.no_grad():
+            for n, (utt, wav) in enumerate(wav_reader):
+                feats = transform.forward_cache(th.from_numpy(wav))
+                yield utt, feats.numpy()
+                if (n + 1) % 500 == 0:
+                    logger.info(f"Processed {n + 1} utterances...")
+
+    num_utts = write_feature_cache(feats_iter(),
+                                   args.cache_dir,
+                                   key,
+                                   dtype=args.dtype)
+    logger.info(f"Cache features of {num_utts} utterances to " +
+                f"{args.cache_dir} (key = {key}), use it in data_conf " +
+                f"as feats_cache: {args.cache_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Command to cache the outputs of the deterministic "
+        "stages of the asr feature transform (before the first stochastic "
+        "stage, e.g., aug), which can be loaded by am@raw (feats_cache) "
+        "to skip audio decoding & feature extraction in training",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("wav_scp", type=str, help="Audio script to cache")
+    parser.add_argument("conf", type=str, help="Training configuration")
+    parser.add_argument("cache_dir",
+                        type=str,
+                        help="Output directory of the feature cache")
+    parser.add_argument("--sr",
+                        type=int,
+                        default=16000,
+                        help="Sample rate of the audio")
+    parser.add_argument("--channel",
+                        default=-1,
+                        type=int,
+                        help="Which channel to use (for multi-channel setups)")
+    parser.add_argument("--dtype",
+                        type=str,
+                        default="float32",
+                        choices=["float32", "float16"],
+                        help="Data type of the cached features")
+    args = parser.parse_args()
+    run(args)
@@ -6,59 +6,101 @@
 import tqdm
 import argparse
 import numpy as np
+import multiprocessing as mp
 
+from typing import Tuple, Optional, List
 from aps.loader import AudioReader
 from aps.metric.reporter import AverageReporter
 from aps.metric.sse import permute_metric
 
 
-def run(args):
-    splited_est_scps = args.est_scp.split(",")
-    splited_ref_scps = args.ref_scp.split(",")
-    if len(splited_ref_scps) != len(splited_est_scps):
-        raise RuntimeError("Number of the speakers doesn't matched")
-    single_speaker = len(splited_est_scps) == 1
+class Evaluator(object):
+    """
+    Compute the audio metric of the utterance (single or multi-speaker)
+    """
 
-    reporter = AverageReporter(args.spk2class,
-                               name=args.metric.upper(),
-                               unit="dB")
-    utt_val = open(args.per_utt, "w") if args.per_utt else None
-    utt_ali = open(args.utt_ali, "w") if args.utt_ali else None
+    def __init__(self, args) -> None:
+        splited_est_scps = args.est_scp.split(",")
+        splited_ref_scps = args.ref_scp.split(",")
+        if len(splited_ref_scps) != len(splited_est_scps):
+            raise RuntimeError("Number of the speakers doesn't matched")
+        self.est_reader = [
+            AudioReader(scp, sr=args.sr) for scp in splited_est_scps
+        ]
+        self.ref_reader = [
+            AudioReader(scp, sr=args.sr) for scp in splited_ref_scps
+        ]
+        self.single_speaker = len(splited_est_scps) == 1
+        self.metric = args.metric
+        self.sr = args.sr
+
+    @property
+    def index_keys(self) -> List[str]:
+        return self.est_reader[0].index_keys
 
-    if single_speaker:
-        est_reader = AudioReader(args.est_scp, sr=args.sr)
-        ref_reader = AudioReader(args.ref_scp, sr=args.sr)
-        for key, sep in tqdm.tqdm(est_reader):
-            ref = ref_reader[key]
+    def __call__(self, key: str) -> Tuple[str, float, Optional[List[int]]]:
+        if self.single_speaker:
+            sep = self.est_reader[0][key]
+            ref = self.ref_reader[0][key]
             end = min(sep.size, ref.size)
-            metric = permute_metric(args.metric,
+            metric = permute_metric(self.metric,
                                     ref[:end],
                                     sep[:end],
-                                    fs=args.sr,
+                                    fs=self.sr,
                                     compute_permutation=False)
-            reporter.add(key, metric)
-            if utt_val:
-                utt_val.write(f"{key}\t{metric:.2f}\n")
-    else:
-        est_reader = [AudioReader(scp, sr=args.sr) for scp in splited_est_scps]
-        ref_reader = [AudioReader(scp, sr=args.sr) for scp in splited_ref_scps]
-        main_reader = est_reader[0]
-
-        for key in tqdm.tqdm(main_reader.index_keys):
-            est = np.stack([reader[key] for reader in est_reader])
-            ref = np.stack([reader[key] for reader in ref_reader])
+            return key, metric, None
+        else:
+            est = np.stack([reader[key] for reader in self.est_reader])
+            ref = np.stack([reader[key] for reader in self.ref_reader])
             end = min(est.shape[-1], ref.shape[-1])
-            metric, ali = permute_metric(args.metric,
+            metric, ali = permute_metric(self.metric,
                                          ref[:, :end],
                                          est[:, :end],
-                                         fs=args.sr,
+                                         fs=self.sr,
                                          compute_permutation=True)
-            reporter.add(key, metric)
-            if utt_val:
-                utt_val.write(f"{key}\t{metric:.2f}\n")
-            if utt_ali:
-                ali_str = " ".join(map(str, ali))
-                utt_ali.write(f"{key}\t{ali_str}\n")
+            return key, metric, ali
+
+
+# evaluator instance in each worker process
+worker_evaluator = None
+
+
+def init_worker(args) -> None:
+    global worker_evaluator
+    worker_evaluator = Evaluator(args)
+
+
+def run_worker(key: str) -> Tuple[str, float, Optional[List[int]]]:
+    return worker_evaluator(key)
+
+
+def run(args):
+    evaluator = Evaluator(args)
+    reporter = AverageReporter(args.spk2class,
+                               name=args.metric.upper(),
+                               unit="dB")
+    utt_val = open(args.per_utt, "w") if args.per_utt else None
+    utt_ali = open(args.utt_ali, "w") if args.utt_ali else None
+
+    keys = evaluator.index_keys
+    if args.num_jobs > 1:
+        pool = mp.Pool(args.num_jobs, initializer=init_worker, initargs=(args,))
+        # results are returned in the order of the keys, so the
+        # reporter is accumulated in the same order as the serial mode
+        results = pool.imap(run_worker, keys, chunksize=args.chunk_size)
+    else:
+        pool = None
+        results = map(evaluator, keys)
+    for key, metric, ali in tqdm.tqdm(results, total=len(keys)):
+        reporter.add(key, metric)
+        if utt_val:
+            utt_val.write(f"{key}\t{metric:.2f}\n")
+        if utt_ali and ali is not None:
+            ali_str = " ".join(map(str, ali))
+            utt_ali.write(f"{key}\t{ali_str}\n")
+    if pool:
+        pool.close()
+        pool.join()
     reporter.report()
     if utt_val:
         utt_val.close()
@@ -102,5 +144,14 @@ if __name__ == "__main__":
                         type=int,
                         default=16000,
                         help="Sample rate of the audio")
+    parser.add_argument("--num-jobs",
+                        type=int,
+                        default=1,
+                        help="Number of the worker processes")
+    parser.add_argument("--chunk-size",
+                        type=int,
+                        default=16,
+                        help="Number of the utterances sent to "
+                        "the worker process each time")
     args = parser.parse_args()
     run(args)
@@ -4,6 +4,7 @@
 # License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
 
 import argparse
+import multiprocessing as mp
 
 from aps.opts import StrToBoolAction
 from aps.metric.reporter import WerReporter
@@ -56,6 +57,14 @@ class TransReader(object):
                 yield key, self[key]
 
 
+def compute_err(egs):
+    """
+    Compute edit errors of the utterance
+    """
+    key, hyp, ref = egs
+    return key, permute_wer(hyp, ref), sum([len(r) for r in ref])
+
+
 def run(args):
     hyp_reader = TransReader(args.hyp, cer=args.cer)
     ref_reader = TransReader(args.ref, cer=args.cer)
@@ -66,16 +75,24 @@ def run(args):
     reporter = WerReporter(args.utt2class,
                            name="CER" if args.cer else "WER",
                            unit="%")
-    for key, hyp in hyp_reader:
-        ref = ref_reader[key]
-        err = permute_wer(hyp, ref)
-        ref_len = sum([len(r) for r in ref])
+    egs = ((key, hyp, ref_reader[key]) for key, hyp in hyp_reader)
+    if args.num_jobs > 1:
+        pool = mp.Pool(args.num_jobs)
+        # keep the order of the utterances
+        results = pool.imap(compute_err, egs, chunksize=args.chunk_size)
+    else:
+        pool = None
+        results = map(compute_err, egs)
+    for key, err, ref_len in results:
         if each_utt:
             if ref_len != 0:
                 each_utt.write(f"{key}\t{sum(err) / ref_len:.3f}\n")
             else:
                 each_utt.write(f"{key}\tINF\n")
         reporter.add(key, err, ref_len)
+    if pool:
+        pool.close()
+        pool.join()
     reporter.report()
 
 
@@ -105,5 +122,14 @@ if __name__ == "__main__":
                         action=StrToBoolAction,
                         default=False,
                         help="Compute CER instead of WER")
+    parser.add_argument("--num-jobs",
+                        type=int,
+                        default=1,
+                        help="Number of the worker processes")
+    parser.add_argument("--chunk-size",
+                        type=int,
+                        default=256,
+                        help="Number of the utterances sent to "
+                        "the worker process each time")
     args = parser.parse_args()
     run(args)
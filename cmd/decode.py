@@ -69,6 +69,14 @@ class FasterDecoder(NnetEvaluator):
         else:
             return self.decode(src, **kwargs)
 
+    def stream(self, src, chunk_size: int = 16):
+        """
+        Yield the partial hypothesis after each chunk
+        """
+        src = th.from_numpy(src).to(self.device)
+        for hyp in self.decode(src, chunk_size=chunk_size):
+            yield hyp
+
 
 def run(args):
     print(f"Arguments in args:\n{pprint.pformat(vars(args))}", flush=True)
@@ -87,7 +95,7 @@ def run(args):
     if args.lm:
         if Path(args.lm).is_file():
             from aps.asr.lm.ngram import NgramLM
-            lm = NgramLM(args.lm, args.dict)
+            lm = NgramLM(args.lm, args.dict, topk=args.lm_topk)
             logger.info(
                 f"Load ngram LM from {args.lm}, weight = {args.lm_weight}")
         else:
@@ -125,7 +133,18 @@ def run(args):
     dec_args["lm"] = lm
     for key, src in src_reader:
         logger.info(f"Decoding utterance {key}...")
-        nbest_hypos = decoder.run(src, **dec_args)
+        if args.function == "streaming_greedy_search":
+            nbest_hypos = []
+            for hyp in decoder.stream(src, chunk_size=args.chunk_size):
+                partial = processor.run(hyp["trans"][1:-1])
+                logger.info(f"{key} (partial): {partial}")
+                nbest_hypos = [hyp]
+            # e.g., the input is too short to fill the first chunk
+            if not nbest_hypos:
+                logger.warning(f"Got no hypothesis for utterance {key}, skip")
+                continue
+        else:
+            nbest_hypos = decoder.run(src, **dec_args)
         nbest = [f"{key}\n"]
         for idx, hyp in enumerate(nbest_hypos):
             # remove SOS/EOS
@@ -151,6 +170,8 @@ def run(args):
         top1.close()
     if topn and not stdout_topn:
         topn.close()
+    if args.lm and Path(args.lm).is_file():
+        logger.info(f"Hit rate of the ngram LM score cache: {lm.hit_rate:.2%}")
     cost = timer.elapsed()
     logger.info(
         f"Decode {len(src_reader)} utterance done, time cost = {cost:.2f}m")
@@ -162,10 +183,16 @@ if __name__ == "__main__":
         "Command to do end-to-end decoding using beam search algothrim",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
         parents=[DecodingParser.parser])
-    parser.add_argument("--function",
-                        type=str,
-                        choices=["beam_search", "greedy_search"],
-                        default="beam_search",
-                        help="Name of the decoding function")
+    parser.add_argument(
+        "--function",
+        type=str,
+        choices=["beam_search", "greedy_search", "streaming_greedy_search"],
+        default="beam_search",
+        help="Name of the decoding function")
+    parser.add_argument("--chunk-size",
+                        type=int,
+                        default=16,
+                        help="Number of the encoder frames in each chunk "
+                        "(for streaming_greedy_search)")
     args = parser.parse_args()
     run(args)
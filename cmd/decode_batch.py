@@ -65,7 +65,7 @@ def run(args):
     if args.lm:
         if Path(args.lm).is_file():
             from aps.asr.lm.ngram import NgramLM
-            lm = NgramLM(args.lm, args.dict)
+            lm = NgramLM(args.lm, args.dict, topk=args.lm_topk)
             logger.info(
                 f"Load ngram LM from {args.lm}, weight = {args.lm_weight}")
         else:
@@ -141,6 +141,8 @@ def run(args):
         top1.close()
     if topn and not stdout_topn:
         topn.close()
+    if args.lm and Path(args.lm).is_file():
+        logger.info(f"Hit rate of the ngram LM score cache: {lm.hit_rate:.2%}")
     cost = timer.elapsed()
     logger.info(
         f"Decode {len(src_reader)} utterance done, time cost = {cost:.2f}m")
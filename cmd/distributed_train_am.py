@@ -7,7 +7,7 @@ import yaml
 import pprint
 import argparse
 
-from aps.utils import set_seed
+from aps.utils import set_seed, get_device_ids
 from aps.conf import load_am_conf
 from aps.opts import DistributedTrainParser
 from aps.libs import aps_transform, aps_task, aps_dataloader, aps_asr_nnet, aps_trainer
@@ -19,7 +19,8 @@ def train_worker(task, conf, vocab_dict, args):
     Initalize training workers
     """
     # init torch/horovod backend
-    distributed.init(args.distributed)
+    device_ids = get_device_ids(args.device_ids)
+    distributed.init(args.distributed, cpu=device_ids[0] < 0)
     rank = distributed.rank()
 
     Trainer = aps_trainer(args.trainer, distributed=True)
@@ -28,7 +29,7 @@ def train_worker(task, conf, vocab_dict, args):
     # environment variables, and requires that you use init_method="env://".
     trainer = Trainer(task,
                       rank=rank,
-                      device_ids=args.device_ids,
+                      device_ids=device_ids,
                       checkpoint=args.checkpoint,
                       resume=args.resume,
                       init=args.init,
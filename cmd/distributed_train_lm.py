@@ -6,7 +6,7 @@ import yaml
 import pprint
 import argparse
 
-from aps.utils import set_seed
+from aps.utils import set_seed, get_device_ids
 from aps.conf import load_lm_conf
 from aps.opts import DistributedTrainParser
 from aps.libs import aps_task, aps_dataloader, aps_asr_nnet, aps_trainer
@@ -18,12 +18,14 @@ def train_worker(task, conf, vocab_dict, args):
     Initalize training workers
     """
     # init torch/horovod backend
-    distributed.init(args.distributed)
+    device_ids = get_device_ids(args.device_ids)
+    distributed.init(args.distributed, cpu=device_ids[0] < 0)
     rank = distributed.rank()
 
     Trainer = aps_trainer(args.trainer, distributed=True)
     trainer = Trainer(task,
-                      device_ids=args.device_ids,
+                      rank=rank,
+                      device_ids=device_ids,
                       checkpoint=args.checkpoint,
                       resume=args.resume,
                       save_interval=args.save_interval,
@@ -53,12 +55,12 @@ def train_worker(task, conf, vocab_dict, args):
     load_conf.update(data_conf["loader"])
     trn_loader = aps_dataloader(train=True,
                                 distributed=True,
-                                batch_size=args.batch_size // num_process,
+                                max_batch_size=args.batch_size // num_process,
                                 **data_conf["train"],
                                 **load_conf)
     dev_loader = aps_dataloader(train=False,
                                 distributed=False,
-                                batch_size=args.batch_size //
+                                max_batch_size=args.batch_size //
                                 args.dev_batch_factor,
                                 **data_conf["valid"],
                                 **load_conf)
@@ -7,7 +7,7 @@ import yaml
 import pprint
 import argparse
 
-from aps.utils import set_seed
+from aps.utils import set_seed, get_device_ids
 from aps.opts import DistributedTrainParser
 from aps.conf import load_ss_conf
 from aps.libs import aps_transform, aps_task, aps_dataloader, aps_sse_nnet, aps_trainer
@@ -19,13 +19,14 @@ def train_worker(task, conf, args):
     Initalize training workers
     """
     # init torch/horovod backend
-    distributed.init(args.distributed)
+    device_ids = get_device_ids(args.device_ids)
+    distributed.init(args.distributed, cpu=device_ids[0] < 0)
     rank = distributed.rank()
 
     Trainer = aps_trainer(args.trainer, distributed=True)
     trainer = Trainer(task,
                       rank=distributed.rank(),
-                      device_ids=args.device_ids,
+                      device_ids=device_ids,
                       checkpoint=args.checkpoint,
                       resume=args.resume,
                       init=args.init,
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+# Copyright 2020 Jian Wu
+# License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+import argparse
+
+from aps.loader.se.chunk import ScriptDataset
+from aps.loader.se.packed import pack_egs
+from aps.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def run(args):
+
+    def parse_args(scp_str):
+        if not scp_str:
+            return scp_str
+        else:
+            token = scp_str.split(",")
+            return token[0] if len(token) == 1 else list(token)
+
+    dataset = ScriptDataset(mix_scp=args.mix_scp,
+                            ref_scp=parse_args(args.ref_scp),
+                            doa_scp=parse_args(args.doa_scp),
+                            emb_scp=args.emb_scp,
+                            sr=args.sr)
+
+    def egs_iter():
+        for n, key in enumerate(dataset.mix.index_keys):
+            yield key, dataset[n]
+            if (n + 1) % 500 == 0:
+                logger.info(f"Processed {n + 1} utterances...")
+
+    num_utts = pack_egs(egs_iter(),
+                        args.pack_dir,
+                        shard_size=args.shard_size,
+                        dtype=args.dtype)
+    logger.info(f"Pack egs of {num_utts} utterances to {args.pack_dir}, " +
+                "use it in data_conf with fmt: se@packed and pack_dir: " +
+                f"{args.pack_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Command to pack the egs (mixture, references, "
+        "embeddings and DoAs) of the enhancement/separation tasks into the "
+        "memory-mapped shards, which can be loaded by se@packed",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("mix_scp", type=str, help="Mixture audio script")
+    parser.add_argument("pack_dir",
+                        type=str,
+                        help="Output directory of the packed egs")
+    parser.add_argument("--ref-scp",
+                        type=str,
+                        default="",
+                        help="Reference audio scripts, e.g., "
+                        "spk1.scp or spk1.scp,spk2.scp")
+    parser.add_argument("--emb-scp",
+                        type=str,
+                        default="",
+                        help="Speaker embedding script")
+    parser.add_argument("--doa-scp",
+                        type=str,
+                        default="",
+                        help="DoA scripts, e.g., spk1.scp or spk1.scp,spk2.scp")
+    parser.add_argument("--sr",
+                        type=int,
+                        default=16000,
+                        help="Sample rate of the audio")
+    parser.add_argument("--shard-size",
+                        type=float,
+                        default=2048,
+                        help="Maximum size (MB) of each shard")
+    parser.add_argument("--dtype",
+                        type=str,
+                        default="float32",
+                        choices=["float32", "float16"],
+                        help="Data type of the packed audio")
+    args = parser.parse_args()
+    run(args)
@@ -41,38 +41,14 @@ class Separator(NnetEvaluator):
         Args:
             src (Array): (C) x S
         """
-        if chunk_hop <= 0 and chunk_len > 0:
-            chunk_hop = chunk_len
-        N = src.shape[-1]
         src = th.from_numpy(src).to(self.device)
         if chunk_len == -1:
             return self.nnet.infer(src, mode=mode)
         else:
-            if mode != "time":
-                raise RuntimeError("Now only supports time inference mode")
-            chunks = []
-            # now only for enhancement task
-            for t in range(0, N, chunk_hop):
-                pad = N - t - chunk_len
-                if pad >= 0:
-                    c = src[..., t:t + chunk_len]
-                else:
-                    # S or P x S
-                    if src.dim() == 1:
-                        zero = th.zeros(-pad, device=self.device)
-                    else:
-                        zero = th.zeros(src.shape[0], -pad, device=self.device)
-                    c = th.cat([src[..., t:], zero], 0)
-                s = self.nnet.infer(c, mode=mode)
-                chunks.append(s)
-            sep = th.zeros(N)
-            for i, c in enumerate(chunks):
-                beg = i * chunk_hop
-                if i == len(chunks) - 1:
-                    sep[beg:] = c[:N - beg]
-                else:
-                    sep[beg:beg + chunk_len] = c
-            return sep
+            return self.nnet.infer_chunk(src,
+                                         chunk_len,
+                                         chunk_hop=chunk_hop,
+                                         mode=mode)
 
 
 def run(args):
@@ -144,7 +120,8 @@ if __name__ == "__main__":
     parser.add_argument("--chunk-hop",
                         type=int,
                         default=-1,
-                        help="Chunk hop size for inference")
+                        help="Chunk hop size for inference (overlap-add "
+                        "between the chunks), -1 means chunk_len // 2")
     parser.add_argument("--sr",
                         type=int,
                         default=16000,
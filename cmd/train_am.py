@@ -86,6 +86,7 @@ if __name__ == "__main__":
     parser.add_argument("--device-id",
                         type=str,
                         default="0",
-                        help="Training on which GPU device")
+                        help="Training on which GPU device "
+                        "(-1 or cpu means training on CPU)")
     args = parser.parse_args()
     run(args)
@@ -3,11 +3,28 @@
 # Copyright 2020 Jian Wu
 # License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
 
+import io
+import os
 import pytest
+import tempfile
+import numpy as np
+import soundfile as sf
 import torch as th
 
 from aps.libs import aps_dataloader
 from aps.conf import load_dict
+from aps.loader.lm.utt import Dataset
+from aps.loader.audio import AudioReader, read_audio, add_room_response
+from aps.loader.simu import AudioCache
+from aps.loader.se.online import SimuOptionsDataset
+from kaldi_python_io import Reader as BaseReader, ScriptReader
+from aps.loader.lm.utils import binarize_corpus
+from aps.loader.ark import MmapArkReader
+from aps.loader.am.cache import write_feature_cache, FeatureCache
+from aps.loader.se.chunk import ChunkSplitter, ScriptDataset
+from aps.loader.se.packed import pack_egs, PackedEgsReader
+from aps.transform import AsrTransform
+from aps.task.asr import feats_cache
 
 
 @pytest.mark.parametrize("batch_size", [1, 2, 4])
@@ -34,6 +51,137 @@ def test_am_raw_loader(batch_size, num_workers):
             [batch_size, egs["tgt_len"].max().item()])
 
 
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_am_raw_loader_cache(dtype):
+    egs_dir = "data/dataloader/am"
+    transform = AsrTransform(feats="fbank-log-cmvn-aug",
+                             frame_len=400,
+                             frame_hop=160,
+                             aug_prob=0.5)
+    # cache the outputs of fbank-log-cmvn
+    assert transform.cache_index == len(transform.transform) - 1
+    transform.eval()
+    audio_reader = AudioReader(f"{egs_dir}/egs.wav.scp", sr=16000)
+    with th.no_grad(), tempfile.TemporaryDirectory() as cache_dir:
+        write_feature_cache(
+            ((key, transform.forward_cache(th.from_numpy(wav)).numpy())
+             for key, wav in audio_reader),
+            cache_dir,
+            transform.cache_key(),
+            dtype=dtype)
+        loader = aps_dataloader(fmt="am@raw",
+                                wav_scp=f"{egs_dir}/egs.wav.scp",
+                                text=f"{egs_dir}/egs.fake.text",
+                                utt2dur=f"{egs_dir}/egs.utt2dur",
+                                feats_cache=cache_dir,
+                                vocab_dict=load_dict(f"{egs_dir}/dict"),
+                                train=False,
+                                sr=16000,
+                                max_batch_size=1,
+                                min_batch_size=1)
+        for egs in loader:
+            assert egs["src_pad"].shape == th.Size(
+                [1, egs["src_len"][0].item(), transform.feats_dim])
+        nnet = th.nn.Module()
+        nnet.asr_transform = transform
+        cache = FeatureCache(cache_dir)
+        assert cache.key == transform.cache_key()
+        for key, wav in audio_reader:
+            ref, _ = transform(th.from_numpy(wav)[None, ...], None)
+            inp = th.from_numpy(cache[key])[None, ...]
+            with feats_cache(nnet, cache.key):
+                feats, num_frames = transform(inp, th.tensor([inp.shape[1]]))
+            assert num_frames[0] == ref.shape[1]
+            tol = 1e-4 if dtype == "float32" else 1e-2
+            th.testing.assert_allclose(feats, ref, rtol=tol, atol=tol)
+        # the key follows the buffers of the transform
+        state = transform.state_dict()
+        name = next(k for k, v in state.items() if v.is_floating_point())
+        state[name] = state[name] + 1
+        transform.load_state_dict(state)
+        assert transform.cache_key() != cache.key
+        with pytest.raises(ValueError):
+            with feats_cache(nnet, cache.key):
+                pass
+
+
+def test_audio_duration():
+    egs_dir = "data/dataloader/am"
+    utt2dur = BaseReader(f"{egs_dir}/egs.utt2dur", value_processor=float)
+    audio_reader = AudioReader(f"{egs_dir}/egs.wav.scp", sr=16000)
+    for key, _ in audio_reader:
+        assert audio_reader.nsamps(key) == audio_reader[key].shape[-1]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = f"{cache_dir}/utt2dur"
+        # probe from the headers & load from the cache
+        for _ in range(2):
+            probe = audio_reader.durations(cache=cache)
+            # no temporary files left
+            assert os.listdir(cache_dir) == ["utt2dur"]
+            assert len(probe) == len(utt2dur)
+            for key, dur in utt2dur:
+                assert abs(probe[key] - dur) < 1e-3
+        loader = aps_dataloader(fmt="am@raw",
+                                wav_scp=f"{egs_dir}/egs.wav.scp",
+                                text=f"{egs_dir}/egs.fake.text",
+                                dur_cache=cache,
+                                vocab_dict=load_dict(f"{egs_dir}/dict"),
+                                train=False,
+                                sr=16000,
+                                max_batch_size=4,
+                                min_batch_size=1)
+        assert len(loader) > 0
+
+
+@pytest.mark.parametrize("pipe_cache", [True, False])
+@pytest.mark.parametrize("pipe_prefetch", [0, 1, 4])
+def test_audio_pipe(pipe_cache, pipe_prefetch):
+    wav_scp = "data/dataloader/se/wav.1.scp"
+    ref_reader = AudioReader(wav_scp, sr=16000)
+    with tempfile.TemporaryDirectory() as egs_dir:
+        pipe_scp = f"{egs_dir}/wav.scp"
+        with open(pipe_scp, "w") as pipe_fd:
+            for key, path in BaseReader(wav_scp):
+                pipe_fd.write(f"{key} cat {path} |\n")
+        cache_dir = f"{egs_dir}/cache" if pipe_cache else ""
+        pipe_reader = AudioReader(pipe_scp,
+                                  sr=16000,
+                                  pipe_cache=cache_dir,
+                                  pipe_prefetch=pipe_prefetch)
+        # sequential & random access (for twice)
+        for _ in range(2):
+            for key, wav in pipe_reader:
+                assert np.allclose(wav, ref_reader[key])
+        keys = ref_reader.index_keys[::-1]
+        for n, key in enumerate(keys):
+            pipe_reader.prefetch(keys[n:n + pipe_prefetch])
+            assert np.allclose(pipe_reader[key], ref_reader[key])
+        assert len(pipe_reader.pipe_proc) == 0
+        if pipe_cache:
+            assert len(os.listdir(cache_dir)) == len(ref_reader)
+        # the unused ones are dropped
+        pipe_reader.prefetch(keys)
+        pipe_reader.prefetch([])
+        assert len(pipe_reader.pipe_proc) == 0
+
+
+def test_audio_pipe_cleanup():
+    with tempfile.TemporaryDirectory() as egs_dir:
+        pipe_scp = f"{egs_dir}/wav.scp"
+        with open(pipe_scp, "w") as pipe_fd:
+            for n in range(4):
+                pipe_fd.write(f"utt{n} sleep 30; echo utt{n} 1>&2 |\n")
+        pipe_reader = AudioReader(pipe_scp, sr=16000, pipe_prefetch=4)
+        pipe_reader.prefetch(pipe_reader.index_keys)
+        running = list(pipe_reader.pipe_proc.values())
+        assert len(running) == 4
+        # the running pipes are killed and the outputs are removed
+        del pipe_reader
+        for p, output, _ in running:
+            assert p.poll() is not None
+            assert not os.path.exists(output)
+
+
 @pytest.mark.parametrize("batch_size", [10, 15])
 @pytest.mark.parametrize("num_workers", [2, 4])
 def test_am_raw_loader_const(batch_size, num_workers):
@@ -54,12 +202,55 @@ def test_am_raw_loader_const(batch_size, num_workers):
         assert egs["tgt_pad"].shape[-1] == egs["tgt_len"].max().item()
 
 
+@pytest.mark.parametrize("norm", [True, False])
+@pytest.mark.parametrize("subtype", ["PCM_16", "FLOAT"])
+@pytest.mark.parametrize("channel", [1, 2])
+def test_audio_mmap_ark(norm, subtype, channel):
+    with tempfile.TemporaryDirectory() as egs_dir:
+        wav_ark, wav_scp = f"{egs_dir}/wav.ark", f"{egs_dir}/wav.scp"
+        with open(wav_ark, "wb") as ark, open(wav_scp, "w") as scp:
+            for n in range(4):
+                samps = np.random.uniform(-0.5, 0.5, [16000 + n * 100, channel])
+                ark.write(f"utt-{n} ".encode())
+                scp.write(f"utt-{n} {wav_ark}:{ark.tell()}\n")
+                wav = io.BytesIO()
+                sf.write(wav, samps, 16000, format="WAV", subtype=subtype)
+                ark.write(wav.getvalue())
+        ref_reader = AudioReader(wav_scp, sr=16000, norm=norm)
+        mmap_reader = AudioReader(wav_scp, sr=16000, norm=norm, mmap_ark=True)
+        assert len(
+            mmap_reader.ark_table) == (4 if norm or subtype == "PCM_16" else 0)
+        for key, wav in mmap_reader:
+            ref = ref_reader[key]
+            assert wav.shape == ref.shape
+            assert np.allclose(wav, ref)
+            assert mmap_reader.nsamps(key) == ref_reader.nsamps(key)
+    egs_dir = "data/dataloader/am"
+    ref_reader = AudioReader(f"{egs_dir}/egs.wav.scp", sr=16000)
+    mmap_reader = AudioReader(f"{egs_dir}/egs.wav.scp", sr=16000, mmap_ark=True)
+    assert len(mmap_reader.ark_table) == len(ref_reader)
+    for key, wav in mmap_reader:
+        assert np.allclose(wav, ref_reader[key])
+
+
+def test_mmap_ark_reader():
+    egs_dir = "data/dataloader/am"
+    ref_reader = ScriptReader(f"{egs_dir}/egs.fbank.scp")
+    mmap_reader = MmapArkReader(f"{egs_dir}/egs.fbank.scp")
+    assert len(mmap_reader.table) == len(ref_reader)
+    for key, mat in mmap_reader:
+        assert not mat.flags.writeable
+        assert np.allclose(mat, ref_reader[key])
+
+
 @pytest.mark.parametrize("batch_size", [1, 2, 4])
 @pytest.mark.parametrize("num_workers", [0, 2, 4])
-def test_am_kaldi_loader(batch_size, num_workers):
+@pytest.mark.parametrize("mmap_ark", [True, False])
+def test_am_kaldi_loader(batch_size, num_workers, mmap_ark):
     egs_dir = "data/dataloader/am"
     loader = aps_dataloader(fmt="am@kaldi",
                             feats_scp=f"{egs_dir}/egs.fbank.scp",
+                            mmap_ark=mmap_ark,
                             text=f"{egs_dir}/egs.fake.text",
                             vocab_dict=load_dict(f"{egs_dir}/dict"),
                             utt2num_frames=f"{egs_dir}/egs.fbank.num_frames",
@@ -106,6 +297,105 @@ def test_ss_chunk_loader(batch_size, chunk_size, num_workers):
         assert egs["ref"][0].shape == th.Size([batch_size, chunk_size])
 
 
+@pytest.mark.parametrize("batch_size", [3, 8])
+@pytest.mark.parametrize("bucket_size", [1, 4])
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_ss_chunk_loader_bucket(batch_size, bucket_size, num_workers):
+    egs_dir = "data/dataloader/se"
+    chunk_size = 32000
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for train in [True, False]:
+            loader = aps_dataloader(fmt="se@chunk",
+                                    mix_scp=f"{egs_dir}/wav.1.scp",
+                                    ref_scp=f"{egs_dir}/wav.1.scp",
+                                    sr=16000,
+                                    train=train,
+                                    batch_size=batch_size,
+                                    bucket_size=bucket_size,
+                                    dur_cache=f"{cache_dir}/utt2dur",
+                                    chunk_size=chunk_size,
+                                    num_workers=num_workers)
+            loader.set_epoch(1)
+            num_batches = 0
+            chunks = []
+            for egs in loader:
+                assert egs["mix"].shape == th.Size([batch_size, chunk_size])
+                th.testing.assert_allclose(egs["mix"], egs["ref"])
+                chunks.append(egs["mix"])
+                num_batches += 1
+            assert num_batches == len(loader)
+    # same as the chunks split one by one (no shuffle)
+    splitter = ChunkSplitter(chunk_size, train=False, hop=chunk_size // 2)
+    ref = []
+    for _, wav in AudioReader(f"{egs_dir}/wav.1.scp", sr=16000):
+        ref += [c["mix"] for c in splitter.split({"mix": wav})]
+    ref = np.stack(ref[:num_batches * batch_size])
+    th.testing.assert_allclose(th.cat(chunks), th.from_numpy(ref))
+
+
+@pytest.mark.parametrize("batch_size", [2, 4])
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_ss_packed_loader(batch_size, num_workers):
+    egs_dir = "data/dataloader/se"
+    chunk_size = 32000
+    dataset = ScriptDataset(mix_scp=f"{egs_dir}/wav.1.scp",
+                            ref_scp=[f"{egs_dir}/wav.1.scp"] * 2)
+    splitter = ChunkSplitter(chunk_size, train=False, hop=chunk_size // 2)
+    with tempfile.TemporaryDirectory() as pack_dir:
+        num_utts = pack_egs(
+            ((key, dataset[n]) for n, key in enumerate(dataset.mix.index_keys)),
+            pack_dir,
+            shard_size=1)
+        assert num_utts == len(dataset)
+        for train in [True, False]:
+            loader = aps_dataloader(fmt="se@packed",
+                                    pack_dir=pack_dir,
+                                    train=train,
+                                    batch_size=batch_size,
+                                    chunk_size=chunk_size,
+                                    num_workers=num_workers)
+            chunks = []
+            for egs in loader:
+                assert egs["mix"].shape == th.Size([batch_size, chunk_size])
+                assert len(egs["ref"]) == 2
+                th.testing.assert_allclose(egs["mix"], egs["ref"][1])
+                chunks.append(egs["mix"])
+        # same as the chunks split by ChunkSplitter (no shuffle)
+        ref = []
+        for n in range(len(dataset)):
+            ref += [c["mix"] for c in splitter.split(dataset[n])]
+        ref = np.stack(ref[:len(chunks) * batch_size])
+        th.testing.assert_allclose(th.cat(chunks), th.from_numpy(ref))
+
+
+def test_packed_egs_reader():
+    egs = []
+    for n in range(10):
+        N = np.random.randint(16000, 32000)
+        egs.append((f"utt-{n}", {
+            "mix": np.random.rand(4, N).astype(np.float32),
+            "ref": np.random.rand(N).astype(np.float32),
+            "emb": np.random.rand(32).astype(np.float32),
+            "doa": [np.float32(n), np.float32(n + 1)]
+        }))
+    with tempfile.TemporaryDirectory() as pack_dir:
+        pack_egs(egs, pack_dir, shard_size=1)
+        reader = PackedEgsReader(pack_dir)
+        assert len(reader.shard_path) > 1
+        for n, (key, eg) in enumerate(egs):
+            assert reader.index_keys[n] == key
+            N = eg["mix"].shape[-1]
+            assert reader.nsamps(n) == N
+            pack = reader[(n, 100, 8000)]
+            assert pack["mix"].shape == (4, 8000)
+            assert np.allclose(pack["mix"], eg["mix"][:, 100:8100])
+            assert np.allclose(pack["ref"], eg["ref"][100:8100])
+            assert np.allclose(pack["emb"], eg["emb"])
+            assert pack["doa"] == eg["doa"]
+            # crop at the end of utterance
+            assert reader[(n, N - 100, 8000)]["mix"].shape == (4, 100)
+
+
 @pytest.mark.parametrize("batch_size", [1, 2, 4])
 @pytest.mark.parametrize("chunk_size", [32000, 64000])
 @pytest.mark.parametrize("num_workers", [0, 2])
@@ -123,6 +413,58 @@ def test_ss_online_loader(batch_size, chunk_size, num_workers):
         assert egs["ref"][0].shape == th.Size([batch_size, chunk_size])
 
 
+def test_audio_cache():
+    egs_dir = "data/dataloader/se"
+    wav = [f"{egs_dir}/1462-170142-000{i}.wav" for i in range(3)]
+    ref = [read_audio(w, sr=16000) for w in wav]
+    # room for two utterances
+    cache = AudioCache(max_size=(ref[0].nbytes + ref[1].nbytes) / 1024**2)
+    for _ in range(2):
+        for i in range(2):
+            samps = cache.load(wav[i], sr=16000)
+            assert not samps.flags.writeable
+            assert np.array_equal(samps, ref[i])
+            seg = cache.load(wav[i], beg=100, end=4100, sr=16000)
+            assert np.array_equal(seg, ref[i][100:4100])
+    assert cache.miss == 2 and cache.hits == 6
+    # evict the least recently used one
+    cache.load(wav[2], sr=16000)
+    assert len(cache) <= 2 and wav[0] not in cache.cache
+    assert cache.cur_bytes <= cache.max_bytes
+    # too large to be cached, read [beg, end) directly
+    cache = AudioCache(max_size=1e-3)
+    seg = cache.load(wav[0], beg=100, end=4100, sr=16000)
+    assert np.array_equal(seg, ref[0][100:4100])
+    assert len(cache) == 0 and cache.miss == 1
+
+
+def test_add_room_response():
+    rng = np.random.RandomState(666)
+    spk = rng.randn(16000)
+    rir = rng.randn(2, 4000) * np.exp(-np.arange(4000) / 800)
+    revb = {
+        m: add_room_response(spk, rir, conv_method=m)[0]
+        for m in ["direct", "fft", "oa"]
+    }
+    assert revb["direct"].shape == (2, 16000)
+    assert np.allclose(revb["direct"], revb["fft"])
+    assert np.allclose(revb["direct"], revb["oa"])
+
+
+@pytest.mark.parametrize("cache_size", [0, 1])
+def test_ss_online_dataset(cache_size):
+    egs_dir = "data/dataloader/se"
+    dataset = SimuOptionsDataset(f"{egs_dir}/online.opts",
+                                 return_in_egs=["mix", "ref"],
+                                 cache_size=cache_size,
+                                 max_recipes=2)
+    egs = [dataset[i] for i in range(len(dataset))]
+    assert len(dataset.recipes) == 2
+    for i in range(len(dataset)):
+        assert np.array_equal(dataset[i]["mix"], egs[i]["mix"])
+    assert len(dataset.recipes) == 2
+
+
 @pytest.mark.parametrize("batch_size", [1, 4, 16])
 @pytest.mark.parametrize("obj", ["egs.token", "egs.token.gz"])
 def test_lm_utt_loader(batch_size, obj):
@@ -154,3 +496,35 @@ def test_lm_bptt_loader(batch_size, obj):
         print(egs)
         assert egs["src"].shape == egs["tgt"].shape
         assert egs["src"].shape == th.Size([batch_size, 10])
+
+
+@pytest.mark.parametrize("fmt", ["lm@utt", "lm@bptt"])
+@pytest.mark.parametrize("batch_size", [1, 4])
+def test_lm_binary_loader(fmt, batch_size):
+    egs_dir = "data/dataloader/lm"
+    vocab_dict = load_dict(f"{egs_dir}/dict")
+    loader_kwargs = {
+        "fmt": fmt,
+        "sos": 1,
+        "eos": 2,
+        "train": False,
+        "max_batch_size": batch_size
+    }
+    if fmt == "lm@utt":
+        loader_kwargs["min_batch_size"] = batch_size
+    else:
+        loader_kwargs["bptt_size"] = 10
+    with tempfile.TemporaryDirectory() as bin_dir:
+        bin_path = f"{bin_dir}/egs.bin"
+        text = f"{egs_dir}/egs.token"
+        binarize_corpus(Dataset(text, vocab_dict), bin_path)
+        text_loader = aps_dataloader(text=text,
+                                     vocab_dict=vocab_dict,
+                                     **loader_kwargs)
+        bin_loader = aps_dataloader(text=bin_path, **loader_kwargs)
+        num_batches = 0
+        for text_egs, bin_egs in zip(text_loader, bin_loader):
+            num_batches += 1
+            assert th.equal(text_egs["src"], bin_egs["src"])
+            assert th.equal(text_egs["tgt"], bin_egs["tgt"])
+        assert num_batches > 0
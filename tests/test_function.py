@@ -3,6 +3,8 @@
 # Copyright 2020 Jian Wu
 # License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
 
+import copy
+import json
 import pytest
 import torch as th
 import torch.nn as nn
@@ -13,6 +15,9 @@ from aps.asr.xfmr.pose import digit_shift
 from aps.asr.xfmr.decoder import prep_sub_mask
 from aps.asr.xfmr.impl import ApsMultiheadAttention
 from aps.asr.base.attention import padding_mask
+from aps.utils import get_device_ids
+from aps.trainer.base import CheckpointSaver, CheckpointAverager
+from aps.trainer.base import StepProfiler, ProgressReporter
 
 
 @pytest.mark.parametrize(
@@ -37,6 +42,101 @@ def test_register(package):
         print(c.keys())
 
 
+@pytest.mark.parametrize("device_ids,ref", [
+    pytest.param(-1, (-1,)),
+    pytest.param("cpu", (-1,)),
+    pytest.param("cpu,cpu,cpu", (-1, -1, -1)),
+    pytest.param("-1,-1", (-1, -1))
+])
+def test_cpu_device_ids(device_ids, ref):
+    assert get_device_ids(device_ids) == ref
+    with pytest.raises(ValueError):
+        get_device_ids("0,cpu")
+
+
+@pytest.mark.parametrize("max_inflight", [0, 1, 3])
+def test_checkpoint_saver(tmp_path, max_inflight):
+    saver = CheckpointSaver(max_inflight)
+    nnet = nn.Linear(16, 16)
+    ref = []
+    for step in range(6):
+        nnet.weight.data.fill_(step)
+        ref.append(nnet.weight.data.clone())
+        saver.save({
+            "step": step,
+            "model_state": nnet.state_dict()
+        }, tmp_path / f"{step}.pt.tar")
+        saver.save({"step": step}, tmp_path / "last.pt.tar")
+    saver.flush()
+    for step in range(6):
+        cpt = th.load(tmp_path / f"{step}.pt.tar")
+        assert cpt["step"] == step
+        th.testing.assert_allclose(cpt["model_state"]["weight"], ref[step])
+    assert th.load(tmp_path / "last.pt.tar")["step"] == 5
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+@pytest.mark.parametrize("mode", ["mean", "ema"])
+def test_checkpoint_averager(tmp_path, mode):
+    nnet = nn.Sequential(nn.Linear(16, 16), nn.BatchNorm1d(16))
+    weights = [1, 2, 3]
+    states = []
+    for i, weight in enumerate(weights):
+        for p in nnet.parameters():
+            p.data.normal_()
+        nnet[1].num_batches_tracked.fill_(i + 1)
+        states.append(copy.deepcopy(nnet.state_dict()))
+        th.save({"epoch": i, "model_state": states[-1]}, tmp_path / f"{i}.pt")
+    averager = CheckpointAverager(mode=mode, ema_decay=0.8)
+    for i, weight in enumerate(weights):
+        averager.add(tmp_path / f"{i}.pt", weight=weight)
+    averager.save(tmp_path / "avg.pt.tar")
+    cpt = th.load(tmp_path / "avg.pt.tar")
+    assert cpt["epoch"] == len(weights) - 1
+    for key, p in cpt["model_state"].items():
+        if not p.is_floating_point():
+            ref = 2 if mode == "mean" else 3
+        elif mode == "mean":
+            ref = sum(w * s[key] for w, s in zip(weights, states))
+            ref = ref / sum(weights)
+        else:
+            ref = states[0][key]
+            for s in states[1:]:
+                ref = ref * 0.8 + s[key] * 0.2
+        th.testing.assert_allclose(p, ref)
+    nnet.load_state_dict(cpt["model_state"])
+
+
+def test_step_profiler(tmp_path):
+    reporter = ProgressReporter(tmp_path, ["loss"], tensorboard=False)
+    profiler = StepProfiler(tmp_path,
+                            th.device("cpu"),
+                            reporter,
+                            interval=2,
+                            trace_steps=[1, 3])
+    nnet = nn.Linear(16, 16)
+    optimizer = th.optim.SGD(nnet.parameters(), lr=0.1)
+    for step in range(4):
+        egs = {"#utt": 4, "src_len": th.tensor([10, 10, 10, 10])}
+        profiler.data_ready(egs, step)
+        with profiler.phase("forward"):
+            loss = th.sum(nnet(th.rand(4, 16))**2)
+        with profiler.phase("backward"):
+            loss.backward()
+        with profiler.phase("optimizer"):
+            optimizer.step()
+            optimizer.zero_grad()
+        profiler.step(step + 1, 1)
+    profiler.close()
+    with open(tmp_path / "profile.json", "r") as json_f:
+        records = [json.loads(line) for line in json_f]
+    assert [r["step"] for r in records] == [2, 4]
+    for r in records:
+        for key in ["time/data", "time/forward", "utt/s", "frame/s"]:
+            assert r[key] >= 0
+    assert (tmp_path / "trace.1-3.json").exists()
+
+
 @pytest.mark.parametrize("N, H, T, D, K", [
     pytest.param(2, 4, 32, 64, 8),
     pytest.param(2, 4, 32, 64, 32),
@@ -4,11 +4,23 @@
 # License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
 
 import pytest
+import tempfile
 import torch as th
 
 from aps.libs import aps_asr_nnet
 from aps.transform import AsrTransform, EnhTransform
 from aps.asr.base.encoder import Conv1dEncoder, Conv2dEncoder
+from aps.asr.xfmr.decoder import TorchTransformerDecoder
+from aps.asr.xfmr.encoder import TransformerEncoder
+from aps.asr.beam_search.lm import adjust_hidden
+from aps.asr.beam_search.xfmr import beam_search as xfmr_beam_search
+from aps.asr.lm.ngram import NgramLM
+from aps.asr.beam_search.utils import BeamSearchParam, BatchBeamTracker
+from aps.asr.beam_search.utils import VectorizedBeamTracker
+from aps.asr.beam_search.transducer import greedy_search, beam_search_batch
+from aps.asr.beam_search.transducer import greedy_search_stream, _merge_hypos
+from aps.asr.transducer.decoder import PyTorchRNNDecoder
+from aps.asr.transducer.decoder import TorchTransformerDecoder as XfmrDecoder
 
 default_rnn_dec_kwargs = {
     "dec_rnn": "lstm",
@@ -458,6 +470,140 @@ def test_xfmr_encoder(enc_type, enc_kwargs):
     assert z.shape == th.Size([4, u + 1, vocab_size - 1])
 
 
+toy_arpa = """
+\\data\\
+ngram 1=6
+ngram 2=6
+
+\\1-grams:
+-0.8\t<unk>\t0
+0\t<s>\t-0.3
+-0.7\t</s>\t0
+-0.5\ta\t-0.2
+-0.6\tb\t-0.3
+-0.9\tc\t-0.1
+
+\\2-grams:
+-0.2\t<s> a
+-0.4\ta b
+-0.3\tb c
+-0.5\tc </s>
+-0.6\tb a
+-0.3\ta </s>
+
+\\end\\
+"""
+
+
+@pytest.mark.parametrize("topk", [0, 2])
+def test_ngram_lm_cache(topk):
+    pytest.importorskip("kenlm")
+    vocab_size = 5
+    with tempfile.TemporaryDirectory() as lm_dir:
+        with open(f"{lm_dir}/lm.arpa", "w") as arpa:
+            arpa.write(toy_arpa)
+        with open(f"{lm_dir}/dict", "w") as vocab:
+            for i, tok in enumerate(["<sos>", "<eos>", "a", "b", "c"]):
+                vocab.write(f"{tok} {i}\n")
+        lm_kwargs = {"lm": f"{lm_dir}/lm.arpa", "vocab_dict": f"{lm_dir}/dict"}
+        cached_lm = NgramLM(**lm_kwargs, cache_size=16, topk=topk)
+        # nothing is kept in the cache
+        uncached_lm = NgramLM(**lm_kwargs, cache_size=0, topk=topk)
+    # beams with the repeated prefixes
+    token = th.tensor([[2, 3, 4, 2], [2, 3, 4, 3], [2, 3, 2, 2], [3, 3, 4, 2]])
+    am_prob = th.log_softmax(th.randn(4, 4, vocab_size), -1)
+    states = [None, None]
+    for u in range(token.shape[-1]):
+        scores = []
+        for i, lm in enumerate([cached_lm, uncached_lm]):
+            score, states[i] = lm(token[:, u], states[i], am_prob=am_prob[u])
+            scores.append(score)
+        th.testing.assert_allclose(scores[0], scores[1])
+    # same hypothesis as the uncached one
+    decoder = TorchTransformerDecoder(vocab_size,
+                                      att_dim=64,
+                                      nhead=4,
+                                      feedforward_dim=128,
+                                      num_layers=2)
+    decoder.eval()
+    enc_out = th.rand(20, 1, 64)
+    hypos = []
+    with th.no_grad():
+        for lm in [cached_lm, uncached_lm]:
+            nbest = xfmr_beam_search(decoder,
+                                     enc_out,
+                                     lm=lm,
+                                     lm_weight=0.5,
+                                     beam_size=4,
+                                     nbest=4,
+                                     max_len=8,
+                                     sos=0,
+                                     eos=1)
+            hypos.append(nbest)
+    for hyp, ref in zip(*hypos):
+        assert hyp["trans"] == ref["trans"]
+        assert abs(hyp["score"] - ref["score"]) < 1e-4
+    assert cached_lm.hit_rate > 0
+    assert uncached_lm.hit_rate == 0
+
+
+@pytest.mark.parametrize("post_norm", [True, False])
+def test_xfmr_decoder_cache(post_norm):
+    vocab_size, num_beams, T, U = 100, 4, 50, 10
+    decoder = TorchTransformerDecoder(vocab_size,
+                                      att_dim=256,
+                                      nhead=4,
+                                      feedforward_dim=512,
+                                      num_layers=2,
+                                      post_norm=post_norm)
+    decoder.eval()
+    enc_out = th.rand(T, num_beams, 256)
+    enc_len = th.randint(T // 2, T, (num_beams,))
+    enc_len[0] = T
+    token = th.randint(0, vocab_size, (num_beams, U))
+    memory_kv = decoder.memory_cache(enc_out)
+    self_kv = None
+    with th.no_grad():
+        for u in range(U):
+            # shuffle the beams as beam search does
+            point = th.randperm(num_beams) if u else th.arange(num_beams)
+            token = token[point]
+            enc_out, enc_len = enc_out[:, point], enc_len[point]
+            memory_kv = adjust_hidden(point, memory_kv)
+            dec_ref, _ = decoder.step(enc_out,
+                                      token[:, :u + 1],
+                                      enc_len=enc_len,
+                                      out_idx=-1)
+            dec_out, self_kv = decoder.cached_step(memory_kv,
+                                                   token[:, u:u + 1],
+                                                   enc_len=enc_len,
+                                                   self_kv=adjust_hidden(
+                                                       point, self_kv))
+            th.testing.assert_allclose(dec_out, dec_ref)
+
+
+@pytest.mark.parametrize("num_beams", [1, 4])
+def test_xfmr_lm_cache(num_beams):
+    nnet_cls = aps_asr_nnet("asr@xfmr_lm")
+    vocab_size, U = 100, 10
+    xfmr_lm = nnet_cls(vocab_size=vocab_size,
+                       att_dim=256,
+                       nhead=4,
+                       feedforward_dim=512,
+                       num_layers=2)
+    xfmr_lm.eval()
+    token = th.randint(0, vocab_size, (num_beams, U))
+    hidden = None
+    with th.no_grad():
+        for u in range(U):
+            point = th.randperm(num_beams) if u else th.arange(num_beams)
+            token = token[point]
+            ref, _ = xfmr_lm(token[:, :u + 1], None)
+            out, hidden = xfmr_lm(token[:, u:u + 1],
+                                  adjust_hidden(point, hidden))
+            th.testing.assert_allclose(out[:, 0], ref[:, -1])
+
+
 @pytest.mark.parametrize("enc_type,enc_kwargs", [
     pytest.param("variant_rnn", custom_rnn_enc_kwargs),
     pytest.param("conv1d", conv1d_enc_kwargs),
@@ -539,3 +685,240 @@ def test_xfmr_transducer(enc_type, enc_kwargs):
     x, x_len, y, y_len, u = gen_egs(vocab_size, batch_size)
     z, _ = xfmr_rnnt(x, x_len, y, y_len)
     assert z.shape[2:] == th.Size([u + 1, vocab_size])
+
+
+@pytest.mark.parametrize("enc_type,enc_kwargs", [
+    pytest.param("pytorch_rnn", default_rnn_enc_kwargs),
+    pytest.param("conv1d", conv1d_enc_kwargs),
+    pytest.param("fsmn", fsmn_enc_kwargs),
+    pytest.param("xfmr_abs", xfmr_enc_kwargs)
+])
+def test_batch_decoding_prep(enc_type, enc_kwargs):
+    nnet_cls = aps_asr_nnet("asr@xfmr")
+    asr_transform = AsrTransform(feats="fbank-log-cmvn",
+                                 frame_len=400,
+                                 frame_hop=160,
+                                 window="hamm")
+    xfmr_asr = nnet_cls(input_size=80,
+                        vocab_size=100,
+                        sos=0,
+                        eos=1,
+                        asr_transform=asr_transform,
+                        enc_type=enc_type,
+                        enc_proj=None if enc_type == "xfmr_abs" else 512,
+                        enc_kwargs=enc_kwargs,
+                        dec_kwargs=default_xfmr_dec_kwargs)
+    xfmr_asr.eval()
+    batch = [th.rand(S) for S in [32000, 24000, 16123, 8000]]
+    with th.no_grad():
+        # T x N x D
+        enc_out, enc_len = xfmr_asr._batch_decoding_prep(batch,
+                                                         batch_first=False)
+        for n, inp in enumerate(batch):
+            # T x 1 x D
+            ref = xfmr_asr._decoding_prep(inp, batch_first=False)
+            assert ref.shape[0] == enc_len[n].item()
+            th.testing.assert_allclose(enc_out[:ref.shape[0], n], ref[:, 0])
+
+
+def test_xfmr_beam_search_batch():
+    th.random.manual_seed(666)
+    nnet_cls = aps_asr_nnet("asr@xfmr")
+    vocab_size = 100
+    xfmr_asr = nnet_cls(input_size=80,
+                        vocab_size=vocab_size,
+                        sos=0,
+                        eos=1,
+                        asr_transform=None,
+                        enc_type="xfmr_abs",
+                        enc_kwargs=xfmr_enc_kwargs,
+                        dec_kwargs=default_xfmr_dec_kwargs)
+    xfmr_asr.eval()
+    # make eos more likely, so that the hypothesis end before max_len
+    output = xfmr_asr.decoder.output
+    xfmr_asr.decoder.output = th.nn.Linear(output.in_features,
+                                           output.out_features)
+    with th.no_grad():
+        xfmr_asr.decoder.output.weight.copy_(output.weight)
+        xfmr_asr.decoder.output.bias.zero_()
+        xfmr_asr.decoder.output.bias[1] = 4
+    batch = [th.rand(T, 80) for T in [200, 150, 101, 50]]
+    beam_kwargs = {
+        "beam_size": 4,
+        "nbest": 2,
+        "max_len": 20,
+        "eos_threshold": 1
+    }
+    with th.no_grad():
+        batch_nbest = xfmr_asr.beam_search_batch(batch, **beam_kwargs)
+        for n, inp in enumerate(batch):
+            # same as decoding one by one (the padding frames are masked)
+            nbest = xfmr_asr.beam_search(inp, **beam_kwargs)
+            assert len(batch_nbest[n]) == len(nbest)
+            for hyp, ref in zip(batch_nbest[n], nbest):
+                assert hyp["trans"] == ref["trans"]
+                assert abs(hyp["score"] - ref["score"]) < 1e-3
+
+
+@pytest.mark.parametrize(
+    "enc_type", ["xfmr_abs", "xfmr_rel", "xfmr_xl", "cfmr_rel", "cfmr_xl"])
+@pytest.mark.parametrize("chunk_size,left_context", [(4, -1), (4, 6), (8, 0),
+                                                     (-1, -1)])
+def test_xfmr_encoder_streaming(enc_type, chunk_size, left_context):
+    encoder = TransformerEncoder(enc_type,
+                                 80,
+                                 proj_layer="conv2d",
+                                 proj_kwargs={"conv_channels": 32},
+                                 att_dim=64,
+                                 nhead=4,
+                                 feedforward_dim=128,
+                                 num_layers=2,
+                                 radius=16,
+                                 kernel_size=3,
+                                 chunk_size=chunk_size,
+                                 left_context=left_context)
+    encoder.eval()
+    x = th.rand(2, 203, 80)
+    with th.no_grad():
+        ref, _ = encoder(x, None)
+        if chunk_size > 0:
+            # first chunk needs (7 - 4) more frames for conv2d projection
+            beg, end, cache, out = 0, chunk_size * 4 + 3, None, []
+            while beg < x.shape[1]:
+                enc_out, cache = encoder.step(x[:, beg:end], cache=cache)
+                assert enc_out.shape[1] <= chunk_size
+                beg, end = end, end + chunk_size * 4
+                out.append(enc_out)
+            out = th.cat(out, 1)
+            # split into chunks in step()
+            utt, _ = encoder.step(x)
+            th.testing.assert_allclose(utt, ref)
+        else:
+            out, _ = encoder.step(x)
+    assert out.shape == ref.shape
+    th.testing.assert_allclose(out, ref)
+
+
+def test_transducer_greedy_search_stream():
+    vocab_size, enc_dim = 40, 64
+    decoder = PyTorchRNNDecoder(vocab_size,
+                                embed_size=enc_dim,
+                                enc_dim=enc_dim,
+                                jot_dim=enc_dim,
+                                dec_layers=2,
+                                dec_hidden=enc_dim)
+    decoder.eval()
+    enc_out = th.rand(1, 50, enc_dim) * 2
+    blank = vocab_size - 1
+    with th.no_grad():
+        greedy = greedy_search(decoder, enc_out, blank=blank)[0]
+        partial = list(
+            greedy_search_stream(decoder, th.split(enc_out, 8, 1), blank=blank))
+    assert len(partial) == 7
+    for prev, succ in zip(partial[:-1], partial[1:]):
+        assert succ["trans"][:len(prev["trans"]) - 1] == prev["trans"][:-1]
+    assert partial[-1]["trans"] == greedy["trans"]
+    assert abs(partial[-1]["score"] - greedy["score"]) < 1e-3
+
+
+@pytest.mark.parametrize("dec_type", ["rnn", "xfmr"])
+def test_transducer_beam_search_batch(dec_type):
+    vocab_size, enc_dim = 40, 64
+    if dec_type == "rnn":
+        decoder = PyTorchRNNDecoder(vocab_size,
+                                    embed_size=enc_dim,
+                                    enc_dim=enc_dim,
+                                    jot_dim=enc_dim,
+                                    dec_layers=2,
+                                    dec_hidden=enc_dim)
+    else:
+        decoder = XfmrDecoder(vocab_size,
+                              jot_dim=enc_dim,
+                              att_dim=enc_dim,
+                              nhead=4,
+                              feedforward_dim=128,
+                              num_layers=2)
+    decoder.eval()
+    enc_len = th.tensor([30, 24, 16])
+    enc_out = th.rand(3, 30, enc_dim) * 2
+    blank = vocab_size - 1
+    with th.no_grad():
+        batch_nbest = beam_search_batch(decoder,
+                                        enc_out,
+                                        enc_len=enc_len,
+                                        beam=4,
+                                        blank=blank,
+                                        nbest=2)
+        batch_greedy = beam_search_batch(decoder,
+                                         enc_out,
+                                         enc_len=enc_len,
+                                         beam=1,
+                                         blank=blank,
+                                         nbest=1)
+        for n, T in enumerate(enc_len.tolist()):
+            # same as decoding one by one
+            nbest = beam_search_batch(decoder,
+                                      enc_out[n:n + 1, :T],
+                                      beam=4,
+                                      blank=blank,
+                                      nbest=2)[0]
+            for hyp, ref in zip(batch_nbest[n], nbest):
+                assert hyp["trans"] == ref["trans"]
+                assert abs(hyp["score"] - ref["score"]) < 1e-3
+            # beam = 1 equals to greedy search
+            greedy = greedy_search(decoder, enc_out[n:n + 1, :T],
+                                   blank=blank)[0]
+            assert batch_greedy[n][0]["trans"] == greedy["trans"]
+            assert abs(batch_greedy[n][0]["score"] - greedy["score"]) < 1e-3
+        with pytest.raises(TypeError):
+            beam_search_batch(decoder, enc_out, blank=blank, lm_topk=2)
+
+
+def test_transducer_merge_hypos():
+    score = th.log(th.tensor([[0.4, 0.3, 0.2, 0.1]]))
+    # token sequences: [1, 2], [1, 2], [1, 2, 0] (prefix), [2, 1]
+    seq = th.tensor([[[1, 2, 0], [1, 2, 0], [1, 2, 0], [2, 1, 0]]])
+    num_tok = th.tensor([[2, 2, 3, 2]])
+    merged = _merge_hypos(score, seq, num_tok).exp()
+    assert th.allclose(merged, th.tensor([[0.7, 0, 0.2, 0.1]]))
+
+
+@pytest.mark.parametrize("cov_penalty", [0, 0.5])
+@pytest.mark.parametrize("end_detect", [True, False])
+def test_vectorized_beam_tracker(cov_penalty, end_detect):
+    N, beam, vocab_size, T = 3, 4, 8, 10
+    num_steps = 30
+    # with this seed, some utterances auto-stop before the others and still
+    # get ended hypothesis in the following steps
+    th.random.manual_seed(1)
+    am_prob = th.randn(num_steps, N * beam, vocab_size) * 3
+    # boost eos to make the ended hypothesis more likely
+    am_prob[..., 1] += 3
+    am_prob = th.log_softmax(am_prob, -1)
+    att_ali = th.softmax(th.randn(num_steps, N * beam, T), -1)
+    param = BeamSearchParam(beam_size=beam,
+                            sos=0,
+                            eos=1,
+                            min_len=[2, 0, 3],
+                            max_len=[12, num_steps, 20],
+                            len_penalty=0.5,
+                            cov_penalty=cov_penalty,
+                            eos_threshold=1.2,
+                            end_detect=end_detect)
+    hypos = []
+    for Tracker in [BatchBeamTracker, VectorizedBeamTracker]:
+        tracker = Tracker(N, param)
+        stop, step = False, 0
+        while not stop:
+            _, point = tracker[-1]
+            stop = tracker.step(am_prob[step], 0, att_ali=att_ali[step][point])
+            step += 1
+        # compare all the ended hypothesis
+        hypos.append(tracker.nbest_hypos(N * beam * num_steps,
+                                         auto_stop=stop))
+    for ref, hyp in zip(*hypos):
+        assert len(ref) == len(hyp)
+        for r, h in zip(ref, hyp):
+            assert r["trans"] == h["trans"]
+            assert abs(r["score"] - h["score"]) < 1e-4
+            th.testing.assert_allclose(r["align"], h["align"])
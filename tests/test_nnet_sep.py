@@ -8,6 +8,7 @@ import torch as th
 
 from aps.libs import aps_sse_nnet
 from aps.transform import EnhTransform
+from aps.sse.base import SseBase
 
 
 @pytest.mark.parametrize("num_spks,nonlinear", [
@@ -271,3 +272,36 @@ def test_rnn_enh_ml(num_bins):
     assert y.shape == th.Size([2, 249, num_bins])
     z = rnn_enh_ml.infer(inp[0])
     assert z.shape == th.Size([249, num_bins])
+
+
+class ShuffleSse(SseBase):
+    """
+    Return (x, x^2, x^3, ...) of the input in random speaker order
+    """
+
+    def __init__(self, num_spks: int = 2):
+        super(ShuffleSse, self).__init__(None, training_mode="time")
+        self.num_spks = num_spks
+
+    def infer(self, mix, mode="time"):
+        sep = [mix**(i + 1) for i in range(self.num_spks)]
+        if self.num_spks == 1:
+            return sep[0]
+        return [sep[i] for i in th.randperm(self.num_spks).tolist()]
+
+
+@pytest.mark.parametrize("num_spks", [1, 2, 3])
+@pytest.mark.parametrize("chunk_len,chunk_hop", [(4000, -1), (4000, 3000),
+                                                 (4000, 1000), (20000, 2000)])
+def test_infer_chunk(num_spks, chunk_len, chunk_hop):
+    nnet = ShuffleSse(num_spks)
+    mix = th.randn(16333)
+    sep = nnet.infer_chunk(mix, chunk_len, chunk_hop=chunk_hop)
+    if num_spks == 1:
+        sep = [sep]
+    ref = [mix**(i + 1) for i in range(num_spks)]
+    for s in sep:
+        assert s.shape == mix.shape
+        # the first chunk decides the speaker order
+        err = [th.sum((s - r)**2).item() for r in ref]
+        assert min(err) < 1e-3
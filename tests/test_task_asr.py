@@ -3,6 +3,7 @@
 # Copyright 2020 Jian Wu
 # License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
 
+import pytest
 import torch as th
 
 from aps.libs import aps_task, aps_asr_nnet
@@ -140,3 +141,14 @@ def test_lm_xent():
     }
     stats = task(egs)
     assert not th.isnan(stats["loss"])
+
+
+def test_xfmr_lm_bptt():
+    nnet_cls = aps_asr_nnet("asr@xfmr_lm")
+    xfmr_lm = nnet_cls(vocab_size=100,
+                       att_dim=256,
+                       nhead=4,
+                       feedforward_dim=512,
+                       num_layers=2)
+    with pytest.raises(ValueError):
+        aps_task("asr@lm", xfmr_lm, bptt_mode=True)
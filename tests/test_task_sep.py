@@ -7,9 +7,12 @@ import math
 import pytest
 import torch as th
 
+from itertools import permutations
 from torch.nn.utils import clip_grad_norm_
 from aps.libs import aps_task, aps_sse_nnet
 from aps.transform import EnhTransform
+from aps.task.objf import permu_invarint_objf
+from aps.task.sse import sisnr
 
 
 def toy_rnn(mode, num_spks):
@@ -184,3 +187,32 @@ def test_enh_ml(num_channels):
     task = aps_task("sse@enh_ml", rnn_ml)
     egs = {"mix": th.rand(4, num_channels, 64000)}
     run_epochs(task, egs, 3)
+
+
+@pytest.mark.parametrize("num_spks", [2, 3, 5])
+def test_pit_search(num_spks):
+    batch_size, chunk_size = 4, 8000
+    ref = [th.rand(batch_size, chunk_size) for _ in range(num_spks)]
+    # shuffled and noisy references as estimation
+    est = [r + th.rand(batch_size, chunk_size) * 0.5 for r in ref[::-1]]
+
+    def objf(out, ref):
+        return -sisnr(out, ref)
+
+    # brute force
+    permu = list(permutations(range(num_spks)))
+    loss_mat = th.stack([
+        sum([objf(est[s], ref[t])
+             for s, t in enumerate(p)]) / num_spks
+        for p in permu
+    ])
+    ref_loss, ref_index = th.min(loss_mat, 0)
+    for search in ["exhaustive", "hungarian"]:
+        loss, index = permu_invarint_objf(est,
+                                          ref,
+                                          objf,
+                                          return_permutation=True,
+                                          search=search)
+        th.testing.assert_allclose(loss, ref_loss)
+        assert index.tolist() == ref_index.tolist()
+        assert permu[index[0]] == tuple(range(num_spks))[::-1]
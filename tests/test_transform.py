@@ -13,6 +13,7 @@ from aps.cplx import ComplexTensor
 from aps.loader import read_audio
 from aps.transform import AsrTransform, EnhTransform, FixedBeamformer, DfTransform
 from aps.transform.asr import SpeedPerturbTransform
+from aps.transform.augment import tf_mask, random_mask, perturb_speed
 
 egs1_wav = read_audio("data/transform/egs1.wav", sr=16000)
 egs2_wav = read_audio("data/transform/egs2.wav", sr=16000)
@@ -35,6 +36,51 @@ def test_forward_inverse_stft(wav, frame_len, frame_hop, window, center):
     th.testing.assert_allclose(out[..., :trunc], wav[..., :trunc])
 
 
+@pytest.mark.parametrize("frame_len, frame_hop", [(512, 256), (400, 160)])
+@pytest.mark.parametrize("round_pow_of_two", [True, False])
+@pytest.mark.parametrize("normalized, onesided", [(False, True), (True, False)])
+@pytest.mark.parametrize("center", [True, False])
+@pytest.mark.parametrize("mode", ["librosa", "kaldi"])
+def test_stft_backend(frame_len, frame_hop, round_pow_of_two, normalized,
+                      onesided, center, mode):
+    wav = th.from_numpy(egs2_wav[:, :16000].copy())
+    stft_kwargs = {
+        "window": "hamm",
+        "round_pow_of_two": round_pow_of_two,
+        "normalized": normalized,
+        "onesided": onesided,
+        "center": center,
+        "mode": mode
+    }
+    for pre_emphasis in [0, 0.97]:
+        ref = forward_stft(wav,
+                           frame_len,
+                           frame_hop,
+                           output="real",
+                           pre_emphasis=pre_emphasis,
+                           **stft_kwargs)
+        out = forward_stft(wav,
+                           frame_len,
+                           frame_hop,
+                           output="real",
+                           pre_emphasis=pre_emphasis,
+                           backend="fft",
+                           **stft_kwargs)
+        th.testing.assert_allclose(out, ref)
+    ref = inverse_stft(ref[0],
+                       frame_len,
+                       frame_hop,
+                       input="real",
+                       **stft_kwargs)
+    out = inverse_stft(out[0],
+                       frame_len,
+                       frame_hop,
+                       input="real",
+                       backend="fft",
+                       **stft_kwargs)
+    th.testing.assert_allclose(out, ref)
+
+
 @pytest.mark.parametrize("wav", [egs1_wav, egs2_wav[0].copy()])
 @pytest.mark.parametrize("frame_len, frame_hop", [(512, 256), (1024, 256),
                                                   (400, 160)])
@@ -90,6 +136,63 @@ def test_speed_perturb(max_length):
         assert wav_out.shape[-1] == out_len.item()
 
 
+@pytest.mark.parametrize("batch_size", [8])
+def test_batch_speed_perturb(batch_size):
+    speed_perturb = SpeedPerturbTransform(sr=16000)
+    wav_len = th.randint(16000, 32000, (batch_size,))
+    wav = th.randn(batch_size, wav_len.max().item())
+    th.random.manual_seed(777)
+    wav_sp = speed_perturb(wav)
+    out_len = speed_perturb.output_length(wav_len)
+    # reference: resample utterance one by one
+    th.random.manual_seed(777)
+    choice = th.randint(0, len(speed_perturb.weights) + 1, (batch_size,))
+    assert th.all(choice == speed_perturb.last_choice)
+    for i, c in enumerate(choice.tolist()):
+        if c == len(speed_perturb.weights):
+            ref = wav[i]
+        else:
+            ref = perturb_speed(wav[i:i + 1], speed_perturb.weights[c])[0]
+        th.testing.assert_allclose(wav_sp[i, :ref.shape[-1]], ref)
+        assert th.all(wav_sp[i, ref.shape[-1]:] == 0)
+        assert out_len[i] <= ref.shape[-1]
+
+
+@pytest.mark.parametrize("batch_size, num_frames, num_bins", [(8, 100, 80)])
+def test_tf_mask(batch_size, num_frames, num_bins):
+    lengths = th.randint(num_frames // 2, num_frames, (batch_size,))
+    lengths[0] = num_frames
+    masks = tf_mask(batch_size, (num_frames, num_bins),
+                    p=0.2,
+                    max_bands=30,
+                    max_frame=40,
+                    lengths=lengths)
+    assert masks.shape == th.Size([batch_size, num_frames, num_bins])
+    for n, num_valid in enumerate(lengths.tolist()):
+        # no time masks in the padding region
+        assert th.all(masks[n, num_valid:].sum(-1) == masks[n, -1].sum())
+    # reproducible with the same seed
+    generator = th.Generator()
+    seed_masks = []
+    for _ in range(2):
+        generator.manual_seed(777)
+        seed_masks.append(
+            tf_mask(batch_size, (num_frames, num_bins),
+                    lengths=lengths,
+                    generator=generator))
+    assert th.all(seed_masks[0] == seed_masks[1])
+    # same distribution as random_mask(): average masked ratio
+    num_egs = 2000
+    ratio_ref = sum([
+        1 - random_mask(
+            (num_frames, num_bins), max_steps=30, order="freq").mean().item()
+        for _ in range(num_egs)
+    ]) / num_egs
+    ratio = 1 - tf_mask(num_egs,
+                        (num_frames, num_bins), max_frame=1).mean().item()
+    assert abs(ratio - ratio_ref) < 0.01
+
+
 @pytest.mark.parametrize("wav", [egs2_wav])
 @pytest.mark.parametrize("feats,shape",
                          [("spectrogram-log-cmvn-aug-ipd", [1, 366, 257 * 5]),
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+# Copyright 2020 Jian Wu
+# License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+import time
+import argparse
+
+import torch as th
+
+from aps.transform.utils import STFT, iSTFT
+
+
+def benchmark(layer, inp, num_repeats, **kwargs):
+    """
+    Return average time cost (ms) of the layer
+    """
+    with th.no_grad():
+        # warm up
+        out = layer(inp, **kwargs)
+        start = time.time()
+        for _ in range(num_repeats):
+            layer(inp, **kwargs)
+    return out, (time.time() - start) * 1000 / num_repeats
+
+
+def run(args):
+    th.set_num_threads(args.num_threads)
+    wav = th.rand(args.batch_size, int(args.duration * args.sr))
+    print(f"{'frame_len':>10}{'frame_hop':>10}{'func':>8}{'conv':>10}" +
+          f"{'fft':>10}{'speedup':>10}{'max_diff':>10}",
+          flush=True)
+    for frame_len in args.frame_len:
+        frame_hop = frame_len // 4 if args.frame_hop <= 0 else args.frame_hop
+        stft_kwargs = {
+            "window": args.window,
+            "round_pow_of_two": args.round_pow_of_two,
+            "center": args.center
+        }
+        stats = []
+        for func in ["stft", "istft"]:
+            result = []
+            for backend in ["conv", "fft"]:
+                if func == "stft":
+                    layer = STFT(frame_len,
+                                 frame_hop,
+                                 backend=backend,
+                                 **stft_kwargs)
+                    out, cost = benchmark(layer,
+                                          wav,
+                                          args.num_repeats,
+                                          output="complex")
+                    # used as the input of iSTFT
+                    spectra = out
+                else:
+                    layer = iSTFT(frame_len,
+                                  frame_hop,
+                                  backend=backend,
+                                  **stft_kwargs)
+                    out, cost = benchmark(layer,
+                                          spectra,
+                                          args.num_repeats,
+                                          input="complex")
+                    out = (out,)
+                result.append((out, cost))
+            (ref, conv_cost), (out, fft_cost) = result
+            diff = max([th.max(th.abs(r - o)).item() for r, o in zip(ref, out)])
+            stats.append(f"{frame_len:>10d}{frame_hop:>10d}{func:>8}" +
+                         f"{conv_cost:>10.2f}{fft_cost:>10.2f}" +
+                         f"{conv_cost / fft_cost:>10.2f}{diff:>10.2e}")
+        print("\n".join(stats), flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Command to benchmark the (i)STFT layers on CPU "
+        "(DFT kernel vs FFT backend), time cost reported in ms",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--frame-len",
+                        type=int,
+                        nargs="+",
+                        default=[256, 400, 512, 1024, 2048],
+                        help="Frame length to benchmark")
+    parser.add_argument("--frame-hop",
+                        type=int,
+                        default=-1,
+                        help="Frame hop, frame_len // 4 if <= 0")
+    parser.add_argument("--window",
+                        type=str,
+                        default="hann",
+                        help="Window function")
+    parser.add_argument("--center",
+                        action="store_true",
+                        help="Center flag of the (i)STFT")
+    parser.add_argument("--round-pow-of-two",
+                        action="store_true",
+                        help="Round FFT size to power of two")
+    parser.add_argument("--batch-size",
+                        type=int,
+                        default=8,
+                        help="Number of the utterances")
+    parser.add_argument("--duration",
+                        type=float,
+                        default=4,
+                        help="Duration (in seconds) of the utterances")
+    parser.add_argument("--sr", type=int, default=16000, help="Sample rate")
+    parser.add_argument("--num-repeats",
+                        type=int,
+                        default=10,
+                        help="Number of the repeats")
+    parser.add_argument("--num-threads",
+                        type=int,
+                        default=1,
+                        help="Number of the threads used by PyTorch")
+    args = parser.parse_args()
+    run(args)
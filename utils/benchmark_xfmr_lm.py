@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+# Copyright 2020 Jian Wu
+# License: Apache 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+import time
+import argparse
+
+import torch as th
+
+from aps.libs import aps_asr_nnet
+
+
+def benchmark(xfmr_lm, token, hist_len, num_repeats, cache=False):
+    """
+    Return average time cost (ms) of one LM scoring step at hist_len
+    """
+    with th.no_grad():
+        if cache:
+            # key & value cache of the history tokens
+            _, hidden = xfmr_lm(token[:, :hist_len], None)
+            inp = token[:, hist_len:hist_len + 1]
+        else:
+            hidden = None
+            inp = token[:, :hist_len + 1]
+        # warm up
+        out, _ = xfmr_lm(inp, hidden)
+        start = time.time()
+        for _ in range(num_repeats):
+            xfmr_lm(inp, hidden)
+    return out[:, -1], (time.time() - start) * 1000 / num_repeats
+
+
+def run(args):
+    th.set_num_threads(args.num_threads)
+    nnet_cls = aps_asr_nnet("asr@xfmr_lm")
+    xfmr_lm = nnet_cls(vocab_size=args.vocab_size,
+                       att_dim=args.att_dim,
+                       nhead=args.nhead,
+                       feedforward_dim=args.feedforward_dim,
+                       num_layers=args.num_layers)
+    xfmr_lm.eval()
+    max_len = max(args.hist_len)
+    token = th.randint(0, args.vocab_size, (args.beam_size, max_len + 1))
+    print(f"{'history':>10}{'full':>10}{'cached':>10}" +
+          f"{'speedup':>10}{'max_diff':>10}",
+          flush=True)
+    for hist_len in args.hist_len:
+        ref, full_cost = benchmark(xfmr_lm,
+                                   token,
+                                   hist_len,
+                                   args.num_repeats,
+                                   cache=False)
+        out, step_cost = benchmark(xfmr_lm,
+                                   token,
+                                   hist_len,
+                                   args.num_repeats,
+                                   cache=True)
+        diff = th.max(th.abs(ref - out)).item()
+        print(f"{hist_len:>10d}{full_cost:>10.2f}{step_cost:>10.2f}" +
+              f"{full_cost / step_cost:>10.2f}{diff:>10.2e}",
+              flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Command to benchmark the Transformer LM scoring on CPU "
+        "(full re-computation vs key/value cache), time cost of one step "
+        "reported in ms",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--hist-len",
+                        type=int,
+                        nargs="+",
+                        default=[50, 100, 200, 400],
+                        help="Number of the history tokens to benchmark")
+    parser.add_argument("--beam-size",
+                        type=int,
+                        default=8,
+                        help="Beam size (batch size of the LM)")
+    parser.add_argument("--vocab-size",
+                        type=int,
+                        default=5000,
+                        help="Vocabulary size of the LM")
+    parser.add_argument("--att-dim",
+                        type=int,
+                        default=512,
+                        help="Attention dimension of the LM")
+    parser.add_argument("--nhead",
+                        type=int,
+                        default=8,
+                        help="Number of the attention heads")
+    parser.add_argument("--feedforward-dim",
+                        type=int,
+                        default=2048,
+                        help="Dimension of the feedforward layers")
+    parser.add_argument("--num-layers",
+                        type=int,
+                        default=6,
+                        help="Number of the transformer layers")
+    parser.add_argument("--num-repeats",
+                        type=int,
+                        default=10,
+                        help="Number of the repeats")
+    parser.add_argument("--num-threads",
+                        type=int,
+                        default=1,
+                        help="Number of the threads used by PyTorch")
+    args = parser.parse_args()
+    run(args)
@@ -26,6 +26,8 @@ def run(args):
     done, total = 0, 0
     utt2dur = ext_open(args.utt2dur, "w")
     wav_scp = ext_open(args.wav_scp, "r")
+    # opened ark files
+    wav_ark = {}
     for raw_line in wav_scp:
         total += 1
         line = raw_line.strip()
@@ -42,16 +44,25 @@ def run(args):
                 raise RuntimeError(
                     f"Running command: \"{cmd}\" failed: {stderr}")
             wav_io = io.BytesIO(stdout)
-            data, sr = sf.read(wav_io, dtype="int16")
-            dur = data.shape[0]
+            info = sf.info(wav_io)
             if args.output == "time":
-                dur = float(dur) / sr
+                dur = info.duration
+            else:
+                dur = info.frames
         else:
             if len(toks) != 2:
                 warnings.warn(f"Line format error: {line}")
                 continue
             key, path = toks
-            info = sf.info(path)
+            # for ark:offset, parse the header at the offset
+            if ":" in path:
+                path, offset = path.split(":")
+                if path not in wav_ark:
+                    wav_ark[path] = open(path, "rb")
+                wav_ark[path].seek(int(offset))
+                info = sf.info(wav_ark[path])
+            else:
+                info = sf.info(path)
             if args.output == "time":
                 dur = info.duration
             else:
@@ -67,6 +78,8 @@ def run(args):
         utt2dur.close()
     if args.wav_scp != "-":
         wav_scp.close()
+    for ark in wav_ark.values():
+        ark.close()
     print(f"Processed {done} utterances done, total {total}")
 
 